@@ -0,0 +1,69 @@
+import os
+
+
+LOAN_LIMIT = int(os.getenv('LOAN_LIMIT', '0'))
+
+
+class UserAccount:
+    """One user's active loans and unpaid fines, kept up to date as records change.
+
+    Reading an account costs O(the user's own items) instead of a scan of
+    every borrow record. ``track`` is called whenever a record is created or
+    its returned/fine state changes; ``untrack`` when it is deleted.
+    """
+
+    def __init__(self, user_id, loan_limit=None):
+        self.user_id = user_id
+        # 0 = unlimited
+        self.loan_limit = LOAN_LIMIT if loan_limit is None else loan_limit
+        self.loans = {}
+        self.fines = {}
+
+    def track(self, record):
+        if record.returned:
+            self.loans.pop(record.record_id, None)
+        else:
+            self.loans[record.record_id] = record
+        if record.fine_amount > 0 and not record.fine_paid:
+            self.fines[record.record_id] = record
+        else:
+            self.fines.pop(record.record_id, None)
+
+    def untrack(self, record):
+        self.loans.pop(record.record_id, None)
+        self.fines.pop(record.record_id, None)
+
+    @property
+    def active_loans(self):
+        return list(self.loans.values())
+
+    @property
+    def unpaid_fines(self):
+        return list(self.fines.values())
+
+    @property
+    def fine_total(self):
+        return sum(record.fine_amount for record in self.fines.values())
+
+    @property
+    def loan_headroom(self):
+        """Loans the user may still take out, or None when there is no limit"""
+        if not self.loan_limit:
+            return None
+        return max(0, self.loan_limit - len(self.loans))
+
+    def can_borrow(self):
+        return not self.loan_limit or len(self.loans) < self.loan_limit
+
+    def has_loan(self, book_id):
+        return any(record.book_id == book_id for record in self.loans.values())
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'active_loans': len(self.loans),
+            'loan_limit': self.loan_limit,
+            'loan_headroom': self.loan_headroom,
+            'fine_total': self.fine_total,
+            'unpaid_fines': len(self.fines)
+        }
@@ -0,0 +1,146 @@
+import bisect
+import threading
+from datetime import date
+
+
+def loan_days(borrow_date, return_date):
+    """Whole days between borrow and return dates"""
+    return max(0, (date.fromisoformat(return_date) - date.fromisoformat(borrow_date)).days)
+
+
+class CirculationRollups:
+    """Daily circulation counters, updated as loans are made and returned.
+
+    One bucket per calendar day holds checkouts, returns and loan days, in
+    total and per book and per user. Buckets are kept in date order, so a
+    date-range query only visits the days in the range and never the raw
+    borrow history. Mongo mode keeps one document per day, updates it with
+    ``$inc`` so several web workers can count into the same day, and answers
+    range queries from the collection so every worker sees every count;
+    nothing is held in memory.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.days = {}
+        self._dates = []
+        self._lock = threading.Lock()
+        if collection is not None:
+            # Range queries filter on date
+            collection.create_index('date', unique=True)
+
+    # -- persistence ---------------------------------------------------
+
+    def load(self, buckets):
+        with self._lock:
+            self.days = {}
+            for bucket in buckets:
+                bucket = {k: v for k, v in bucket.items() if k != '_id'}
+                self.days[bucket['date']] = bucket
+            self._dates = sorted(self.days)
+
+    def to_list(self):
+        with self._lock:
+            return [self.days[d] for d in self._dates]
+
+    def empty(self):
+        if self.collection is not None:
+            return self.collection.estimated_document_count() == 0
+        return not self.days
+
+    def rebuild(self, records):
+        """Backfill from borrow records (one-off, for data saved before rollups existed)"""
+        with self._lock:
+            self.days, self._dates = {}, []
+            for record in records:
+                self._tally(record.borrow_date, record.user_id, record.book_id, 'checkouts')
+                if record.returned and record.return_date:
+                    self._tally(record.return_date, record.user_id, record.book_id, 'returns',
+                                loan_days(record.borrow_date, record.return_date))
+            if self.collection is None:
+                return
+            buckets = [self.days[d] for d in self._dates]
+            self.days, self._dates = {}, []
+        # Counted in memory, then written in one bulk insert
+        self.collection.delete_many({})
+        if buckets:
+            self.collection.insert_many(buckets, ordered=False)
+
+    def _bucket(self, day):
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = {'date': day, 'checkouts': 0, 'returns': 0, 'loan_days': 0,
+                                       'books': {}, 'users': {}}
+            bisect.insort(self._dates, day)
+        return bucket
+
+    def _tally(self, day, user_id, book_id, field, loan_days=0):
+        bucket = self._bucket(day)
+        bucket[field] += 1
+        bucket['loan_days'] += loan_days
+        for key, item_id in (('books', book_id), ('users', user_id)):
+            counts = bucket[key].setdefault(item_id, {'checkouts': 0, 'returns': 0, 'loan_days': 0})
+            counts[field] += 1
+            counts['loan_days'] += loan_days
+
+    def _count(self, day, user_id, book_id, field, loan_days=0):
+        if self.collection is None:
+            with self._lock:
+                self._tally(day, user_id, book_id, field, loan_days)
+            return
+        inc = {field: 1, 'loan_days': loan_days}
+        for key, item_id in (('books', book_id), ('users', user_id)):
+            inc[f'{key}.{item_id}.{field}'] = 1
+            inc[f'{key}.{item_id}.loan_days'] = loan_days
+        self.collection.update_one({'date': day}, {'$inc': inc}, upsert=True)
+
+    def record_checkout(self, day, user_id, book_id):
+        self._count(day, user_id, book_id, 'checkouts')
+
+    def record_return(self, day, user_id, book_id, loan_days):
+        self._count(day, user_id, book_id, 'returns', loan_days)
+
+    # -- queries -------------------------------------------------------
+
+    def _range(self, start, end, fields=None):
+        """Buckets with start <= date <= end; ``fields`` limits what Mongo sends back"""
+        if self.collection is not None:
+            projection = dict.fromkeys(fields, 1) if fields else {}
+            projection.update({'_id': 0, 'date': 1})
+            return list(self.collection.find({'date': {'$gte': start, '$lte': end}}, projection).sort('date', 1))
+        with self._lock:
+            lo = bisect.bisect_left(self._dates, start)
+            hi = bisect.bisect_right(self._dates, end)
+            return [self.days[d] for d in self._dates[lo:hi]]
+
+    def daily(self, start, end):
+        return [{
+            'date': b['date'],
+            'checkouts': b.get('checkouts', 0),
+            'returns': b.get('returns', 0),
+            'average_loan_days': round(b['loan_days'] / b['returns'], 2) if b.get('returns') else None
+        } for b in self._range(start, end, ('checkouts', 'returns', 'loan_days'))]
+
+    def totals_by(self, key, start, end):
+        """{book_id or user_id: {checkouts, returns, loan_days}} summed over the range"""
+        totals = {}
+        for bucket in self._range(start, end, (key,)):
+            for item_id, counts in bucket.get(key, {}).items():
+                total = totals.setdefault(item_id, {'checkouts': 0, 'returns': 0, 'loan_days': 0})
+                for field in ('checkouts', 'returns', 'loan_days'):
+                    total[field] += counts[field]
+        return totals
+
+    def summary(self, start, end):
+        buckets = self._range(start, end, ('checkouts', 'returns', 'loan_days'))
+        checkouts = sum(b.get('checkouts', 0) for b in buckets)
+        returns = sum(b.get('returns', 0) for b in buckets)
+        loan_days = sum(b.get('loan_days', 0) for b in buckets)
+        return {
+            'start': start,
+            'end': end,
+            'checkouts': checkouts,
+            'returns': returns,
+            'average_loan_days': round(loan_days / returns, 2) if returns else None,
+            'active_days': len(buckets)
+        }
@@ -1,24 +1,78 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, Response, abort, g, render_template, request, jsonify, redirect, url_for, flash, send_file
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from library import Library
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from email_service import EmailService
+from password_service import PasswordServiceBusy
+from log_config import setup_logging
+import metrics
+import threading
+import time
+from profiling import ProfilingMiddleware, profiler
+from memory_stats import MemoryTracker
+from notification_scheduler import SweepScheduler
 
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
+setup_logging()
 
 app = Flask(__name__)
 # Secret key for sessions (should be set in .env for production)
 app.secret_key = os.getenv('FLASK_SECRET', 'dev-secret')
 
+# Per-request profiling is opt-in; without PROFILE_ENABLED the middleware is never installed
+if profiler.enabled:
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, profiler, app.url_map)
+
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
 
 library = Library()
+library.outbox.start()
+# The co-borrowing matrix is built off the request path; pages show no suggestions until it is ready
+threading.Thread(target=library.build_recommendations, name='recommender-build', daemon=True).start()
+# Nightly fines, hold expiry, notification sweep and archival against the live library.
+# With several web workers enable it in exactly one of them
+if os.getenv('NOTIFY_IN_PROCESS', 'true').lower() in ('1', 'true', 'yes', 'on'):
+    SweepScheduler(library, os.getenv('NOTIFY_CRON', '0 8 * * *')).start()
+# Memory accounting for /api/memory; samples in the background when MEMORY_SAMPLE_SECONDS is set
+memory = MemoryTracker(library.memory_structures)
+memory.start()
+metrics.REGISTRY.register_collector(lambda: metrics.cache_metrics({
+    name: stats for name, stats in library.cache_stats().items() if isinstance(stats, dict)
+}))
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_latency(exc):
+    # Teardown also runs when a view raised, so failed requests are timed too
+    started = g.get('request_started')
+    if started is not None:
+        status = 500 if exc is not None else g.get('response_status', 500)
+        # The URL rule keeps label cardinality bounded (no ids or query strings)
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.http_request_seconds.observe(time.perf_counter() - started, route, request.method, str(status))
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Latency histograms, persistence, SMTP, cache and lock metrics in Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 # Landing page: choose role
 @app.route('/landing')
@@ -29,8 +83,8 @@ def landing():
 def librarian_portal():
     # Show original public dashboard
     stats = {
-        'total_books': len(library.get_all_books()),
-        'total_users': len(library.get_all_users()),
+        'total_books': len(library.books),
+        'total_users': len(library.users),
         'overdue_books': len(library.get_overdue_books())
     }
     return render_template('index.html', stats=stats)
@@ -60,7 +114,14 @@ def books():
         books_list = library.search_books(search_query)
     else:
         books_list = library.get_all_books()
-    return render_template('books.html', books=books_list, search_query=search_query)
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = int(os.getenv('BOOKS_PAGE_SIZE', '100'))
+    has_next = page * per_page < len(books_list)
+    books_list = books_list[(page - 1) * per_page:page * per_page]
+    # Only the titles on this page get suggestions
+    recommendations = {book.book_id: library.get_recommendations(book.book_id, limit=3) for book in books_list}
+    return render_template('books.html', books=books_list, search_query=search_query,
+                           recommendations=recommendations, page=page, has_next=has_next)
 
 @app.context_processor
 def inject_library():
@@ -101,7 +162,12 @@ def login_student():
         email = request.form.get('email')
         password = request.form.get('password')
         user = library.get_user_by_email(email)
-        if user and user.check_password(password) and user.role in ['user', 'student']:
+        try:
+            valid = user is not None and library.verify_user_password(user, password)
+        except PasswordServiceBusy:
+            flash('The server is busy, please try again in a moment', 'warning')
+            return render_template('login_student.html'), 503
+        if valid and user.role in ['user', 'student']:
             login_user(user)
             flash('Logged in as Student', 'success')
             return redirect(url_for('student_dashboard'))
@@ -129,7 +195,11 @@ def register_student():
             if existing_user:
                 flash('Email already registered', 'danger')
             else:
-                library.add_user_with_password(name, email, phone, password, role='student')
+                try:
+                    library.add_user_with_password(name, email, phone, password, role='student')
+                except PasswordServiceBusy:
+                    flash('The server is busy, please try again in a moment', 'warning')
+                    return render_template('register_student.html'), 503
                 flash('Registration successful! Please login', 'success')
                 return redirect(url_for('login_student'))
     
@@ -152,12 +222,17 @@ def student_dashboard():
     
     borrowed_books = library.get_user_borrowed_books(current_user.user_id)
     total_fine = library.get_user_fines(current_user.user_id)
-    available_books = [book for book in library.get_all_books() if book.available > 0]
+    account = library.get_account(current_user.user_id)
+    available_books = library.get_available_books(limit=5)
     
     return render_template('student_dashboard.html', 
                          borrowed_books=borrowed_books,
                          total_fine=total_fine,
-                         available_books=available_books)
+                         account=account,
+                         holds=library.get_user_holds(current_user.user_id),
+                         recommended_books=library.get_user_recommendations(current_user.user_id),
+                         available_books=available_books,
+                         available_count=library.count_available_books())
 
 
 @app.route('/logout')
@@ -254,8 +329,12 @@ def borrow_book():
         # Librarians can see all users
         users_list = library.get_all_users()
     
-    books_list = [book for book in library.get_all_books() if book.available > 0]
-    return render_template('borrow.html', users=users_list, books=books_list)
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = int(os.getenv('AVAILABLE_PAGE_SIZE', '100'))
+    books_list = library.get_available_books((page - 1) * per_page, per_page)
+    total = library.count_available_books()
+    return render_template('borrow.html', users=users_list, books=books_list,
+                           page=page, has_next=page * per_page < total)
 
 @app.route('/return', methods=['POST'])
 def return_book():
@@ -265,6 +344,40 @@ def return_book():
     success, message = library.return_book(user_id, book_id)
     return jsonify({'success': success, 'message': message})
 
+@app.route('/holds', methods=['POST'])
+@login_required
+def place_hold():
+    user_id = request.form.get('user_id') or current_user.user_id
+    book_id = request.form.get('book_id')
+    
+    # Students can only hold books for themselves
+    if current_user.role in ['user', 'student'] and user_id != current_user.user_id:
+        return jsonify({'success': False, 'message': 'You can only place holds for yourself'}), 403
+    
+    success, message, hold = library.place_hold(user_id, book_id)
+    if not success:
+        return jsonify({'success': False, 'message': message}), 400
+    return jsonify({'success': True, 'message': message, 'hold_id': hold['hold_id'],
+                    'position': library.holds.position(hold)})
+
+@app.route('/holds/<hold_id>/cancel', methods=['POST'])
+@login_required
+def cancel_hold(hold_id):
+    hold = library.holds.get(hold_id)
+    if not hold:
+        return jsonify({'success': False, 'message': 'Hold not found'}), 404
+    if current_user.role in ['user', 'student'] and hold['user_id'] != current_user.user_id:
+        return jsonify({'success': False, 'message': 'You can only cancel your own holds'}), 403
+    library.cancel_hold(hold_id)
+    return jsonify({'success': True, 'message': 'Hold cancelled'})
+
+@app.route('/api/users/<user_id>/holds')
+@login_required
+def api_user_holds(user_id):
+    if current_user.role in ['user', 'student'] and user_id != current_user.user_id:
+        return jsonify({'success': False, 'message': 'Not allowed'}), 403
+    return jsonify(library.get_user_holds(user_id))
+
 @app.route('/api/books')
 def api_books():
     books = library.get_all_books()
@@ -292,27 +405,106 @@ def api_overdue():
 def api_health():
     return jsonify({
         'status': 'healthy',
-        'books_count': len(library.get_all_books()),
-        'users_count': len(library.get_all_users()),
+        'books_count': len(library.books),
+        'users_count': len(library.users),
         'timestamp': datetime.now().isoformat()
     })
 
 @app.route('/api/stats')
 def api_stats():
-    total_books = len(library.get_all_books())
-    total_users = len(library.get_all_users())
-    overdue_books = len(library.get_overdue_books())
+    return jsonify(library.get_stats())
+
+@app.route('/api/memory')
+@require_role('admin')
+def api_memory():
+    """Object counts and estimated bytes per structure, process RSS and growth (?history=1 for samples)"""
+    # Growth comes from the periodic samples only, not from how often this is polled
+    report = memory.measure()
+    report['borrowed_books'] = library.borrowed_books_stats()
+    report['growth'] = memory.growth()
+    if request.args.get('history'):
+        report['history'] = list(memory.history)
+    return jsonify(report)
+
+@app.route('/api/memory/tracemalloc', methods=['GET', 'POST'])
+@require_role('admin')
+def api_tracemalloc():
+    """POST action=start|stop controls tracing; GET returns allocation diffs since start (?reset=1 moves the baseline)"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or request.form
+        action = data.get('action')
+        if action == 'start':
+            try:
+                frames = int(data.get('frames', 1))
+            except (TypeError, ValueError):
+                frames = 0
+            if not 1 <= frames <= 100:
+                return jsonify({'success': False, 'message': 'frames must be a number from 1 to 100'}), 400
+            memory.start_tracing(frames=frames)
+        elif action == 'stop':
+            memory.stop_tracing()
+        else:
+            return jsonify({'success': False, 'message': 'action must be start or stop'}), 400
+        return jsonify({'success': True, 'message': 'Tracing started' if action == 'start' else 'Tracing stopped'})
+
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        group_by = 'lineno'
+    diff = memory.trace_diff(limit=request.args.get('limit', 20, type=int), group_by=group_by,
+                             reset=bool(request.args.get('reset')))
+    if diff is None:
+        return jsonify({'success': False, 'message': 'tracemalloc is not running, POST action=start first'}), 409
+    return jsonify(diff)
+
+@app.route('/api/cache')
+def api_cache():
+    """Cache sizes and hit/miss counters (book/user LRU in lazy Mongo mode)"""
+    return jsonify(library.cache_stats())
+
+def _analytics_range():
+    """(start, end) ISO dates from ?start=&end=, defaulting to the last 30 days"""
+    today = datetime.now().date()
+    end = request.args.get('end') or today.isoformat()
+    start = request.args.get('start') or (datetime.fromisoformat(end).date() - timedelta(days=29)).isoformat()
+    # Validate; raises ValueError for anything but YYYY-MM-DD
+    if datetime.fromisoformat(start) > datetime.fromisoformat(end):
+        raise ValueError('start is after end')
+    return start, end
+
+@app.route('/api/analytics/<report>')
+def api_analytics(report):
+    try:
+        start, end = _analytics_range()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+    limit = request.args.get('limit', 10, type=int)
     
-    # Calculate available books
-    available_books = sum(1 for book in library.get_all_books() if book.available > 0)
-    
-    return jsonify({
-        'total_books': total_books,
-        'total_users': total_users,
-        'overdue_books': overdue_books,
-        'available_books': available_books,
-        'borrowed_books': total_books - available_books
-    })
+    if report == 'summary':
+        return jsonify(library.get_circulation_summary(start, end))
+    if report == 'daily':
+        return jsonify({'start': start, 'end': end, 'days': library.analytics.daily(start, end)})
+    if report == 'books':
+        return jsonify({'start': start, 'end': end, 'books': library.get_book_analytics(start, end, limit)})
+    if report == 'users':
+        return jsonify({'start': start, 'end': end, 'users': library.get_user_analytics(start, end, limit)})
+    return jsonify({'error': f'Unknown report: {report}'}), 404
+
+@app.route('/api/users/<user_id>/history')
+def api_user_history(user_id):
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify(library.get_borrow_history(user_id=user_id, limit=limit))
+
+@app.route('/api/books/<book_id>/history')
+def api_book_history(book_id):
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify(library.get_borrow_history(book_id=book_id, limit=limit))
+
+@app.route('/api/events')
+def api_events():
+    """Server-Sent Events stream of stat and availability deltas"""
+    stream = library.events.stream(initial=[('stats', library.get_stats())])
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
     
 @app.route('/admin/send-notifications', methods=['GET', 'POST'])
 def send_notifications():
@@ -324,11 +516,8 @@ def send_notifications():
         
         try:
             if test_mode:
-                overdue_count = len([r for r in library.borrow_records 
-                                   if not r.returned and r.due_date < datetime.now().strftime('%Y-%m-%d')])
-                reminder_count = len([r for r in library.borrow_records 
-                                    if not r.returned and 
-                                    (datetime.strptime(r.due_date, '%Y-%m-%d').date() - datetime.now().date()).days <= 3])
+                overdue_count = len(library.get_overdue_books())
+                reminder_count = len(library.get_due_soon_books())
                 
                 return jsonify({
                     'success': True,
@@ -340,24 +529,22 @@ def send_notifications():
                     }
                 })
             else:
-                results = library.check_and_send_overdue_notifications(
-                    send_overdue=send_overdue,
-                    send_reminders=send_reminders
+                # Sweep runs in the background; the client polls the job for progress
+                job = library.notifier.submit(
+                    lambda job: library.check_and_send_overdue_notifications(
+                        send_overdue=send_overdue,
+                        send_reminders=send_reminders,
+                        job=job
+                    )
                 )
-                
-                total_notifications = results['overdue_notifications'] + results['reminder_notifications']
-                
-                if total_notifications > 0:
-                    message = f"Successfully sent {total_notifications} notifications"
-                else:
-                    message = "No notifications were sent based on your selection"
                     
                 return jsonify({
                     'success': True,
                     'test_mode': False,
-                    'message': message,
-                    'results': results
-                })
+                    'message': 'Notification sweep started',
+                    'job_id': job.job_id,
+                    'status_url': url_for('notification_job', job_id=job.job_id)
+                }), 202
                 
         except Exception as e:
             return jsonify({
@@ -367,30 +554,13 @@ def send_notifications():
             })
     
     overdue_books = library.get_overdue_books()
-    reminder_books = []
-    
-    for record in library.borrow_records:
-        if not record.returned:
-            try:
-                days_until_due = (datetime.strptime(record.due_date, '%Y-%m-%d').date() - datetime.now().date()).days
-                if 0 <= days_until_due <= 3:
-                    book = library.get_book(record.book_id)
-                    user = library.get_user(record.user_id)
-                    if book and user:
-                        reminder_books.append({
-                            'book': book,
-                            'user': user,
-                            'due_date': record.due_date,
-                            'days_until_due': days_until_due
-                        })
-            except:
-                pass
+    reminder_books = library.get_due_soon_books()
     
     stats = {
         'overdue_count': len(overdue_books),
         'reminder_count': len(reminder_books),
-        'total_users': len(library.get_all_users()),
-        'total_books': len(library.get_all_books())
+        'total_users': len(library.users),
+        'total_books': len(library.books)
     }
     
     return render_template('notifications.html', 
@@ -398,14 +568,62 @@ def send_notifications():
                          overdue_books=overdue_books,
                          reminder_books=reminder_books)
 
+@app.route('/admin/notification-jobs/<job_id>')
+def notification_job(job_id):
+    """Progress of a background notification sweep"""
+    job = library.notifier.get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    include_results = request.args.get('results') == '1'
+    return jsonify(job.to_dict(include_results=include_results))
+
+@app.route('/api/outbox')
+def api_outbox():
+    """Outbox depth and dead-lettered messages"""
+    return jsonify({
+        'counts': library.outbox.stats(),
+        'dead_letters': library.outbox.dead_letters()
+    })
+
+@app.route('/admin/profiles')
+@require_role('admin')
+def profiles():
+    """Recent request profiles"""
+    if not profiler.enabled:
+        abort(404)
+    return render_template('profiles.html', profiles=profiler.recent(), keep=profiler.keep,
+                           directory=profiler.directory)
+
+@app.route('/admin/profiles/<profile_id>')
+@require_role('admin')
+def profile_report(profile_id):
+    """pstats listing of one profile (?sort=tottime), or the raw .prof file with ?download=1"""
+    if not profiler.enabled:
+        abort(404)
+    if request.args.get('download'):
+        path = profiler.path_for(profile_id)
+        if path is None:
+            abort(404)
+        return send_file(os.path.abspath(path), as_attachment=True, download_name=profile_id + '.prof')
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls', 'ncalls'):
+        sort = 'cumulative'
+    report = profiler.report(profile_id, sort=sort)
+    if report is None:
+        abort(404)
+    return Response(report, mimetype='text/plain')
+
+@app.route('/admin/outbox/retry', methods=['POST'])
+def retry_outbox():
+    """Requeue dead-lettered emails"""
+    count = library.outbox.retry_dead()
+    return jsonify({'success': True, 'message': f'Requeued {count} message(s)'})
+
 @app.route('/admin/notification-preview')
 def notification_preview():
     """Preview what notifications would be sent"""
-    overdue_count = len([r for r in library.borrow_records 
-                       if not r.returned and r.due_date < datetime.now().strftime('%Y-%m-%d')])
-    reminder_count = len([r for r in library.borrow_records 
-                        if not r.returned and 
-                        (datetime.strptime(r.due_date, '%Y-%m-%d').date() - datetime.now().date()).days <= 3])
+    overdue_count = len(library.get_overdue_books())
+    reminder_count = len(library.get_due_soon_books())
     
     return jsonify({
         'overdue_count': overdue_count,
@@ -421,18 +639,7 @@ def user_fines(user_id):
         return "User not found", 404
     
     total_fine = library.get_user_fines(user_id)
-    
-    fine_details = []
-    for record in library.borrow_records:
-        if record.user_id == user_id and record.fine_amount > 0 and not record.fine_paid:
-            book = library.get_book(record.book_id)
-            if book:
-                fine_details.append({
-                    'book_title': book.title,
-                    'fine_amount': record.fine_amount,
-                    'due_date': record.due_date,
-                    'returned': record.returned
-                })
+    fine_details = library.get_user_fine_details(user_id)
     
     return render_template('user_fines.html', 
                          user=user, 
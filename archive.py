@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+
+
+class RecordArchive:
+    """Append-only cold storage for settled borrow records.
+
+    JSON mode appends one record per line to ``path``; Mongo mode inserts into
+    ``collection`` (indexed on user_id and book_id). Archived records are never
+    loaded with the working set. For file archives the user/book index maps
+    ids to byte offsets; it is built on the first history query and then kept
+    up to date by ``append``, so startup never reads the archive.
+    """
+
+    def __init__(self, path, collection=None):
+        self.path = path
+        self.collection = collection
+        self.by_user = None
+        self.by_book = None
+        self._lock = threading.Lock()
+        if collection is not None:
+            collection.create_index('user_id')
+            collection.create_index('book_id')
+
+    def _index_line(self, offset, data):
+        self.by_user.setdefault(data['user_id'], []).append(offset)
+        self.by_book.setdefault(data['book_id'], []).append(offset)
+
+    def _ensure_index(self):
+        if self.by_user is not None:
+            return
+        self.by_user, self.by_book = {}, {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    self._index_line(offset, json.loads(line))
+                offset += len(line)
+
+    def append(self, records):
+        """Write records (dicts) to the archive; returns how many were written"""
+        records = list(records)
+        if not records:
+            return 0
+        if self.collection is not None:
+            self.collection.insert_many([dict(r) for r in records])
+            return len(records)
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                for record in records:
+                    line = (json.dumps(record) + '\n').encode()
+                    f.write(line)
+                    if self.by_user is not None:
+                        self._index_line(offset, record)
+                    offset += len(line)
+        return len(records)
+
+    def history(self, user_id=None, book_id=None, limit=100):
+        """Archived records of a user or a book, most recent first"""
+        field, value = ('user_id', user_id) if user_id is not None else ('book_id', book_id)
+        if self.collection is not None:
+            cursor = self.collection.find({field: value}).sort('borrow_date', -1).limit(limit or 0)
+            return [{k: v for k, v in doc.items() if k != '_id'} for doc in cursor]
+        with self._lock:
+            self._ensure_index()
+            index = self.by_user if field == 'user_id' else self.by_book
+            offsets = index.get(value, [])[-limit:] if limit else index.get(value, [])
+        if not offsets:
+            return []
+        records = []
+        with open(self.path, 'rb') as f:
+            for offset in reversed(offsets):
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def iter_loans(self):
+        """(user_id, book_id) of every archived loan, in archive order"""
+        if self.collection is not None:
+            for doc in self.collection.find({}, {'user_id': 1, 'book_id': 1, '_id': 0}):
+                yield doc['user_id'], doc['book_id']
+            return
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    data = json.loads(line)
+                    yield data['user_id'], data['book_id']
+
+    def count(self):
+        if self.collection is not None:
+            return self.collection.estimated_document_count()
+        with self._lock:
+            self._ensure_index()
+            return sum(len(offsets) for offsets in self.by_user.values())
@@ -0,0 +1,62 @@
+import bisect
+
+
+class AvailabilityIndex:
+    """Books with at least one copy on the shelf, kept in title order.
+
+    ``update`` is called whenever a book's availability or title may have
+    changed and only touches the index when the book crosses zero (or is
+    retitled), so listing or paging available titles never visits books that
+    are fully borrowed. A disabled index (lazy Mongo mode, where the database
+    answers these queries) ignores every call.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._keys = []
+        self._books = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, book_id):
+        return book_id in self._books
+
+    @staticmethod
+    def _key(book):
+        return (book.title.lower(), book.book_id)
+
+    def update(self, book):
+        if not self.enabled:
+            return
+        indexed = self._books.get(book.book_id)
+        if book.available > 0:
+            key = self._key(book)
+            if indexed is not None:
+                if indexed[0] == key:
+                    return
+                self._discard(indexed[0])
+            bisect.insort(self._keys, key)
+            self._books[book.book_id] = (key, book)
+        elif indexed is not None:
+            self.remove(book.book_id)
+
+    def remove(self, book_id):
+        indexed = self._books.pop(book_id, None)
+        if indexed is not None:
+            self._discard(indexed[0])
+
+    def _discard(self, key):
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def page(self, offset=0, limit=None):
+        end = None if limit is None else offset + limit
+        return [self._books[book_id][1] for _, book_id in self._keys[offset:end]]
+
+    def rebuild(self, books):
+        if not self.enabled:
+            return
+        self._books = {book.book_id: (self._key(book), book) for book in books if book.available > 0}
+        self._keys = sorted(key for key, _ in self._books.values())
@@ -0,0 +1,218 @@
+"""Micro-benchmarks for the core Library operations across sizes and backends.
+
+For every dataset size (number of books; users and loans scale with it) a
+library is generated with generate_dataset.py's seeded generator and each
+operation is timed: load_data, save_data, add_book, search_books,
+borrow_book, return_book, get_overdue_books and get_user_fines. Backends are
+"json", "mongo" (a local mongod, eager load) and "mongo-lazy" (MONGO_LAZY
+working set); each runs in its own process because the library binds its
+storage at import time.
+
+One JSON line is printed per (backend, size, operation), plus a "scaling"
+line per operation with the log-log slope of median latency against size:
+about 0 means constant time, about 1 means the operation scans everything.
+--baseline compares against a previous --output file and exits non-zero when
+an operation's median got slower by more than --threshold.
+
+    python benchmarks/bench_library.py --sizes 1000,10000,100000 --output bench.jsonl
+    python benchmarks/bench_library.py --backends json,mongo-lazy --baseline bench.jsonl
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import git_revision, percentile
+
+OPERATIONS = ('load_data', 'save_data', 'add_book', 'search_books', 'borrow_book',
+              'return_book', 'get_overdue_books', 'get_user_fines')
+BACKENDS = ('json', 'mongo', 'mongo-lazy')
+
+
+def timed(func, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run_backend(args):
+    """Benchmark one backend in this process; prints one JSON line per operation"""
+    if args.worker == 'json':
+        os.environ.pop('MONGO_URI', None)
+    else:
+        os.environ['MONGO_URI'] = args.uri
+        os.environ['MONGO_DB'] = args.mongo_db
+    from generate_dataset import DatasetGenerator, write_json, write_mongo
+    from library import Library
+
+    lazy = args.worker == 'mongo-lazy'
+    rng = random.Random(args.seed)
+    for size in (int(s) for s in args.sizes.split(',')):
+        users = max(1, size // 5)
+        generator = DatasetGenerator(size, users, size * args.loans_per_book, seed=args.seed)
+        # Generated data files are large at big sizes; removed once the size is done
+        with tempfile.TemporaryDirectory(prefix='bench_library_') as workdir:
+            data_file = os.path.join(workdir, 'library_data.json')
+            if args.worker == 'json':
+                write_json(generator, data_file, report=lambda line: None)
+            else:
+                from pymongo import MongoClient
+                write_mongo(generator, MongoClient(args.uri)[args.mongo_db], drop=True, report=lambda line: None)
+
+            started = time.perf_counter()
+            library = Library(data_file, lazy=lazy)
+            results = {'load_data': [time.perf_counter() - started]}
+            results['load_data'] += timed(library.load_data, args.write_iterations - 1)
+            results['save_data'] = timed(library.save_data, args.write_iterations)
+
+            words = ['river', 'silent', 'garden of', 'kingdom', 'zzz-no-match']
+            results['search_books'] = timed(lambda: library.search_books(rng.choice(words)), args.iterations)
+            results['get_overdue_books'] = timed(library.get_overdue_books, args.iterations)
+            results['get_user_fines'] = timed(lambda: library.get_user_fines(str(rng.randint(1, users))),
+                                              args.iterations)
+
+            # Pairs that can borrow: shelved titles and users without an open loan of them
+            pairs = []
+            for book in library.get_available_books(0, args.write_iterations * 4):
+                user_id = str(rng.randint(1, users))
+                if not library.get_account(user_id).has_loan(book.book_id):
+                    pairs.append((user_id, book.book_id))
+                if len(pairs) >= args.write_iterations:
+                    break
+            borrows = iter(pairs)
+            results['borrow_book'] = timed(lambda: library.borrow_book(*next(borrows)), len(pairs))
+            returns = iter(pairs)
+            results['return_book'] = timed(lambda: library.return_book(*next(returns)), len(pairs))
+            results['add_book'] = timed(lambda: library.add_book('Benchmark Title', 'Bench Author', '9780000000000'),
+                                        args.write_iterations)
+
+            for operation in OPERATIONS:
+                latencies = sorted(results[operation])
+                print(json.dumps({
+                    'benchmark': 'library',
+                    'backend': args.worker,
+                    'size': size,
+                    'users': users,
+                    'loans': size * args.loans_per_book,
+                    'operation': operation,
+                    'runs': len(latencies),
+                    'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                    'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                    'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+                }), flush=True)
+            library.outbox.stop()
+
+
+def scaling(records):
+    """Least-squares slope of log(p50) over log(size) per backend and operation"""
+    points = {}
+    for r in records:
+        if r['p50_ms'] > 0:
+            points.setdefault((r['backend'], r['operation']), []).append((math.log(r['size']), math.log(r['p50_ms'])))
+    lines = []
+    for (backend, operation), xy in sorted(points.items()):
+        if len(xy) < 2:
+            continue
+        mean_x = sum(x for x, _ in xy) / len(xy)
+        mean_y = sum(y for _, y in xy) / len(xy)
+        var = sum((x - mean_x) ** 2 for x, _ in xy)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in xy) / var if var else 0.0
+        lines.append({'benchmark': 'library-scaling', 'backend': backend, 'operation': operation,
+                      'sizes': len(xy), 'slope': round(slope, 2)})
+    return lines
+
+
+def compare(records, baseline_path, threshold, min_ms=0.05):
+    """Regressions against the most recent baseline result for each (backend, size, operation)"""
+    baseline = {}
+    with open(baseline_path) as f:
+        for line in f:
+            if line.strip():
+                r = json.loads(line)
+                if r.get('benchmark') == 'library':
+                    baseline[(r['backend'], r['size'], r['operation'])] = r
+    regressions = []
+    for r in records:
+        if r['benchmark'] != 'library':
+            continue
+        base = baseline.get((r['backend'], r['size'], r['operation']))
+        # Differences below min_ms are timer noise on sub-millisecond operations
+        if (base and base['p50_ms'] > 0 and r['p50_ms'] > base['p50_ms'] * (1 + threshold)
+                and r['p50_ms'] - base['p50_ms'] >= min_ms):
+            regressions.append(dict(r, baseline_p50_ms=base['p50_ms'],
+                                    ratio=round(r['p50_ms'] / base['p50_ms'], 2)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Library operations across sizes and backends")
+    parser.add_argument('--sizes', default='1000,10000', help="comma-separated book counts")
+    parser.add_argument('--loans-per-book', type=int, default=2)
+    parser.add_argument('--backends', default='json', help=f"comma-separated, from {', '.join(BACKENDS)}")
+    parser.add_argument('--iterations', type=int, default=50, help="runs of each read operation")
+    parser.add_argument('--write-iterations', type=int, default=5, help="runs of each write/load operation")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--mongo-db', default='library_bench', help="scratch database, dropped and refilled")
+    parser.add_argument('--output', help="append results as JSON lines to this file")
+    parser.add_argument('--baseline', help="JSON lines file from an earlier --output run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed median slowdown before flagging")
+    parser.add_argument('--min-ms', type=float, default=0.05, help="ignore slowdowns smaller than this")
+    parser.add_argument('--worker', choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_backend(args)
+        return
+
+    meta = {'timestamp': datetime.now().isoformat(), 'revision': git_revision(),
+            'python': platform.python_version()}
+    records = []
+    for backend in args.backends.split(','):
+        if backend not in BACKENDS:
+            parser.error(f"unknown backend {backend!r}")
+        command = [sys.executable, os.path.abspath(__file__), '--worker', backend]
+        for option in ('sizes', 'loans_per_book', 'iterations', 'write_iterations', 'seed', 'uri', 'mongo_db'):
+            command += ['--' + option.replace('_', '-'), str(getattr(args, option))]
+        worker = subprocess.Popen(command, stdout=subprocess.PIPE, text=True,
+                                  env=dict(os.environ, LOG_LEVEL='WARNING'))
+        for line in worker.stdout:
+            if line.startswith('{"benchmark": "library"'):
+                record = dict(json.loads(line), **meta)
+                records.append(record)
+                print(json.dumps(record), flush=True)
+        if worker.wait():
+            print(f"{backend}: benchmark failed (exit {worker.returncode})", file=sys.stderr)
+
+    for line in scaling(records):
+        records.append(dict(line, **meta))
+        print(json.dumps(records[-1]))
+    if args.output:
+        with open(args.output, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+    if args.baseline:
+        regressions = compare(records, args.baseline, args.threshold, args.min_ms)
+        for r in regressions:
+            print(f"REGRESSION {r['backend']} size={r['size']} {r['operation']}: "
+                  f"{r['baseline_p50_ms']}ms -> {r['p50_ms']}ms ({r['ratio']}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
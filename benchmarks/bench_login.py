@@ -0,0 +1,78 @@
+"""Login throughput under concurrency.
+
+Drives POST /login/student through the Flask test client from N concurrent
+threads and reports logins per second. Run it once with the default pool and
+once with PASSWORD_HASH_WORKERS=0 (inline hashing) to compare:
+
+    python benchmarks/bench_login.py --users 20 --concurrency 8 --logins 200
+    PASSWORD_HASH_WORKERS=0 python benchmarks/bench_login.py ...
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+
+    # Keep the benchmark away from the real data file and database
+    os.environ.pop('MONGO_URI', None)
+    workdir = tempfile.mkdtemp(prefix='bench_login_')
+    os.chdir(workdir)
+
+    import app as app_module
+    from library import Library
+    from password_service import password_service
+
+    library = Library(os.path.join(workdir, 'library_data.json'))
+    app_module.library = library
+    for i in range(args.users):
+        library.add_user_with_password(f'Student {i}', f'student{i}@example.com', '', 'secret', role='student')
+
+    flask_app = app_module.app
+    flask_app.config['TESTING'] = True
+    local = threading.local()
+    status_counts = {}
+    counts_lock = threading.Lock()
+
+    def login(i):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        started = time.perf_counter()
+        resp = client.post('/login/student', data={
+            'email': f'student{i % args.users}@example.com',
+            'password': 'secret',
+        })
+        elapsed = time.perf_counter() - started
+        with counts_lock:
+            status_counts[resp.status_code] = status_counts.get(resp.status_code, 0) + 1
+        client.get('/logout')
+        return elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = sorted(pool.map(login, range(args.logins)))
+    wall = time.perf_counter() - started
+
+    print(f"workers={password_service.workers} concurrency={args.concurrency} logins={args.logins}")
+    print(f"throughput: {args.logins / wall:.1f} logins/s")
+    print(f"latency p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms")
+    print(f"status codes: {status_counts}")
+    password_service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Notification throughput benchmark against a local SMTP sink.
+
+Generates N users with overdue and due-soon loans in a throwaway JSON library,
+points EmailService at an in-process SMTP sink and times
+check_and_send_overdue_notifications end to end. Reports notices and emails
+per second, SMTP connections/logins and per-message latency percentiles. Use
+--output to append one JSON line per run so results can be compared across
+changes.
+
+    python benchmarks/bench_notifications.py --users 500 --loans-per-user 3
+    python benchmarks/bench_notifications.py --users 500 --no-digest --latency-ms 5 --output bench.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import git_revision, percentile
+from smtp_sink import SMTPSink
+
+
+def build_library(data_file, users, loans_per_user, seed):
+    from library import Library, Book, User, BorrowRecord
+
+    rng = random.Random(seed)
+    library = Library(data_file)
+    today = date.today()
+    book_count = max(1, users * loans_per_user // 2)
+    for i in range(1, book_count + 1):
+        library.books[str(i)] = Book(str(i), f'Book {i}', f'Author {i % 97}', f'978{i:010d}', quantity=users)
+    for i in range(1, users + 1):
+        user = User(str(i), f'User {i}', f'user{i}@example.com', '555-0100')
+        library.users[user.user_id] = user
+        for book_id in rng.sample(range(1, book_count + 1), min(loans_per_user, book_count)):
+            # Mix of long-overdue, just-overdue and due-soon loans
+            due = today + timedelta(days=rng.choice([-30, -7, -1, 1, 2, 3]))
+            record = BorrowRecord(user.user_id, str(book_id), (due - timedelta(days=14)).isoformat(), due.isoformat())
+            library.borrow_records.append(record)
+            library.books[str(book_id)].available -= 1
+            user.borrowed_books.append(str(book_id))
+    library._rebuild_indexes()
+    library.save_data()
+    return library
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark notification sweeps against a local SMTP sink")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--loans-per-user', type=int, default=3)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None, help="override NOTIFICATION_WORKERS")
+    parser.add_argument('--no-digest', action='store_true', help="one email per loan")
+    parser.add_argument('--latency-ms', type=float, default=0, help="simulated server time per message")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="append results as JSON lines to this file")
+    args = parser.parse_args()
+
+    with SMTPSink(latency_ms=args.latency_ms) as sink:
+        os.environ.pop('MONGO_URI', None)
+        os.environ.update({
+            'EMAIL_HOST': sink.host,
+            'EMAIL_PORT': str(sink.port),
+            'EMAIL_USERNAME': 'bench',
+            'EMAIL_PASSWORD': 'bench',
+            'EMAIL_FROM': 'library@example.com',
+            'EMAIL_USE_TLS': 'false',
+            'EMAIL_RATE_LIMIT': '0',
+        })
+        if args.workers is not None:
+            os.environ['NOTIFICATION_WORKERS'] = str(args.workers)
+
+        from notifications import NotificationJob
+
+        workdir = tempfile.mkdtemp(prefix='bench_notify_')
+        library = build_library(os.path.join(workdir, 'library_data.json'),
+                                args.users, args.loans_per_user, args.seed)
+
+        for run in range(1, args.runs + 1):
+            library.ledger.load([])  # every run notifies the full set
+            sink.reset()
+            started = time.perf_counter()
+            job = NotificationJob()
+            results = library.check_and_send_overdue_notifications(digest=not args.no_digest, job=job)
+            wall = time.perf_counter() - started
+
+            latencies = sorted(result['seconds'] for result in job.results)
+            notices = results['overdue_notifications'] + results['reminder_notifications']
+            record = {
+                'benchmark': 'notifications',
+                'timestamp': datetime.now().isoformat(),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'run': run,
+                'users': args.users,
+                'loans_per_user': args.loans_per_user,
+                'digest': not args.no_digest,
+                'workers': library.notifier.workers,
+                'sink_latency_ms': args.latency_ms,
+                'seconds': round(wall, 4),
+                'notices': notices,
+                'emails': results['emails_sent'],
+                'failed': results['failed'],
+                'notices_per_second': round(notices / wall, 1) if wall else None,
+                'emails_per_second': round(results['emails_sent'] / wall, 1) if wall else None,
+                'smtp_connections': sink.connections,
+                'smtp_logins': sink.logins,
+                'messages_received': sink.messages,
+                'latency_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+                'latency_p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                'latency_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            }
+            print(json.dumps(record))
+            if args.output:
+                with open(args.output, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Co-borrowing recommender: rebuild time, incremental updates and query latency.
+
+Generates a loan history with generate_dataset.py's seeded generator, so
+title popularity is Zipf-distributed (a few titles are borrowed a lot, most
+rarely) as in the other benchmarks, builds the co-occurrence matrix from it
+and times top-K queries cold (computed) and warm (cached), plus incremental
+add_loan calls. Use --output to append one JSON line per
+run so results can be compared across changes.
+
+    python benchmarks/bench_recommendations.py --loans 2000000 --users 100000 --books 50000
+    RECOMMEND_CACHE_MB=4 python benchmarks/bench_recommendations.py --loans 500000 --output bench.jsonl
+"""
+import argparse
+import bisect
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import git_revision, percentile
+from generate_dataset import DEFAULT_SEED, DatasetGenerator, zipf_cumulative
+from recommendations import CoBorrowRecommender
+
+
+def popular_books(generator, count, seed):
+    """Book ids drawn with the same popularity skew as the generated loans"""
+    rng = random.Random(f'{seed}:queries')
+    weights = zipf_cumulative(generator.book_count, generator.skew)
+    return [str(generator.book_by_rank[bisect.bisect_left(weights, rng.random() * weights[-1])])
+            for _ in range(count)]
+
+
+def timed_queries(recommender, book_ids):
+    latencies = []
+    for book_id in book_ids:
+        started = time.perf_counter()
+        recommender.neighbors(book_id)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the co-borrowing recommender")
+    parser.add_argument('--loans', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for title popularity")
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--updates', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', help="append results as JSON lines to this file")
+    args = parser.parse_args()
+
+    # Rebuild from the first --loans records and replay the rest as incremental updates
+    generator = DatasetGenerator(args.books, args.users, args.loans + args.updates, seed=args.seed, skew=args.skew)
+    started = time.perf_counter()
+    history = [(loan['user_id'], loan['book_id']) for loan in generator.loans()]
+    loans, updates = history[:args.loans], history[args.loans:]
+    generate_seconds = time.perf_counter() - started
+
+    recommender = CoBorrowRecommender()
+    started = time.perf_counter()
+    recommender.rebuild(loans)
+    rebuild_seconds = time.perf_counter() - started
+
+    rng = random.Random(f'{args.seed}:shuffle')
+    # Queries follow the same popularity skew as borrowing
+    query_ids = popular_books(generator, args.queries, args.seed)
+    cold = timed_queries(recommender, query_ids)
+    warm = timed_queries(recommender, query_ids)
+
+    started = time.perf_counter()
+    for user_id, book_id in updates:
+        recommender.add_loan(user_id, book_id)
+    update_seconds = time.perf_counter() - started
+    rng.shuffle(query_ids)
+    after_updates = timed_queries(recommender, query_ids)
+
+    stats = recommender.stats()
+    record = {
+        'benchmark': 'recommendations',
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'loans': args.loans,
+        'users': args.users,
+        'books': args.books,
+        'skew': args.skew,
+        'generate_seconds': round(generate_seconds, 3),
+        'rebuild_seconds': round(rebuild_seconds, 3),
+        'matrix_books': stats['books'],
+        'matrix_cells': stats['cells'],
+        'cache_entries': stats['cached'],
+        'cache_bytes': stats['cache_bytes'],
+        'cache_budget': stats['cache_budget'],
+        'cache_hit_ratio': round(stats['hits'] / (stats['hits'] + stats['misses']), 3),
+        'updates_per_second': round(args.updates / update_seconds, 1) if update_seconds else None,
+    }
+    for name, latencies in (('cold', cold), ('warm', warm), ('after_updates', after_updates)):
+        for pct in (50, 95, 99):
+            record[f'{name}_p{pct}_us'] = round(percentile(latencies, pct) * 1e6, 1)
+    print(json.dumps(record))
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""HTTP load test that drives the app through its real routes.
+
+Virtual users (one thread and one cookie session each) log in as generated
+students and then pick actions from a traffic mix until --duration or
+--requests runs out:
+
+    semester-start  logins, catalogue searches and borrowing dominate
+    end-of-day      returns, dashboards' stats polling and the admin
+                    notification preview dominate
+    steady          an even blend of the two
+
+Runs in-process against the Flask test client on a library generated with
+generate_dataset.py (same --seed, --books, --users and --loans give the same
+data), or against a running server with --url; that server must be loaded with
+a dataset from the same seed so that the logins and book ids exist. Reports
+throughput and p50/p95/p99 latency per route.
+
+--record writes every request as a JSON line and --replay sends such a file
+(or a werkzeug/gunicorn access log, GET requests only) again, optionally at
+the recorded pace.
+
+    python benchmarks/load_test.py --mix semester-start --vus 20 --duration 30
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --mix end-of-day --vus 50 --ramp 10
+    python benchmarks/load_test.py --replay requests.log --vus 8 --output load.jsonl
+"""
+import argparse
+import bisect
+import http.cookiejar
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common import git_revision, percentile
+from generate_dataset import DEFAULT_PASSWORD, DEFAULT_SEED, DatasetGenerator, user_email, write_json, zipf_cumulative
+
+# Relative weights of each action per traffic mix
+MIXES = {
+    'semester-start': {'login': 10, 'search': 40, 'borrow': 30, 'return': 5, 'stats': 10, 'notifications': 5},
+    'end-of-day': {'login': 5, 'search': 10, 'borrow': 5, 'return': 40, 'stats': 25, 'notifications': 15},
+    'steady': {'login': 5, 'search': 30, 'borrow': 20, 'return': 20, 'stats': 20, 'notifications': 5},
+}
+SEARCH_TERMS = ['river', 'silent', 'garden', 'kingdom of', 'the last', 'winter', 'archive', 'smith', '978']
+
+_ACCESS_LOG = re.compile(r'"(GET|POST|PUT|DELETE) (\S+) HTTP/[\d.]+"')
+
+
+def route_of(path):
+    """Group requests by route: query values and numeric/hex ids are dropped"""
+    path, _, query = path.partition('?')
+    path = re.sub(r'/(\d+|[0-9a-f]{32})(?=/|$)', '/<id>', path)
+    if query:
+        path += '?' + '&'.join(sorted(part.split('=')[0] + '=' for part in query.split('&')))
+    return path
+
+
+class TestClientSession:
+    """One virtual user's cookie session on the in-process test client"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, data=None):
+        resp = self.client.open(path, method=method, data=data)
+        return resp.status_code, resp.get_data()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPSession:
+    """One virtual user's cookie session against a running server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            counts = self.statuses.setdefault(route, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+
+class VirtualUser:
+    """A student working through the mix: keeps its session and its open loans"""
+
+    def __init__(self, number, session, args, stats, recorder, book_weights):
+        self.user_id = str(number % args.users + 1)
+        self.session = session
+        self.args = args
+        self.stats = stats
+        self.recorder = recorder
+        self.rng = random.Random(f'{args.seed}:vu{number}')
+        self.book_weights = book_weights
+        self.loans = []
+        self.actions, weights = zip(*MIXES[args.mix].items())
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def send(self, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, data)
+        except Exception:
+            self.stats.error()
+            return None, None
+        self.stats.add(route_of(path), time.perf_counter() - started, status)
+        if self.recorder:
+            self.recorder.write(method, path, data, self.user_id)
+        return status, body
+
+    def login(self):
+        self.send('POST', '/login/student', {'email': user_email(self.user_id), 'password': self.args.password})
+
+    def step(self):
+        action = self.actions[bisect.bisect_right(self.cumulative, self.rng.random() * self.cumulative[-1])]
+        if action == 'login':
+            self.login()
+        elif action == 'search':
+            self.send('GET', '/books?' + urllib.parse.urlencode({'search': self.rng.choice(SEARCH_TERMS)}))
+        elif action == 'borrow':
+            # Popular titles are requested more often, as in the generated loan history
+            rank = bisect.bisect_left(self.book_weights, self.rng.random() * self.book_weights[-1])
+            book_id = str(self.args.book_by_rank[rank])
+            status, body = self.send('POST', '/borrow', {'user_id': self.user_id, 'book_id': book_id})
+            # Only loans that went through can be returned later
+            if status == 200 and json.loads(body).get('success'):
+                self.loans.append(book_id)
+        elif action == 'return' and self.loans:
+            book_id = self.loans.pop(self.rng.randrange(len(self.loans)))
+            self.send('POST', '/return', {'user_id': self.user_id, 'book_id': book_id})
+        elif action == 'stats':
+            self.send('GET', '/api/stats')
+        elif action == 'notifications':
+            self.send('POST', '/admin/send-notifications',
+                      {'send_overdue': 'on', 'send_reminders': 'on', 'test_mode': 'on'})
+
+
+class Recorder:
+    """Writes sent requests as JSON lines that --replay accepts"""
+
+    def __init__(self, path):
+        self.f = open(path, 'w')
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def write(self, method, path, data, user_id):
+        line = json.dumps({'t': round(time.perf_counter() - self.started, 4), 'method': method,
+                           'path': path, 'data': data, 'user': user_id})
+        with self._lock:
+            self.f.write(line + '\n')
+
+    def close(self):
+        self.f.close()
+
+
+def read_replay(path):
+    """[(offset_seconds, method, path, data, user)] from JSON lines or an access log"""
+    requests = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                r = json.loads(line)
+                requests.append((r.get('t'), r.get('method', 'GET'), r['path'], r.get('data'), r.get('user')))
+            else:
+                match = _ACCESS_LOG.search(line)
+                if match and match.group(1) == 'GET':
+                    requests.append((None, 'GET', match.group(2), None, None))
+    return requests
+
+
+def run_mix(args, new_session, stats, recorder):
+    book_weights = zipf_cumulative(args.books, args.skew)
+    args.book_by_rank = DatasetGenerator(args.books, 1, 0, seed=args.seed).book_by_rank
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    budget = itertools.count()
+    threads = []
+
+    def run(number):
+        user = VirtualUser(number, new_session(), args, stats, recorder, book_weights)
+        user.login()
+        while (deadline is None or time.perf_counter() < deadline) and \
+                (not args.requests or next(budget) < args.requests):
+            user.step()
+            if args.think_ms:
+                time.sleep(user.rng.expovariate(1000.0 / args.think_ms))
+
+    for number in range(args.vus):
+        thread = threading.Thread(target=run, args=(number,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        if args.ramp:
+            time.sleep(args.ramp / args.vus)
+    for thread in threads:
+        thread.join()
+
+
+def run_replay(args, new_session, stats):
+    requests = read_replay(args.replay)
+    # Requests of one recorded user stay on one session, in order
+    lanes = {}
+    for i, request in enumerate(requests):
+        lanes.setdefault(request[4] or i % args.vus, []).append(request)
+    started = time.perf_counter()
+
+    def run(lane):
+        session = new_session()
+        user = None
+        for offset, method, path, data, user_id in lane:
+            if user_id and user_id != user:
+                user = user_id
+                session.request('POST', '/login/student', {'email': user_email(user_id), 'password': args.password})
+            if args.replay_speed and offset is not None:
+                delay = offset / args.replay_speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                status, _ = session.request(method, path, data)
+            except Exception:
+                stats.error()
+                continue
+            stats.add(route_of(path), time.perf_counter() - sent, status)
+
+    lanes = list(lanes.values())
+    threads = [threading.Thread(target=lambda group: [run(lane) for lane in group],
+                                args=(lanes[i::args.vus],), daemon=True) for i in range(min(args.vus, len(lanes)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the library app through its HTTP routes")
+    parser.add_argument('--url', help="running server to test; default is the in-process test client")
+    parser.add_argument('--mix', choices=sorted(MIXES), default='steady')
+    parser.add_argument('--vus', type=int, default=10, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run (0 = until --requests)")
+    parser.add_argument('--requests', type=int, default=0, help="stop after this many actions (0 = no limit)")
+    parser.add_argument('--ramp', type=float, default=0, help="seconds over which virtual users start")
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a user's actions")
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--loans', type=int, default=20000)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for borrow requests")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--record', help="write sent requests as JSON lines to this file")
+    parser.add_argument('--replay', help="JSON lines from --record, or an access log, to send instead of a mix")
+    parser.add_argument('--replay-speed', type=float, default=0, help="1 = recorded pace, 2 = twice as fast, 0 = no pauses")
+    parser.add_argument('--output', help="append results as JSON lines to this file")
+    args = parser.parse_args()
+    for option in ('record', 'replay', 'output'):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+
+    if args.url:
+        def new_session():
+            return HTTPSession(args.url)
+    else:
+        # Keep the run away from the real data file, database and mail server
+        os.environ.pop('MONGO_URI', None)
+        os.environ['EMAIL_HOST'] = ''
+        workdir = tempfile.mkdtemp(prefix='load_test_')
+        os.chdir(workdir)
+        # The app's Library() loads library_data.json from the working directory
+        data_file = os.path.join(workdir, 'library_data.json')
+        write_json(DatasetGenerator(args.books, args.users, args.loans, seed=args.seed, skew=args.skew,
+                                    password=args.password), data_file, report=lambda line: None)
+
+        import app as app_module
+
+        flask_app = app_module.app
+        flask_app.config['TESTING'] = True
+
+        def new_session():
+            return TestClientSession(flask_app)
+
+    stats = Stats()
+    recorder = Recorder(args.record) if args.record else None
+    started = time.perf_counter()
+    if args.replay:
+        run_replay(args, new_session, stats)
+    else:
+        run_mix(args, new_session, stats, recorder)
+    wall = time.perf_counter() - started
+    if recorder:
+        recorder.close()
+
+    meta = {
+        'benchmark': 'load',
+        'timestamp': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'target': args.url or 'test-client',
+        'mix': 'replay' if args.replay else args.mix,
+        'vus': args.vus,
+        'seconds': round(wall, 3),
+    }
+    records = []
+    print(f"{'route':40} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    for route, latencies in sorted(stats.latencies.items()):
+        latencies.sort()
+        record = dict(meta, route=route, requests=len(latencies),
+                      throughput=round(len(latencies) / wall, 2) if wall else None,
+                      p50_ms=round(percentile(latencies, 50) * 1000, 2),
+                      p95_ms=round(percentile(latencies, 95) * 1000, 2),
+                      p99_ms=round(percentile(latencies, 99) * 1000, 2),
+                      statuses={str(k): v for k, v in sorted(stats.statuses[route].items())})
+        records.append(record)
+        print(f"{route:40} {record['requests']:8} {record['throughput']:8} {record['p50_ms']:8} "
+              f"{record['p95_ms']:8} {record['p99_ms']:8}  {record['statuses']}")
+    total = sum(r['requests'] for r in records)
+    print(f"total: {total} requests in {wall:.2f}s ({total / wall if wall else 0:.1f} req/s), "
+          f"{stats.errors} connection errors")
+    if args.output:
+        with open(args.output, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
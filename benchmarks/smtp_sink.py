@@ -0,0 +1,104 @@
+"""In-process SMTP sink for benchmarks.
+
+Speaks just enough SMTP (EHLO, AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, RSET,
+NOOP, QUIT) for smtplib, accepts every message, throws it away and counts
+connections and messages. No STARTTLS, so point EmailService at it with
+EMAIL_USE_TLS=false.
+"""
+import socketserver
+import threading
+import time
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def _readline(self):
+        return self.rfile.readline().decode('utf-8', 'replace').rstrip('\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        sink._count('connections')
+        self._reply('220 sink ESMTP ready')
+        while True:
+            line = self._readline()
+            verb = line.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+            elif verb == 'HELO':
+                self._reply('250 sink')
+            elif verb == 'AUTH':
+                if line.upper().startswith('AUTH LOGIN'):
+                    self._reply('334 VXNlcm5hbWU6')
+                    self._readline()
+                    self._reply('334 UGFzc3dvcmQ6')
+                    self._readline()
+                sink._count('logins')
+                self._reply('235 Authentication successful')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(data_line)
+                if sink.latency:
+                    time.sleep(sink.latency)
+                sink._count('messages', size)
+                self._reply('250 Message accepted')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            elif not line:
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Start with ``with SMTPSink() as sink:``; ``sink.port`` is the bound port"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0):
+        self.latency = latency_ms / 1000.0
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), _SinkHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def _count(self, name, size=0):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+            self.bytes += size
+
+    def reset(self):
+        with self._lock:
+            self.connections = self.logins = self.messages = self.bytes = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -13,4 +13,9 @@ db = client[MONGO_DB]
 # Collections
 books_col = db['books']
 users_col = db['users']
-borrow_col = db['borrow_records']
\ No newline at end of file
+borrow_col = db['borrow_records']
+outbox_col = db['outbox']
+ledger_col = db['notification_ledger']
+holds_col = db['holds']
+analytics_col = db['analytics_daily']
+archive_col = db['borrow_archive']
\ No newline at end of file
@@ -0,0 +1,48 @@
+import bisect
+
+
+class SortedIndex:
+    """Borrow records kept ordered by a date string (e.g. due_date).
+
+    Range queries bisect into the ordered keys, so "loans due between A and B"
+    costs O(log n + matches) instead of a scan over every borrow record.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._keys = []
+        self._records = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, record_id):
+        indexed = self._records.get(record_id)
+        return indexed[1] if indexed else None
+
+    def add(self, record):
+        value = self.key(record)
+        if not value or record.record_id in self._records:
+            return
+        bisect.insort(self._keys, (value, record.record_id))
+        self._records[record.record_id] = (value, record)
+
+    def remove(self, record):
+        # Look up the key it was indexed under, in case the record changed since
+        indexed = self._records.pop(record.record_id, None)
+        if indexed is None:
+            return
+        entry = (indexed[0], record.record_id)
+        i = bisect.bisect_left(self._keys, entry)
+        if i < len(self._keys) and self._keys[i] == entry:
+            del self._keys[i]
+
+    def between(self, start=None, end=None):
+        """Records with start <= key < end (either bound may be None)"""
+        lo = 0 if start is None else bisect.bisect_left(self._keys, (start,))
+        hi = len(self._keys) if end is None else bisect.bisect_left(self._keys, (end,))
+        return [self._records[record_id][1] for _, record_id in self._keys[lo:hi]]
+
+    def rebuild(self, records):
+        self._records = {r.record_id: (self.key(r), r) for r in records if self.key(r)}
+        self._keys = sorted((value, record_id) for record_id, (value, _) in self._records.items())
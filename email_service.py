@@ -1,8 +1,13 @@
+import logging
 import smtplib
 import os
+import threading
+import time
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 # Try to import dotenv, but don't fail if it's not available
 try:
@@ -11,12 +16,21 @@ try:
         load_dotenv()
     except Exception as e:
         # Could be a UnicodeDecodeError when reading a malformed .env file
-        print(f"Warning: failed to load .env file: {e}. Continuing without .env.")
+        logging.getLogger(__name__).warning("Failed to load .env file, continuing without it: %s", e)
 except ImportError:
-    print("python-dotenv not installed. Using environment variables or defaults.")
+    logging.getLogger(__name__).info("python-dotenv not installed, using environment variables or defaults")
     # You can set default values here if needed
     pass
 
+# After load_dotenv so FINE_* settings from .env are picked up
+from fines import fine_policy
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+
+
 class EmailService:
     def __init__(self):
         # Use environment variables with fallback values
@@ -26,113 +40,168 @@ class EmailService:
         self.password = os.getenv('EMAIL_PASSWORD', '')
         self.from_email = os.getenv('EMAIL_FROM', '')
         self.library_name = os.getenv('LIBRARY_NAME', 'Library Management System')
-        self.fine_per_day = float(os.getenv('FINE_PER_DAY', '5'))
+        self.fine_per_day = fine_policy.rate
+        # Only disable for local test servers that don't speak STARTTLS
+        self.use_tls = os.getenv('EMAIL_USE_TLS', 'true').lower() not in ('0', 'false', 'no', 'off')
+        # Rotate pooled connections after this many messages (0 = never)
+        self.max_messages_per_connection = int(os.getenv('EMAIL_MAX_MESSAGES_PER_CONNECTION', '100'))
+        self.connections_opened = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        # Digest templates are parsed and compiled once, not per message
+        env = Environment(loader=FileSystemLoader(TEMPLATE_DIR),
+                          autoescape=select_autoescape(['html']))
+        self.digest_html_template = env.get_template('digest.html')
+        self.digest_text_template = env.get_template('digest.txt')
+
+    def _open_connection(self):
+        """Connect, upgrade to TLS and authenticate"""
+        logger.debug("Connecting to SMTP server", extra={'host': self.host, 'port': self.port})
+        server = smtplib.SMTP(self.host, self.port)
+        server.ehlo()
+        if self.use_tls:
+            server.starttls()
+            server.ehlo()
+        server.login(self.username, self.password)
+        with self._stats_lock:
+            self.connections_opened += 1
+        return server
+
+    def _close_connection(self):
+        server = getattr(self._local, 'server', None)
+        self._local.server = None
+        self._local.sent = 0
+        if server is not None:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                server.close()
+            except OSError:
+                pass
+
+    @contextmanager
+    def session(self):
+        """Reuse one authenticated SMTP connection for every send inside the block.
+
+        The connection is opened on the first message, reopened if the server
+        drops it, rotated every ``max_messages_per_connection`` messages and
+        closed when the block exits. Sessions are per thread and may be nested.
+        """
+        state = self._local
+        if getattr(state, 'depth', 0):
+            state.depth += 1
+            try:
+                yield self
+            finally:
+                state.depth -= 1
+            return
+
+        state.depth = 1
+        state.server = None
+        state.sent = 0
+        try:
+            yield self
+        finally:
+            self._close_connection()
+            state.depth = 0
+
+    def _deliver(self, to_email, text):
+        state = self._local
+        if not getattr(state, 'depth', 0):
+            # One-off send outside a session: connect, send, quit
+            server = self._open_connection()
+            try:
+                server.sendmail(self.from_email, to_email, text)
+            finally:
+                server.quit()
+            return
+
+        if state.server is not None and self.max_messages_per_connection and state.sent >= self.max_messages_per_connection:
+            self._close_connection()
+        if state.server is None:
+            state.server = self._open_connection()
+            state.sent = 0
+        try:
+            state.server.sendmail(self.from_email, to_email, text)
+        except smtplib.SMTPServerDisconnected:
+            logger.info("SMTP connection dropped, reconnecting", extra={'host': self.host})
+            state.server.close()
+            state.server = self._open_connection()
+            state.sent = 0
+            state.server.sendmail(self.from_email, to_email, text)
+        state.sent += 1
     
-    def send_email(self, to_email, subject, body):
-        """Send email to specified address"""
+    def send_email(self, to_email, subject, body, text_body=None):
+        """Send email to specified address (HTML, plus a plain-text part if given)"""
         # Check if email configuration is complete
         if not all([self.host, self.port, self.username, self.password, self.from_email]):
-            error_msg = "❌ Email configuration incomplete. Please check your .env file."
-            print(error_msg)
-            print(f"   Host: {self.host}")
-            print(f"   Port: {self.port}")
-            print(f"   Username: {self.username}")
-            print(f"   From: {self.from_email}")
-            print(f"   Password: {'***' if self.password else 'MISSING'}")
+            logger.error("Email configuration incomplete, check your .env file", extra={
+                'host': self.host, 'port': self.port, 'username': self.username,
+                'from_email': self.from_email, 'password_set': bool(self.password)
+            })
             return False
         
+        started = time.perf_counter()
         try:
-            print(f"📧 Attempting to send email to: {to_email}")
-            print(f"   Server: {self.host}:{self.port}")
-            print(f"   From: {self.from_email}")
-            print(f"   Subject: {subject}")
-            
             # Create message
-            msg = MIMEMultipart()
+            msg = MIMEMultipart('alternative' if text_body else 'mixed')
             msg['From'] = self.from_email
             msg['To'] = to_email
             msg['Subject'] = subject
             
-            # Add body to email
+            # Add body to email (plain text first so clients prefer the HTML part)
+            if text_body:
+                msg.attach(MIMEText(text_body, 'plain'))
             msg.attach(MIMEText(body, 'html'))
             
-            # Create server connection
-            print("   🔌 Connecting to SMTP server...")
-            server = smtplib.SMTP(self.host, self.port)
-            server.ehlo()
-            
-            print("   🔐 Starting TLS encryption...")
-            server.starttls()
-            server.ehlo()
-            
-            print(f"   👤 Logging in as: {self.username}")
-            server.login(self.username, self.password)
+            # Send over the session connection if one is open
+            with metrics.email_send_seconds.time():
+                self._deliver(to_email, msg.as_string())
             
-            # Send email
-            print("   📤 Sending email...")
-            text = msg.as_string()
-            server.sendmail(self.from_email, to_email, text)
-            server.quit()
-            
-            print(f"✅ Email sent successfully to {to_email}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Email sent", extra={
+                    'to': to_email, 'subject': subject,
+                    'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+                })
             return True
             
         except smtplib.SMTPAuthenticationError as e:
-            print(f"❌ SMTP Authentication Failed: {e}")
-            print("   💡 Common solutions:")
-            print("   - For Gmail: Use App Password instead of regular password")
-            print("   - Enable 2-Factor Authentication")
-            print("   - Check username/password")
+            logger.error("SMTP authentication failed (for Gmail use an App Password with 2FA enabled)",
+                         extra={'to': to_email, 'error': str(e)})
             return False
             
         except smtplib.SMTPConnectError as e:
-            print(f"❌ SMTP Connection Failed: {e}")
-            print("   💡 Common solutions:")
-            print("   - Check host/port settings")
-            print("   - Check internet connection")
-            print("   - Check firewall settings")
+            logger.error("SMTP connection failed (check host/port, network and firewall)",
+                         extra={'host': self.host, 'port': self.port, 'error': str(e)})
             return False
             
         except smtplib.SMTPSenderRefused as e:
-            print(f"❌ SMTP Sender Refused: {e}")
-            print("   💡 Common solutions:")
-            print("   - Check FROM email address")
-            print("   - Verify sender permissions")
+            logger.error("SMTP sender refused (check EMAIL_FROM and sender permissions)",
+                         extra={'from_email': self.from_email, 'error': str(e)})
             return False
             
         except smtplib.SMTPRecipientsRefused as e:
-            print(f"❌ SMTP Recipient Refused: {e}")
-            print("   💡 Common solutions:")
-            print("   - Check recipient email address")
+            logger.warning("SMTP recipient refused", extra={'to': to_email, 'error': str(e)})
             return False
             
         except Exception as e:
-            print(f"❌ Unexpected error sending email: {str(e)}")
-            print(f"   Error type: {type(e).__name__}")
+            logger.error("Unexpected error sending email", extra={
+                'to': to_email, 'error': str(e), 'error_type': type(e).__name__
+            })
+            # Don't reuse a connection in an unknown state
+            self._close_connection()
             return False
     
     def calculate_fine(self, due_date):
         """Calculate fine based on due date"""
         try:
-            today = datetime.now().date()
-            due_date_obj = datetime.strptime(due_date, '%Y-%m-%d').date()
-            
-            if today <= due_date_obj:
-                return 0
-            
-            days_overdue = (today - due_date_obj).days
-            fine_amount = days_overdue * self.fine_per_day
-            print(f"   💰 Fine calculated: Rs.{fine_amount:.2f} for {days_overdue} days overdue")
-            return fine_amount
-            
+            return fine_policy.fine_for(due_date)
         except Exception as e:
-            print(f"❌ Error calculating fine: {e}")
+            logger.warning("Could not calculate fine", extra={'due_date': due_date, 'error': str(e)})
             return 0
     
     def send_overdue_notification(self, user_email, user_name, book_title, due_date, borrow_date):
         """Send overdue book notification"""
-        print(f"📨 Preparing overdue notification for {user_name} ({user_email})")
-        
         fine_amount = self.calculate_fine(due_date)
         
         subject = f"📚 Overdue Book Notice - {self.library_name}"
@@ -188,22 +257,17 @@ class EmailService:
         """
         
         success = self.send_email(user_email, subject, body)
-        if success:
-            print(f"✅ Overdue notification sent to {user_name}")
-        else:
-            print(f"❌ Failed to send overdue notification to {user_name}")
+        if not success:
+            logger.warning("Failed to send overdue notification", extra={'to': user_email})
         return success
     
     def send_reminder_notification(self, user_email, user_name, book_title, due_date, borrow_date):
         """Send reminder notification before due date"""
-        print(f"📨 Preparing reminder notification for {user_name} ({user_email})")
-        
         try:
             days_until_due = (datetime.strptime(due_date, '%Y-%m-%d').date() - datetime.now().date()).days
-            print(f"   ⏰ Days until due: {days_until_due}")
-        except:
+        except ValueError:
             days_until_due = 0
-            print("   ⚠️ Could not calculate days until due")
+            logger.warning("Could not calculate days until due", extra={'due_date': due_date})
         
         subject = f"📚 Book Return Reminder - {self.library_name}"
         
@@ -256,16 +320,38 @@ class EmailService:
         """
         
         success = self.send_email(user_email, subject, body)
-        if success:
-            print(f"✅ Reminder notification sent to {user_name}")
+        if not success:
+            logger.warning("Failed to send reminder notification", extra={'to': user_email})
+        return success
+    
+    def send_digest_notification(self, user_email, user_name, overdue, reminders):
+        """Send one summary email covering all of a user's overdue and due-soon loans.
+
+        ``overdue`` items carry title/borrow_date/due_date/fine_amount and
+        ``reminders`` items carry title/borrow_date/due_date/days_until_due.
+        """
+        context = {
+            'user_name': user_name,
+            'overdue': overdue,
+            'reminders': reminders,
+            'total_fine': sum(item['fine_amount'] for item in overdue),
+            'fine_per_day': self.fine_per_day,
+            'library_name': self.library_name
+        }
+        if overdue:
+            subject = f"📚 Overdue Book Notice - {self.library_name}"
         else:
-            print(f"❌ Failed to send reminder notification to {user_name}")
+            subject = f"📚 Book Return Reminder - {self.library_name}"
+        
+        success = self.send_email(user_email, subject,
+                                  self.digest_html_template.render(context),
+                                  text_body=self.digest_text_template.render(context))
+        if not success:
+            logger.warning("Failed to send digest", extra={'to': user_email})
         return success
     
     def send_return_confirmation(self, user_email, user_name, book_title, fine_paid=0):
         """Send confirmation when book is returned"""
-        print(f"📨 Preparing return confirmation for {user_name} ({user_email})")
-        
         subject = f"📚 Book Return Confirmation - {self.library_name}"
         
         body = f"""
@@ -311,8 +397,59 @@ class EmailService:
         """
         
         success = self.send_email(user_email, subject, body)
-        if success:
-            print(f"✅ Return confirmation sent to {user_name}")
-        else:
-            print(f"❌ Failed to send return confirmation to {user_name}")
-        return success
\ No newline at end of file
+        if not success:
+            logger.warning("Failed to send return confirmation", extra={'to': user_email})
+        return success
+
+    def send_hold_ready_notification(self, user_email, user_name, book_title, expires_at):
+        """Tell a holder their reserved copy is waiting at the desk"""
+        subject = f"📚 Your Hold Is Ready - {self.library_name}"
+        try:
+            pickup_by = datetime.fromisoformat(expires_at).strftime('%Y-%m-%d %H:%M')
+        except (TypeError, ValueError):
+            pickup_by = expires_at
+        
+        body = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <style>
+                body {{ font-family: Arial, sans-serif; line-height: 1.6; }}
+                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                .header {{ background: #17a2b8; color: white; padding: 20px; text-align: center; }}
+                .content {{ padding: 20px; background: #f8f9fa; }}
+                .hold-info {{ background: #d1ecf1; border: 1px solid #bee5eb; padding: 15px; margin: 15px 0; }}
+                .footer {{ text-align: center; margin-top: 20px; font-size: 12px; color: #666; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h2>📚 Your Hold Is Ready</h2>
+                </div>
+                <div class="content">
+                    <p>Dear <strong>{user_name}</strong>,</p>
+                    
+                    <div class="hold-info">
+                        <p>A copy of the book you reserved has been set aside for you:</p>
+                        <h3>"{book_title}"</h3>
+                        <p><strong>Pick up by:</strong> {pickup_by}</p>
+                    </div>
+                    
+                    <p>If it is not borrowed by then, the copy goes to the next person in the queue.</p>
+                    
+                    <p>Best regards,<br>
+                    <strong>{self.library_name} Team</strong></p>
+                </div>
+                <div class="footer">
+                    <p>This is an automated message. Please do not reply to this email.</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+        
+        success = self.send_email(user_email, subject, body)
+        if not success:
+            logger.warning("Failed to send hold notification", extra={'to': user_email})
+        return success
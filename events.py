@@ -0,0 +1,79 @@
+import json
+import queue
+import threading
+
+
+class _Subscriber:
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+
+class EventBroker:
+    """Fan-out of library change events to Server-Sent Events streams.
+
+    Each open stream owns a small queue. Publishing encodes the frame once and
+    drops it into every queue without blocking; idle streams just sit in
+    ``queue.get`` and wake up for a heartbeat, so open tabs cost next to nothing
+    while the library is not changing.
+    """
+
+    def __init__(self, max_queue=100, heartbeat=15, retry_ms=5000):
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.retry_ms = retry_ms
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        subscriber = _Subscriber(self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _frame(self, event, data):
+        with self._lock:
+            self._next_id += 1
+            event_id = self._next_id
+        return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+    def publish(self, event, data):
+        if not self._subscribers:
+            return
+        frame = self._frame(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(frame)
+            except queue.Full:
+                # Slow consumer: drop its backlog and ask it to resync from /api/stats
+                subscriber.overflowed = True
+
+    def stream(self, initial=()):
+        """Generator of SSE frames for one client; ``initial`` is (event, data) pairs sent first"""
+        subscriber = self.subscribe()
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            for event, data in initial:
+                yield self._frame(event, data)
+            while True:
+                if subscriber.overflowed:
+                    subscriber.overflowed = False
+                    with subscriber.queue.mutex:
+                        subscriber.queue.queue.clear()
+                    yield self._frame('resync', {})
+                try:
+                    yield subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield "event: ping\ndata: {}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
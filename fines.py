@@ -0,0 +1,172 @@
+import os
+from array import array
+from datetime import date
+
+# NumPy is optional: without it the engine keeps the same columns in stdlib
+# arrays and accrues with a plain loop
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FinePolicy:
+    """The one place fine rules live: per-day rate, grace days and a per-loan cap"""
+
+    def __init__(self):
+        self.rate = float(os.getenv('FINE_PER_DAY', '5'))
+        self.grace_days = int(os.getenv('FINE_GRACE_DAYS', '0'))
+        # 0 = no cap
+        self.max_per_loan = float(os.getenv('FINE_MAX_PER_LOAN', '0'))
+
+    def fine_for_days(self, days_overdue):
+        days = days_overdue - self.grace_days
+        if days <= 0:
+            return 0
+        fine = days * self.rate
+        if self.max_per_loan:
+            fine = min(fine, self.max_per_loan)
+        return fine
+
+    def fine_for(self, due_date, today=None):
+        """Fine for a 'YYYY-MM-DD' due date as of ``today``"""
+        today = today or date.today()
+        return self.fine_for_days(today.toordinal() - date.fromisoformat(due_date).toordinal())
+
+
+fine_policy = FinePolicy()
+
+
+class FineEngine:
+    """Column store of loan fine state with vectorized accrual.
+
+    Each loan occupies one slot in parallel columns (due-date ordinal, returned
+    flag, paid flag, owning user, current amount); per-user unpaid totals are
+    kept alongside and adjusted on every change, so reading a user's total is
+    O(1). ``accrue`` recomputes every active loan's fine in a single pass.
+    """
+
+    def __init__(self, policy=fine_policy):
+        self.policy = policy
+        self.rebuild([])
+
+    def rebuild(self, records):
+        self.slots = {}
+        self.record_ids = []
+        self.user_index = {}
+        self.user_ids = []
+        self._due = array('l')
+        self._returned = array('b')
+        self._paid = array('b')
+        self._user = array('l')
+        self._amount = array('d')
+        self._totals = array('d')
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self.record_ids)
+
+    def _user_slot(self, user_id):
+        index = self.user_index.get(user_id)
+        if index is None:
+            index = self.user_index[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self._totals.append(0.0)
+        return index
+
+    def add(self, record):
+        if record.record_id in self.slots:
+            return
+        self.slots[record.record_id] = len(self.record_ids)
+        self.record_ids.append(record.record_id)
+        user = self._user_slot(record.user_id)
+        self._due.append(date.fromisoformat(record.due_date).toordinal())
+        self._returned.append(1 if record.returned else 0)
+        self._paid.append(1 if record.fine_paid else 0)
+        self._user.append(user)
+        amount = float(record.fine_amount or 0)
+        self._amount.append(amount)
+        if not record.fine_paid:
+            self._totals[user] += amount
+
+    def update(self, record):
+        """Re-sync one loan's flags and amount after it changed"""
+        slot = self.slots.get(record.record_id)
+        if slot is None:
+            self.add(record)
+            return
+        user = self._user[slot]
+        if not self._paid[slot]:
+            self._totals[user] -= self._amount[slot]
+        self._returned[slot] = 1 if record.returned else 0
+        self._paid[slot] = 1 if record.fine_paid else 0
+        self._amount[slot] = float(record.fine_amount or 0)
+        if not record.fine_paid:
+            self._totals[user] += self._amount[slot]
+
+    def remove(self, record):
+        """Tombstone a deleted loan: it keeps its slot but no longer counts"""
+        slot = self.slots.get(record.record_id)
+        if slot is None:
+            return
+        if not self._paid[slot]:
+            self._totals[self._user[slot]] -= self._amount[slot]
+        self._returned[slot] = 1
+        self._paid[slot] = 1
+        self._amount[slot] = 0.0
+
+    def changes(self, slots):
+        """(record_id, amount) for slots returned by ``accrue``"""
+        record_ids, amount = self.record_ids, self._amount
+        return ((record_ids[slot], amount[slot]) for slot in slots)
+
+    def user_total(self, user_id):
+        index = self.user_index.get(user_id)
+        if index is None:
+            return 0
+        # Clamp float dust left by incremental add/subtract
+        return round(self._totals[index], 2)
+
+    def accrue(self, today=None):
+        """Recompute fines for every active loan; returns the slots whose amount changed"""
+        today_ordinal = (today or date.today()).toordinal()
+        policy = self.policy
+        if not self.record_ids:
+            return []
+
+        if np is not None:
+            due = np.frombuffer(self._due, dtype=np.int64 if self._due.itemsize == 8 else np.int32)
+            returned = np.frombuffer(self._returned, dtype=np.int8)
+            paid = np.frombuffer(self._paid, dtype=np.int8)
+            users = np.frombuffer(self._user, dtype=due.dtype)
+            amount = np.frombuffer(self._amount, dtype=np.float64)
+
+            days = today_ordinal - due - policy.grace_days
+            fines = np.clip(days, 0, None) * policy.rate
+            if policy.max_per_loan:
+                np.minimum(fines, policy.max_per_loan, out=fines)
+            active = returned == 0
+            changed = np.flatnonzero(active & (fines != amount))
+            amount[changed] = fines[changed]  # writes through to self._amount
+
+            totals = np.bincount(users, weights=np.where(paid == 0, amount, 0.0), minlength=len(self.user_ids))
+            self._totals = array('d', totals.tolist())
+            return changed.tolist()
+
+        changed = []
+        totals = array('d', bytes(8 * len(self.user_ids)))
+        grace, rate, cap = policy.grace_days, policy.rate, policy.max_per_loan
+        for slot in range(len(self.record_ids)):
+            if not self._returned[slot]:
+                days = today_ordinal - self._due[slot] - grace
+                fine = days * rate if days > 0 else 0.0
+                if cap and fine > cap:
+                    fine = cap
+                if fine != self._amount[slot]:
+                    self._amount[slot] = fine
+                    changed.append(slot)
+            if not self._paid[slot]:
+                totals[self._user[slot]] += self._amount[slot]
+        self._totals = totals
+        return changed
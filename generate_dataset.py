@@ -0,0 +1,288 @@
+# generate_dataset.py
+"""Generate a synthetic library at production scale.
+
+Books, users and borrow records are produced as streams from a single seed,
+so the same arguments always give the same library: benchmarks and load
+tests that pass the same --seed see identical ids, emails and loans.
+Popularity is skewed: titles are borrowed with Zipf-distributed frequency
+(popular titles also get more copies) and a Zipf-distributed minority of
+users does most of the borrowing. A share of loans comes back late, loans
+still out past their due date are overdue with fines accrued, and no book is
+ever lent out beyond its quantity.
+
+Output goes straight to a backend through its bulk path: a JSON data file
+written as a stream, or MongoDB via batched insert_many.
+
+    python generate_dataset.py --books 10000 --users 2000 --loans 200000 --output library_data.json
+    python generate_dataset.py --books 1000000 --users 200000 --loans 20000000 --backend mongo --drop
+
+Every generated user can log in with --password (default "password").
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import time
+from array import array
+from datetime import date
+
+from dotenv import load_dotenv
+
+from fines import fine_policy
+
+load_dotenv()
+
+DEFAULT_SEED = 42
+DEFAULT_PASSWORD = 'password'
+
+_ADJECTIVES = ['Silent', 'Hidden', 'Broken', 'Golden', 'Last', 'Distant', 'Burning', 'Forgotten', 'Secret',
+               'Crimson', 'Wandering', 'Frozen', 'Endless', 'Quiet', 'Little', 'Lost', 'Bright', 'Dark']
+_NOUNS = ['River', 'Garden', 'Kingdom', 'Algorithm', 'Sea', 'Letters', 'Mountain', 'City', 'Machine', 'Winter',
+          'Orchard', 'Archive', 'Harbor', 'Theory', 'Empire', 'Station', 'Library', 'Forest']
+_FIRST_NAMES = ['Aarav', 'Emma', 'Liam', 'Priya', 'Noah', 'Olivia', 'Mateo', 'Ananya', 'Sofia', 'Ethan',
+                'Meera', 'Lucas', 'Zara', 'Arjun', 'Mia', 'Kabir', 'Chloe', 'Rohan', 'Isla', 'Leo']
+_LAST_NAMES = ['Sharma', 'Smith', 'Garcia', 'Ali', 'Johnson', 'Chen', 'Patel', 'Brown', 'Khan', 'Davis',
+               'Singh', 'Martin', 'Rossi', 'Nguyen', 'Kumar', 'Wilson', 'Silva', 'Taylor', 'Mehta', 'Lee']
+
+
+def user_email(user_id):
+    """Login email of generated user ``user_id`` (1-based)"""
+    return f'user{user_id}@example.com'
+
+
+def isbn13(n):
+    digits = f'978{n % 10 ** 9:09d}'
+    check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return digits + str(check)
+
+
+def zipf_cumulative(n, skew):
+    """Cumulative Zipf weights for ranks 1..n"""
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+class DatasetGenerator:
+    """Deterministic synthetic library.
+
+    Call ``loans()`` first: it streams borrow records in borrow-date order
+    and counts copies still on loan, which ``books()`` and ``users()`` need
+    for ``available`` and ``borrowed_books``. Each section draws from its own
+    seeded generator, so e.g. the book catalogue does not change when only
+    the number of loans does.
+    """
+
+    def __init__(self, books, users, loans, seed=DEFAULT_SEED, skew=1.1, user_skew=0.8,
+                 overdue_rate=0.15, late_days=7.0, history_days=365, loan_days=14,
+                 fine_paid_rate=0.7, password=DEFAULT_PASSWORD, today=None):
+        self.book_count = books
+        self.user_count = users
+        self.loan_count = loans
+        self.seed = seed
+        self.skew = skew
+        self.user_skew = user_skew
+        self.overdue_rate = overdue_rate
+        self.late_days = late_days
+        self.history_days = history_days
+        self.loan_days = loan_days
+        self.fine_paid_rate = fine_paid_rate
+        self.password = password
+        self.today = today or date.today()
+
+        # Popularity rank -> id, shuffled so the most borrowed titles and
+        # most active readers are spread over the id range
+        rng = random.Random(f'{seed}:ranks')
+        self.book_by_rank = list(range(1, books + 1))
+        rng.shuffle(self.book_by_rank)
+        self.user_by_rank = list(range(1, users + 1))
+        rng.shuffle(self.user_by_rank)
+        self.quantity = array('i', bytes(4 * (books + 1)))
+        for rank, book_id in enumerate(self.book_by_rank, 1):
+            self.quantity[book_id] = max(1, min(10, round(10 / rank ** 0.3)))
+        self.on_loan = array('i', bytes(4 * (books + 1)))
+        self.user_loans = {}
+
+    def loans(self):
+        """Borrow record dicts (BorrowRecord.to_dict shape), oldest first"""
+        rng = random.Random(f'{self.seed}:loans')
+        book_weights = zipf_cumulative(self.book_count, self.skew)
+        user_weights = zipf_cumulative(self.user_count, self.user_skew)
+        book_total, user_total = book_weights[-1], user_weights[-1]
+        first_day = self.today.toordinal() - self.history_days
+        today = self.today.toordinal()
+        active = set()
+        self.on_loan = array('i', bytes(4 * (self.book_count + 1)))
+        self.user_loans = {}
+
+        for i in range(self.loan_count):
+            book_id = self.book_by_rank[bisect.bisect_left(book_weights, rng.random() * book_total)]
+            user_id = self.user_by_rank[bisect.bisect_left(user_weights, rng.random() * user_total)]
+            borrowed = first_day + i * self.history_days // max(1, self.loan_count)
+            due = borrowed + self.loan_days
+            if rng.random() < self.overdue_rate:
+                returned_on = due + 1 + int(rng.expovariate(1.0 / self.late_days))
+            else:
+                returned_on = borrowed + rng.randint(1, self.loan_days)
+
+            key = (user_id, book_id)
+            # Loans that would still be out need a free copy and no open loan of the same title
+            if returned_on > today and (key in active or self.on_loan[book_id] >= self.quantity[book_id]):
+                returned_on = max(borrowed, min(due, today))
+            returned = returned_on <= today
+            if returned:
+                late = returned_on - due
+            else:
+                late = today - due
+                active.add(key)
+                self.on_loan[book_id] += 1
+                self.user_loans.setdefault(user_id, []).append(str(book_id))
+            fine = fine_policy.fine_for_days(late) if late > 0 else 0
+
+            yield {
+                'record_id': '%032x' % rng.getrandbits(128),
+                'user_id': str(user_id),
+                'book_id': str(book_id),
+                'borrow_date': date.fromordinal(borrowed).isoformat(),
+                'due_date': date.fromordinal(due).isoformat(),
+                'returned': returned,
+                'fine_amount': fine,
+                'fine_paid': bool(fine) and returned and rng.random() < self.fine_paid_rate,
+                'return_date': date.fromordinal(returned_on).isoformat() if returned else None
+            }
+
+    def books(self):
+        """Book dicts (Book.to_dict shape) in id order"""
+        rng = random.Random(f'{self.seed}:books')
+        for book_id in range(1, self.book_count + 1):
+            yield {
+                'book_id': str(book_id),
+                'title': f'The {rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)} of {rng.choice(_NOUNS)}',
+                'author': f'{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}',
+                'isbn': isbn13(book_id),
+                'quantity': self.quantity[book_id],
+                'available': self.quantity[book_id] - self.on_loan[book_id]
+            }
+
+    def users(self):
+        """User dicts (User.to_dict shape) in id order; all share one password"""
+        from password_service import password_service
+
+        rng = random.Random(f'{self.seed}:users')
+        # One hash for everybody: hashing per user would dominate generation time
+        password_hash = password_service.hash_password(self.password)
+        for user_id in range(1, self.user_count + 1):
+            yield {
+                'user_id': str(user_id),
+                'name': f'{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}',
+                'email': user_email(user_id),
+                'phone': f'555-{rng.randrange(10000):04d}',
+                'borrowed_books': self.user_loans.get(user_id, []),
+                'password_hash': password_hash,
+                'role': 'student'
+            }
+
+    def sections(self):
+        """(section, rows) in the order they must be consumed"""
+        yield 'borrow_records', self.loans()
+        yield 'books', self.books()
+        yield 'users', self.users()
+
+
+def write_json(generator, path, report=print):
+    """Stream the dataset into a library_data.json-format file"""
+    counts = {}
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write('{')
+        for n, (section, rows) in enumerate(generator.sections()):
+            f.write(('' if n == 0 else ',') + f'\n"{section}": ' + ('[' if section == 'borrow_records' else '{'))
+            count = 0
+            for row in rows:
+                if count:
+                    f.write(',')
+                if section == 'borrow_records':
+                    f.write('\n' + json.dumps(row))
+                else:
+                    key = row['book_id'] if section == 'books' else row['user_id']
+                    f.write(f'\n"{key}": ' + json.dumps(row))
+                count += 1
+            f.write('\n' + (']' if section == 'borrow_records' else '}'))
+            counts[section] = count
+            report(f"  {section}: {count}")
+        f.write('\n}\n')
+    os.replace(tmp, path)
+    return counts
+
+
+def write_mongo(generator, db, batch_size=5000, drop=False, report=print):
+    """Bulk-insert the dataset into the collections db.py uses"""
+    collections = {'books': db['books'], 'users': db['users'], 'borrow_records': db['borrow_records']}
+    if drop:
+        for name in list(collections) + ['holds', 'analytics_daily', 'notification_ledger', 'borrow_archive']:
+            db[name].drop()
+    counts = {}
+    for section, rows in generator.sections():
+        collection = collections[section]
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+        counts[section] = count
+        report(f"  {section}: {count}")
+    # The lookups the app (and lazy mode in particular) runs against these collections
+    collections['books'].create_index('book_id')
+    collections['books'].create_index([('available', 1), ('title', 1)])
+    collections['users'].create_index('user_id')
+    collections['users'].create_index('email')
+    collections['borrow_records'].create_index('record_id')
+    collections['borrow_records'].create_index([('user_id', 1), ('returned', 1)])
+    collections['borrow_records'].create_index([('book_id', 1), ('returned', 1)])
+    collections['borrow_records'].create_index([('returned', 1), ('due_date', 1)])
+    collections['borrow_records'].create_index([('returned', 1), ('return_date', 1)])
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic library")
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for title popularity")
+    parser.add_argument('--user-skew', type=float, default=0.8, help="Zipf exponent for borrower activity")
+    parser.add_argument('--overdue-rate', type=float, default=0.15, help="share of loans returned (or still out) late")
+    parser.add_argument('--late-days', type=float, default=7.0, help="mean days late for late loans")
+    parser.add_argument('--history-days', type=int, default=365, help="days of borrowing history ending today")
+    parser.add_argument('--password', default=DEFAULT_PASSWORD, help="login password of every generated user")
+    parser.add_argument('--backend', choices=('json', 'mongo'), default='json')
+    parser.add_argument('--output', default='library_data.json', help="JSON data file (json backend)")
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB', 'library_db'))
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--drop', action='store_true', help="drop existing library collections first (mongo)")
+    args = parser.parse_args()
+
+    generator = DatasetGenerator(args.books, args.users, args.loans, seed=args.seed, skew=args.skew,
+                                 user_skew=args.user_skew, overdue_rate=args.overdue_rate,
+                                 late_days=args.late_days, history_days=args.history_days,
+                                 password=args.password)
+    started = time.perf_counter()
+    if args.backend == 'mongo':
+        from pymongo import MongoClient
+        print(f"Writing to {args.uri} / {args.db}")
+        counts = write_mongo(generator, MongoClient(args.uri)[args.db], args.batch_size, drop=args.drop)
+    else:
+        print(f"Writing to {args.output}")
+        counts = write_json(generator, args.output)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"Generated {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/sec), "
+          f"{sum(generator.on_loan)} copies on loan")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import bisect
+import heapq
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+
+class HoldError(Exception):
+    """A hold request that cannot be accepted (limit reached, duplicate, ...)"""
+
+
+class _BookQueue:
+    """FIFO of waiting hold sequence numbers for one book.
+
+    Sequence numbers only grow, so the waiting list stays sorted: enqueue
+    appends, dequeue advances ``start`` and a holder's position is one bisect.
+    Cancelled holds are removed in place; served ones are compacted away lazily.
+    """
+
+    def __init__(self):
+        self.seqs = []
+        self.start = 0
+        self.next_seq = 1
+
+    def __len__(self):
+        return len(self.seqs) - self.start
+
+    def push(self):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.seqs.append(seq)
+        return seq
+
+    def pop(self):
+        if not len(self):
+            return None
+        seq = self.seqs[self.start]
+        self.start += 1
+        if self.start > 32 and self.start * 2 > len(self.seqs):
+            del self.seqs[:self.start]
+            self.start = 0
+        return seq
+
+    def discard(self, seq):
+        i = bisect.bisect_left(self.seqs, seq, self.start)
+        if i < len(self.seqs) and self.seqs[i] == seq:
+            del self.seqs[i]
+
+    def position(self, seq):
+        return bisect.bisect_left(self.seqs, seq, self.start) - self.start + 1
+
+
+class HoldQueues:
+    """Per-book reservation queues with pickup windows.
+
+    A hold waits in its book's queue until a copy is returned; the copy is then
+    set aside for the first holder (status ``ready``) until ``expires_at``.
+    Ready holds that are not picked up in time expire and the copy moves on to
+    the next holder. Holds are indexed by id, by user (for the per-user limit)
+    and by book and sequence number (for positions). Like the notification
+    ledger, Mongo mode writes each change through to ``collection``.
+    """
+
+    ACTIVE = ('waiting', 'ready')
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.limit_per_user = int(os.getenv('HOLD_LIMIT_PER_USER', '5'))
+        self.pickup_days = int(os.getenv('HOLD_PICKUP_DAYS', '3'))
+        self.holds = {}
+        self.by_user = {}
+        self.by_book_seq = {}
+        self.queues = {}
+        self._expiry = []
+        self._lock = threading.RLock()
+
+    # -- persistence ---------------------------------------------------
+
+    def load(self, entries):
+        with self._lock:
+            self.holds = {}
+            self.by_user = {}
+            self.by_book_seq = {}
+            self.queues = {}
+            self._expiry = []
+            entries = [{k: v for k, v in e.items() if k != '_id'} for e in entries]
+            for hold in sorted(entries, key=lambda h: h['seq']):
+                if hold['status'] not in self.ACTIVE:
+                    continue
+                queue = self.queues.setdefault(hold['book_id'], _BookQueue())
+                queue.next_seq = max(queue.next_seq, hold['seq'] + 1)
+                if hold['status'] == 'waiting':
+                    queue.seqs.append(hold['seq'])
+                else:
+                    heapq.heappush(self._expiry, (hold['expires_at'], hold['hold_id']))
+                self._index(hold)
+
+    def to_list(self):
+        with self._lock:
+            return [dict(h) for h in self.holds.values()]
+
+    def _index(self, hold):
+        self.holds[hold['hold_id']] = hold
+        self.by_user.setdefault(hold['user_id'], set()).add(hold['hold_id'])
+        self.by_book_seq[(hold['book_id'], hold['seq'])] = hold['hold_id']
+
+    def _unindex(self, hold):
+        self.holds.pop(hold['hold_id'], None)
+        self.by_user.get(hold['user_id'], set()).discard(hold['hold_id'])
+        self.by_book_seq.pop((hold['book_id'], hold['seq']), None)
+
+    def _write(self, hold):
+        if self.collection is None:
+            return
+        if hold['status'] in self.ACTIVE:
+            self.collection.update_one({'hold_id': hold['hold_id']}, {'$set': dict(hold)}, upsert=True)
+        else:
+            self.collection.delete_one({'hold_id': hold['hold_id']})
+
+    # -- queries -------------------------------------------------------
+
+    def get(self, hold_id):
+        return self.holds.get(hold_id)
+
+    def for_user(self, user_id):
+        with self._lock:
+            holds = [dict(self.holds[h], position=self.position(self.holds[h]))
+                     for h in self.by_user.get(user_id, ())]
+        return sorted(holds, key=lambda h: h['created_at'])
+
+    def find(self, user_id, book_id, status=ACTIVE):
+        for hold_id in self.by_user.get(user_id, ()):
+            hold = self.holds[hold_id]
+            if hold['book_id'] == book_id and hold['status'] in status:
+                return hold
+        return None
+
+    def position(self, hold):
+        """1-based place in the book's queue; 0 once the copy is ready for pickup"""
+        if hold['status'] != 'waiting':
+            return 0
+        return self.queues[hold['book_id']].position(hold['seq'])
+
+    def queue_length(self, book_id):
+        queue = self.queues.get(book_id)
+        return len(queue) if queue else 0
+
+    def ready_count(self, book_id):
+        """Copies of the book set aside for holders and waiting at the desk"""
+        with self._lock:
+            return sum(1 for h in self.holds.values() if h['book_id'] == book_id and h['status'] == 'ready')
+
+    # -- changes -------------------------------------------------------
+
+    def place(self, user_id, book_id):
+        with self._lock:
+            if self.find(user_id, book_id):
+                raise HoldError("You already have a hold on this book")
+            if self.limit_per_user and len(self.by_user.get(user_id, ())) >= self.limit_per_user:
+                raise HoldError(f"Hold limit reached ({self.limit_per_user} active holds)")
+            seq = self.queues.setdefault(book_id, _BookQueue()).push()
+            hold = {
+                'hold_id': uuid.uuid4().hex,
+                'user_id': user_id,
+                'book_id': book_id,
+                'seq': seq,
+                'status': 'waiting',
+                'created_at': datetime.now().isoformat(),
+                'expires_at': None
+            }
+            self._index(hold)
+        self._write(hold)
+        return hold
+
+    def allocate(self, book_id, now=None):
+        """Set a returned copy aside for the next waiting holder; returns that hold or None"""
+        now = now or datetime.now()
+        with self._lock:
+            queue = self.queues.get(book_id)
+            seq = queue.pop() if queue else None
+            if seq is None:
+                return None
+            hold = self.holds[self.by_book_seq[(book_id, seq)]]
+            hold['status'] = 'ready'
+            hold['expires_at'] = (now + timedelta(days=self.pickup_days)).isoformat()
+            heapq.heappush(self._expiry, (hold['expires_at'], hold['hold_id']))
+        self._write(hold)
+        return hold
+
+    def _close(self, hold, status):
+        with self._lock:
+            if hold['status'] == 'waiting':
+                self.queues[hold['book_id']].discard(hold['seq'])
+            hold['status'] = status
+            self._unindex(hold)
+        self._write(hold)
+
+    def fulfill(self, hold):
+        """The holder borrowed the copy that was set aside"""
+        self._close(hold, 'fulfilled')
+
+    def cancel(self, hold):
+        """Returns True when a ready copy was released by the cancellation"""
+        was_ready = hold['status'] == 'ready'
+        self._close(hold, 'cancelled')
+        return was_ready
+
+    def pop_expired(self, now=None):
+        """Expire ready holds whose pickup window has closed; returns them"""
+        now = (now or datetime.now()).isoformat()
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, hold_id = heapq.heappop(self._expiry)
+                hold = self.holds.get(hold_id)
+                # Stale heap entry: already picked up or cancelled
+                if hold is None or hold['status'] != 'ready':
+                    continue
+                expired.append(hold)
+        for hold in expired:
+            self._close(hold, 'expired')
+        return expired
+
+    def forget_book(self, book_id):
+        with self._lock:
+            for hold in [h for h in self.holds.values() if h['book_id'] == book_id]:
+                self._close(hold, 'cancelled')
+            self.queues.pop(book_id, None)
@@ -0,0 +1,117 @@
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+class LazyCollection(MutableMapping):
+    """Dict-like, read-through view of a Mongo collection with an LRU cache.
+
+    ``get``/``[]`` return the cached object or load it from ``collection`` by
+    ``key_field``; at most ``max_entries`` objects stay cached. Assigning only
+    caches the object: callers write changes through to Mongo themselves, so
+    evicting an entry never loses data. Iterating streams the collection
+    without filling the cache, and ``len`` asks the server.
+    """
+
+    def __init__(self, collection, key_field, from_dict, max_entries=10000):
+        self.collection = collection
+        self.key_field = key_field
+        self.from_dict = from_dict
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build(self, doc):
+        data = {k: v for k, v in doc.items() if k != '_id'}
+        data.setdefault(self.key_field, str(doc.get('_id')))
+        return self.from_dict(data)
+
+    def remember(self, key, obj):
+        with self._lock:
+            self._cache[key] = obj
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return obj
+
+    def get(self, key, default=None):
+        with self._lock:
+            obj = self._cache.get(key)
+            if obj is not None:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return obj
+            self.misses += 1
+        doc = self.collection.find_one({self.key_field: key})
+        if not doc:
+            return default
+        return self.remember(key, self._build(doc))
+
+    def find_one(self, query):
+        """Load the first object matching ``query`` (e.g. by email) through the cache"""
+        doc = self.collection.find_one(query)
+        if not doc:
+            return None
+        obj = self._build(doc)
+        return self.remember(getattr(obj, self.key_field), obj)
+
+    def find(self, query, sort=None, skip=0, limit=0):
+        cursor = self.collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [self.remember(getattr(obj, self.key_field), obj) for obj in map(self._build, cursor)]
+
+    def __getitem__(self, key):
+        obj = self.get(key)
+        if obj is None:
+            raise KeyError(key)
+        return obj
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, obj):
+        self.remember(key, obj)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def __iter__(self):
+        for doc in self.collection.find({}, {self.key_field: 1}):
+            yield doc[self.key_field]
+
+    def __len__(self):
+        return self.collection.estimated_document_count()
+
+    def items(self):
+        for doc in self.collection.find():
+            key = doc.get(self.key_field)
+            with self._lock:
+                cached = self._cache.get(key)
+            yield key, cached if cached is not None else self._build(doc)
+
+    def values(self):
+        for _, obj in self.items():
+            yield obj
+
+    def stats(self):
+        with self._lock:
+            size = len(self._cache)
+        lookups = self.hits + self.misses
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None
+        }
@@ -0,0 +1,79 @@
+import os
+import threading
+from datetime import date
+
+
+class NotificationLedger:
+    """Remembers which loans were notified, of what, and when.
+
+    Entries are indexed by record id and notification kind, so a sweep decides
+    whether a loan is due for another notice with one dict lookup. Reminders
+    go out once per reminder window (a new due date opens a new window);
+    overdue notices repeat every ``overdue_resend_days`` while the loan stays
+    overdue. Entries are dropped when the loan is returned.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        # 0 = only once per reminder window / overdue period
+        self.reminder_resend_days = int(os.getenv('REMINDER_RESEND_DAYS', '0'))
+        self.overdue_resend_days = int(os.getenv('OVERDUE_RESEND_DAYS', '3'))
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, entries):
+        with self._lock:
+            self.entries = {}
+            for entry in entries:
+                entry = {k: v for k, v in entry.items() if k != '_id'}
+                self.entries.setdefault(entry['record_id'], {})[entry['kind']] = entry
+
+    def to_list(self):
+        with self._lock:
+            return [dict(entry) for kinds in self.entries.values() for entry in kinds.values()]
+
+    def _cadence(self, kind):
+        return self.overdue_resend_days if kind == 'overdue' else self.reminder_resend_days
+
+    def should_send(self, record_id, kind, due_date, today=None):
+        entry = self.entries.get(record_id, {}).get(kind)
+        if entry is None or entry['due_date'] != due_date:
+            return True
+        cadence = self._cadence(kind)
+        if cadence <= 0:
+            return False
+        today = today or date.today()
+        return (today - date.fromisoformat(entry['sent_on'])).days >= cadence
+
+    def mark_sent(self, record_id, kind, due_date, today=None):
+        today = today or date.today()
+        with self._lock:
+            kinds = self.entries.setdefault(record_id, {})
+            previous = kinds.get(kind)
+            entry = {
+                'record_id': record_id,
+                'kind': kind,
+                'due_date': due_date,
+                'sent_on': today.isoformat(),
+                'count': (previous['count'] + 1) if previous and previous['due_date'] == due_date else 1
+            }
+            kinds[kind] = entry
+        if self.collection is not None:
+            self.collection.update_one({'record_id': record_id, 'kind': kind}, {'$set': entry}, upsert=True)
+
+    def due_for_resend(self, kind, today=None):
+        """Record ids whose ``kind`` notice is due again under the resend cadence"""
+        cadence = self._cadence(kind)
+        if cadence <= 0:
+            return []
+        today = today or date.today()
+        with self._lock:
+            return [record_id for record_id, kinds in self.entries.items()
+                    if kind in kinds and (today - date.fromisoformat(kinds[kind]['sent_on'])).days >= cadence]
+
+    def forget(self, record_id):
+        """Drop every entry of a loan (returned or deleted)"""
+        with self._lock:
+            removed = self.entries.pop(record_id, None)
+        if removed and self.collection is not None:
+            self.collection.delete_many({'record_id': record_id})
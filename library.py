@@ -1,8 +1,41 @@
+import functools
 import json
+import logging
 import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter
 from datetime import datetime, timedelta
 from email_service import EmailService
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_service import password_service
+from events import EventBroker
+from notifications import Message, NotificationDispatcher
+from ledger import NotificationLedger
+from due_index import SortedIndex
+from fines import FineEngine, fine_policy
+from accounts import UserAccount
+from availability import AvailabilityIndex
+from holds import HoldError, HoldQueues
+from analytics import CirculationRollups, loan_days
+from archive import RecordArchive
+from recommendations import CoBorrowRecommender
+from outbox import EmailOutbox
+from lazy_cache import LazyCollection
+from log_config import log_duration
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _locked(method):
+    """Run a Library method under the library lock so background jobs never see it half done"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 # Optional MongoDB support: if MONGO_URI is set in environment, use MongoDB collections
 from dotenv import load_dotenv
@@ -15,10 +48,10 @@ except Exception as e:
 USE_MONGO = bool(os.getenv('MONGO_URI'))
 if USE_MONGO:
     try:
-        from db import books_col, users_col, borrow_col
+        from db import books_col, users_col, borrow_col, outbox_col, ledger_col, holds_col, analytics_col, archive_col
     except Exception:
         # Leave imports lazy; migration scripts may create db.py later
-        books_col = users_col = borrow_col = None
+        books_col = users_col = borrow_col = outbox_col = ledger_col = holds_col = analytics_col = archive_col = None
 
 
 class Book:
@@ -93,15 +126,16 @@ class User:
         return str(self.user_id)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_service.hash_password(password)
 
     def check_password(self, password):
         if not self.password_hash:
             return False
-        return check_password_hash(self.password_hash, password)
+        return password_service.verify_password(self.password_hash, password)
 
 class BorrowRecord:
-    def __init__(self, user_id, book_id, borrow_date, due_date, returned=False, fine_amount=0, fine_paid=False):
+    def __init__(self, user_id, book_id, borrow_date, due_date, returned=False, fine_amount=0, fine_paid=False, record_id=None, return_date=None):
+        self.record_id = record_id or uuid.uuid4().hex
         self.user_id = user_id
         self.book_id = book_id
         self.borrow_date = borrow_date
@@ -109,20 +143,23 @@ class BorrowRecord:
         self.returned = returned
         self.fine_amount = fine_amount
         self.fine_paid = fine_paid
+        self.return_date = return_date
     
     def to_dict(self):
         return {
+            'record_id': self.record_id,
             'user_id': self.user_id,
             'book_id': self.book_id,
             'borrow_date': self.borrow_date,
             'due_date': self.due_date,
             'returned': self.returned,
             'fine_amount': self.fine_amount,
-            'fine_paid': self.fine_paid
+            'fine_paid': self.fine_paid,
+            'return_date': self.return_date
         }
     
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, position=None):
         return cls(
             data['user_id'], 
             data['book_id'], 
@@ -130,21 +167,119 @@ class BorrowRecord:
             data['due_date'], 
             data.get('returned', False),
             data.get('fine_amount', 0),
-            data.get('fine_paid', False)
+            data.get('fine_paid', False),
+            data.get('record_id') or cls.legacy_id(data, position),
+            data.get('return_date')
         )
 
+    @staticmethod
+    def legacy_id(data, position):
+        """Stable id for records saved before record ids existed.
+
+        ``position`` tells apart loans of the same title by the same user on
+        the same day: the record's index in the JSON list or its Mongo _id.
+        """
+        return f"{data['user_id']}:{data['book_id']}:{data['borrow_date']}:{position}"
+
 
 class Library:
-    def __init__(self, data_file='library_data.json'):
+    def __init__(self, data_file='library_data.json', lazy=None):
         self.data_file = data_file
         self.books = {}
         self.users = {}
         self.borrow_records = []
         self.email_service = EmailService()
+        self.events = EventBroker()
+        self.notifier = NotificationDispatcher(self.email_service)
+        # Serializes persistence: background jobs save alongside request threads
+        self._lock = metrics.TimedLock(threading.RLock(), 'library')
         self.use_mongo = USE_MONGO
+        # Lazy mode (Mongo only, MONGO_LAZY): books and users are loaded on demand into a
+        # bounded LRU, borrow records stay in the database and aggregates run server-side
+        if lazy is None:
+            lazy = os.getenv('MONGO_LAZY', 'false').lower() in ('1', 'true', 'yes', 'on')
+        self.lazy = bool(lazy) and self.use_mongo and books_col is not None
+        # Emails queued by mutations; the web app starts the sender with outbox.start()
+        self.outbox = EmailOutbox(
+            self.email_service,
+            collection=outbox_col if self.use_mongo and books_col is not None else None,
+            path=os.getenv('OUTBOX_FILE', os.path.splitext(data_file)[0] + '_outbox.json')
+        )
+        self.ledger = NotificationLedger(
+            collection=ledger_col if self.use_mongo and books_col is not None else None
+        )
+        self.holds = HoldQueues(
+            collection=holds_col if self.use_mongo and books_col is not None else None
+        )
+        # Daily checkout/return counters for /api/analytics
+        self.analytics = CirculationRollups(
+            collection=analytics_col if self.use_mongo and books_col is not None else None
+        )
+        # Cold tier: settled loans move here and are not loaded with the working set
+        self.archive = RecordArchive(
+            os.getenv('ARCHIVE_FILE', os.path.splitext(data_file)[0] + '_archive.jsonl'),
+            collection=archive_col if self.use_mongo and books_col is not None else None
+        )
+        # Built from the full loan history by build_recommendations (the web app runs it at startup)
+        self.recommender = CoBorrowRecommender()
+        self._recommender_build = threading.Lock()
+        # Active loans by due date and returned loans by return date, for incremental sweeps
+        self.due_index = SortedIndex(lambda r: None if r.returned else r.due_date)
+        self.return_index = SortedIndex(lambda r: r.return_date if r.returned else None)
+        # Columnar fine state for every loan plus per-user unpaid totals
+        self.fines = FineEngine()
+        # Per-user active loans and unpaid fines, keyed by user id
+        self.accounts = {}
+        # Books with copies on the shelf, in title order
+        self.availability = AvailabilityIndex(enabled=not self.lazy)
         self.load_data()
+
+    @metrics.timed_operation('get_stats')
+    def get_stats(self):
+        """Dashboard counters, shared by /api/stats and the live event stream"""
+        if self.lazy:
+            total_books = books_col.count_documents({})
+            available_books = self.count_available_books()
+            return {
+                'total_books': total_books,
+                'total_users': users_col.count_documents({}),
+                'overdue_books': borrow_col.count_documents(
+                    {'returned': False, 'due_date': {'$lt': datetime.now().strftime('%Y-%m-%d')}}),
+                'available_books': available_books,
+                'borrowed_books': total_books - available_books
+            }
+        total_books = len(self.books)
+        available_books = len(self.availability)
+        return {
+            'total_books': total_books,
+            'total_users': len(self.users),
+            'overdue_books': len(self.get_overdue_books()),
+            'available_books': available_books,
+            'borrowed_books': total_books - available_books
+        }
+
+    def _publish_changes(self, *book_ids):
+        """Push availability/stat deltas to open dashboards (no-op when nobody listens)"""
+        if not self.events.has_subscribers():
+            return
+        for book_id in book_ids:
+            book = self.books.get(book_id)
+            if book:
+                self.events.publish('availability', {'book_id': book_id, 'available': book.available, 'quantity': book.quantity})
+            else:
+                self.events.publish('availability', {'book_id': book_id, 'deleted': True})
+        self.events.publish('stats', self.get_stats())
     
+    @metrics.timed_operation('save_data')
     def save_data(self):
+        with self._lock:
+            self._save_data()
+
+    def _save_data(self):
+        if self.lazy:
+            # Every change was already written through to its collection
+            return
+        started = time.perf_counter()
         # Save to MongoDB if enabled, otherwise to JSON file
         if getattr(self, 'use_mongo', False) and books_col is not None:
             # Upsert books
@@ -159,19 +294,37 @@ class Library:
             borrow_col.delete_many({})
             if self.borrow_records:
                 borrow_col.insert_many([r.to_dict() for r in self.borrow_records])
+            metrics.persist_seconds.observe(time.perf_counter() - started, 'mongo')
             return
 
         data = {
             'books': {book_id: book.to_dict() for book_id, book in self.books.items()},
             'users': {user_id: user.to_dict() for user_id, user in self.users.items()},
-            'borrow_records': [record.to_dict() for record in self.borrow_records]
+            'borrow_records': [record.to_dict() for record in self.borrow_records],
+            'notification_ledger': self.ledger.to_list(),
+            'holds': self.holds.to_list(),
+            'analytics': self.analytics.to_list()
         }
         with open(self.data_file, 'w') as f:
             json.dump(data, f, indent=4)
+            size = f.tell()
+        metrics.persist_seconds.observe(time.perf_counter() - started, 'json')
+        metrics.persist_bytes.inc(size, 'json')
+        metrics.persist_last_bytes.set(size, 'json')
     
+    @metrics.timed_operation('load_data')
     def load_data(self):
         # If MongoDB is enabled and available, load from collections
         if getattr(self, 'use_mongo', False) and books_col is not None:
+            self._backfill_record_ids()
+            if self.lazy:
+                max_entries = int(os.getenv('MONGO_CACHE_ENTRIES', '10000'))
+                self.books = LazyCollection(books_col, 'book_id', Book.from_dict, max_entries)
+                self.users = LazyCollection(users_col, 'user_id', User.from_dict, max_entries)
+                self.borrow_records = []
+                self.ledger.load(ledger_col.find())
+                self.holds.load(holds_col.find())
+                return
             # Load books
             try:
                 self.books = {}
@@ -198,7 +351,14 @@ class Library:
                     # Ensure IDs are strings
                     rdata['user_id'] = str(rdata.get('user_id'))
                     rdata['book_id'] = str(rdata.get('book_id'))
-                    self.borrow_records.append(BorrowRecord.from_dict(rdata))
+                    self.borrow_records.append(BorrowRecord.from_dict(rdata, doc.get('_id')))
+
+                self.ledger.load(ledger_col.find())
+                self.holds.load(holds_col.find())
+                # Rollups stay in analytics_daily and are queried there
+                if self.analytics.empty() and self.borrow_records:
+                    self.analytics.rebuild(self.borrow_records)
+                self._rebuild_indexes()
                 return
             except Exception:
                 # Fall back to JSON file if any Mongo error occurs
@@ -215,18 +375,106 @@ class Library:
                 self.users = {user_id: User.from_dict(user_data) 
                              for user_id, user_data in data.get('users', {}).items()}
                 
-                self.borrow_records = [BorrowRecord.from_dict(record_data) 
-                                      for record_data in data.get('borrow_records', [])]
+                self.borrow_records = [BorrowRecord.from_dict(record_data, position)
+                                      for position, record_data in enumerate(data.get('borrow_records', []))]
+
+                # Older data files kept the outbox inline; move it to its own file
+                outbox = self.outbox.read_file()
+                if outbox is None:
+                    self.outbox.load(data.get('outbox', []))
+                    self.outbox.save()
+                else:
+                    self.outbox.load(outbox)
+                self.ledger.load(data.get('notification_ledger', []))
+                self.holds.load(data.get('holds', []))
+                if 'analytics' in data:
+                    self.analytics.load(data['analytics'])
+                else:
+                    self.analytics.rebuild(self.borrow_records)
+        self._rebuild_indexes()
+
+    def _backfill_record_ids(self):
+        """Store the derived id on borrow documents saved before record ids existed.
+
+        Lazy mode never rewrites the collection, and its updates and deletes
+        match on record_id, so those documents must carry the id the loaders derive.
+        """
+        from pymongo import UpdateOne
+        updates = []
+        for doc in borrow_col.find({'record_id': None}, {'user_id': 1, 'book_id': 1, 'borrow_date': 1}):
+            rdata = {'user_id': str(doc.get('user_id')), 'book_id': str(doc.get('book_id')),
+                     'borrow_date': doc.get('borrow_date')}
+            updates.append(UpdateOne({'_id': doc['_id']},
+                                     {'$set': {'record_id': BorrowRecord.legacy_id(rdata, doc['_id'])}}))
+            if len(updates) >= 1000:
+                borrow_col.bulk_write(updates, ordered=False)
+                updates = []
+        if updates:
+            borrow_col.bulk_write(updates, ordered=False)
+
+    def _rebuild_indexes(self):
+        self.due_index.rebuild(self.borrow_records)
+        self.return_index.rebuild(self.borrow_records)
+        self.fines.rebuild(self.borrow_records)
+        self.availability.rebuild(self.books.values())
+        self.accounts = {}
+        for record in self.borrow_records:
+            self.get_account(record.user_id).track(record)
+
+    def _find_records(self, query, sort=None, limit=0):
+        """BorrowRecords matching a borrow collection query (lazy mode)"""
+        cursor = borrow_col.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        for doc in cursor:
+            rdata = {k: v for k, v in doc.items() if k != '_id'}
+            rdata['user_id'] = str(rdata.get('user_id'))
+            rdata['book_id'] = str(rdata.get('book_id'))
+            yield BorrowRecord.from_dict(rdata, doc.get('_id'))
+
+    def get_account(self, user_id):
+        if self.lazy:
+            # Built from the user's open loans and unpaid fines on every call; nothing is cached
+            account = UserAccount(user_id)
+            for record in self._find_records({'user_id': user_id, '$or': [
+                    {'returned': False}, {'fine_paid': False, 'fine_amount': {'$gt': 0}}]}):
+                account.track(record)
+            return account
+        account = self.accounts.get(user_id)
+        if account is None:
+            account = self.accounts[user_id] = UserAccount(user_id)
+        return account
+
+    def _track(self, record):
+        """Sync fine columns and the owner's account after a record was added or changed"""
+        if self.lazy:
+            borrow_col.update_one({'record_id': record.record_id},
+                                  {'$set': {'fine_amount': record.fine_amount, 'fine_paid': record.fine_paid}})
+            return
+        self.fines.update(record)
+        self.get_account(record.user_id).track(record)
+
+    def _untrack(self, record):
+        if self.lazy:
+            return
+        self.fines.remove(record)
+        self.get_account(record.user_id).untrack(record)
     
+    @metrics.timed_operation('add_book')
+    @_locked
     def add_book(self, title, author, isbn, quantity=1):
         # Create book and persist immediately
         book_id = str(len(self.books) + 1)
         book = Book(book_id, title, author, isbn, quantity)
         self.books[book_id] = book
+        self.availability.update(book)
         if getattr(self, 'use_mongo', False) and books_col is not None:
             books_col.update_one({'book_id': book.book_id}, {'$set': book.to_dict()}, upsert=True)
         else:
             self.save_data()
+        self._publish_changes(book_id)
         return book
     
     def get_book(self, book_id):
@@ -234,8 +482,25 @@ class Library:
     
     def get_all_books(self):
         return list(self.books.values())
+
+    @metrics.timed_operation('get_available_books')
+    def get_available_books(self, offset=0, limit=None):
+        """Books with a copy on the shelf, in title order"""
+        if self.lazy:
+            return self.books.find({'available': {'$gt': 0}}, sort=[('title', 1), ('book_id', 1)],
+                                   skip=offset, limit=limit or 0)
+        return self.availability.page(offset, limit)
+
+    def count_available_books(self):
+        if self.lazy:
+            return books_col.count_documents({'available': {'$gt': 0}})
+        return len(self.availability)
     
+    @metrics.timed_operation('search_books')
     def search_books(self, query):
+        if self.lazy:
+            pattern = {'$regex': re.escape(query), '$options': 'i'}
+            return self.books.find({'$or': [{'title': pattern}, {'author': pattern}, {'isbn': pattern}]})
         query = query.lower()
         results = []
         for book in self.books.values():
@@ -245,6 +510,8 @@ class Library:
                 results.append(book)
         return results
     
+    @metrics.timed_operation('update_book')
+    @_locked
     def update_book(self, book_id, title=None, author=None, isbn=None, quantity=None):
         book = self.books.get(book_id)
         if book:
@@ -256,21 +523,56 @@ class Library:
                 book.isbn = isbn
             if quantity is not None:
                 book.quantity = quantity
-                book.available = quantity - len([r for r in self.borrow_records 
-                                               if r.book_id == book_id and not r.returned])
-            self.save_data()
+                if self.lazy:
+                    on_loan = borrow_col.count_documents({'book_id': book_id, 'returned': False})
+                else:
+                    on_loan = len([r for r in self.borrow_records
+                                   if r.book_id == book_id and not r.returned])
+                # Copies set aside for ready holds are off the shelf too
+                book.available = max(0, quantity - on_loan - self.holds.ready_count(book_id))
+            self.availability.update(book)
+            if self.lazy:
+                books_col.update_one({'book_id': book_id}, {'$set': book.to_dict()})
+            else:
+                self.save_data()
+            self._publish_changes(book_id)
             return True
         return False
     
+    @metrics.timed_operation('delete_book')
+    @_locked
     def delete_book(self, book_id):
+        if self.lazy:
+            if not books_col.delete_one({'book_id': book_id}).deleted_count:
+                return False
+            del self.books[book_id]
+            self.holds.forget_book(book_id)
+            self.recommender.remove_book(book_id)
+            for r in self._find_records({'book_id': book_id}):
+                self.ledger.forget(r.record_id)
+            borrow_col.delete_many({'book_id': book_id})
+            self._publish_changes(book_id)
+            return True
         if book_id in self.books:
             del self.books[book_id]
+            self.availability.remove(book_id)
+            self.holds.forget_book(book_id)
+            self.recommender.remove_book(book_id)
             # Remove associated borrow records
+            for r in self.borrow_records:
+                if r.book_id == book_id:
+                    self.ledger.forget(r.record_id)
+                    self.due_index.remove(r)
+                    self.return_index.remove(r)
+                    self._untrack(r)
             self.borrow_records = [r for r in self.borrow_records if r.book_id != book_id]
             self.save_data()
+            self._publish_changes(book_id)
             return True
         return False
     
+    @metrics.timed_operation('add_user')
+    @_locked
     def add_user(self, name, email, phone):
         # Backwards-compatible add_user (no password) — creates a regular user
         user_id = str(len(self.users) + 1)
@@ -280,21 +582,30 @@ class Library:
             users_col.update_one({'user_id': user.user_id}, {'$set': user.to_dict()}, upsert=True)
         else:
             self.save_data()
+        self._publish_changes()
         return user
 
+    @metrics.timed_operation('add_user_with_password')
     def add_user_with_password(self, name, email, phone, password, role='user'):
-        user_id = str(len(self.users) + 1)
-        user = User(user_id, name, email, phone)
-        user.set_password(password)
-        user.role = role
-        self.users[user_id] = user
-        if getattr(self, 'use_mongo', False) and users_col is not None:
-            users_col.update_one({'user_id': user.user_id}, {'$set': user.to_dict()}, upsert=True)
-        else:
-            self.save_data()
+        # Hash before taking the lock: it can wait on the hashing pool for seconds
+        password_hash = password_service.hash_password(password)
+        with self._lock:
+            user_id = str(len(self.users) + 1)
+            user = User(user_id, name, email, phone)
+            user.password_hash = password_hash
+            user.role = role
+            self.users[user_id] = user
+            if getattr(self, 'use_mongo', False) and users_col is not None:
+                users_col.update_one({'user_id': user.user_id}, {'$set': user.to_dict()}, upsert=True)
+            else:
+                self.save_data()
+        self._publish_changes()
         return user
 
+    @metrics.timed_operation('get_user_by_email')
     def get_user_by_email(self, email):
+        if self.lazy:
+            return self.users.find_one({'email': email})
         # Try in-memory
         for u in self.users.values():
             if u.email == email:
@@ -312,13 +623,31 @@ class Library:
                 return user
         return None
     
+    def verify_user_password(self, user, password):
+        """Check a login password, upgrading the stored hash if the work factor changed"""
+        if not user.check_password(password):
+            return False
+        if password_service.needs_rehash(user.password_hash):
+            user.set_password(password)
+            if getattr(self, 'use_mongo', False) and users_col is not None:
+                users_col.update_one({'user_id': user.user_id}, {'$set': {'password_hash': user.password_hash}})
+            else:
+                self.save_data()
+        return True
+
     def get_user(self, user_id):
         return self.users.get(user_id)
     
     def get_all_users(self):
         return list(self.users.values())
     
+    @metrics.timed_operation('borrow_book')
+    @_locked
     def borrow_book(self, user_id, book_id, days=14):
+        self.expire_holds()
+        # A copy set aside for this user's hold is already off the shelf
+        hold = self.holds.find(user_id, book_id, status=('ready',))
+
         # If using MongoDB, perform atomic operations
         if getattr(self, 'use_mongo', False) and books_col is not None:
             # Ensure user exists
@@ -331,20 +660,24 @@ class Library:
             existing = borrow_col.find_one({'user_id': user_id, 'book_id': book_id, 'returned': False})
             if existing:
                 return False, "User already has this book"
+            if not self.get_account(user_id).can_borrow():
+                return False, "Loan limit reached"
 
             # Atomically decrement available if > 0
-            res = books_col.find_one_and_update(
-                {'book_id': book_id, 'available': {'$gt': 0}},
-                {'$inc': {'available': -1}},
-                return_document=True
-            )
-            if not res:
-                return False, "Book not available"
+            if hold is None:
+                res = books_col.find_one_and_update(
+                    {'book_id': book_id, 'available': {'$gt': 0}},
+                    {'$inc': {'available': -1}},
+                    return_document=True
+                )
+                if not res:
+                    return False, "Book not available. Place a hold to be notified when a copy is returned"
 
             borrow_date = datetime.now().strftime('%Y-%m-%d')
             due_date = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
 
             borrow_doc = {
+                'record_id': uuid.uuid4().hex,
                 'user_id': user_id,
                 'book_id': book_id,
                 'borrow_date': borrow_date,
@@ -356,19 +689,33 @@ class Library:
             borrow_col.insert_one(borrow_doc)
             users_col.update_one({'user_id': user_id}, {'$push': {'borrowed_books': book_id}})
 
-            # Update in-memory cache if loaded
-            if book_id in self.books:
-                self.books[book_id].available = max(0, self.books[book_id].available - 1)
-            if user_id in self.users:
-                self.users[user_id].borrowed_books.append(book_id)
+            if hold is not None:
+                self.holds.fulfill(hold)
+            if self.lazy:
+                # Drop the stale cached copies; the next read loads them again
+                del self.books[book_id]
+                del self.users[user_id]
+            else:
+                # Update in-memory cache if loaded
+                if hold is None and book_id in self.books:
+                    self.books[book_id].available = max(0, self.books[book_id].available - 1)
+                    self.availability.update(self.books[book_id])
+                if user_id in self.users:
+                    self.users[user_id].borrowed_books.append(book_id)
 
-            # Also record the borrow in in-memory borrow_records so app UI reflects changes
-            try:
-                self.borrow_records.append(BorrowRecord.from_dict(borrow_doc))
-            except Exception:
-                # Fallback: create BorrowRecord manually
-                self.borrow_records.append(BorrowRecord(user_id, book_id, borrow_date, due_date))
+                # Also record the borrow in in-memory borrow_records so app UI reflects changes
+                try:
+                    record = BorrowRecord.from_dict(borrow_doc)
+                except Exception:
+                    # Fallback: create BorrowRecord manually
+                    record = BorrowRecord(user_id, book_id, borrow_date, due_date, record_id=borrow_doc['record_id'])
+                self.borrow_records.append(record)
+                self.due_index.add(record)
+                self._track(record)
+            self.analytics.record_checkout(borrow_date, user_id, book_id)
+            self.recommender.add_loan(user_id, book_id)
 
+            self._publish_changes(book_id)
             return True, "Book borrowed successfully"
 
         # Fallback to JSON/in-memory behavior
@@ -378,83 +725,367 @@ class Library:
         if not user or not book:
             return False, "User or book not found"
 
-        if book.available <= 0:
-            return False, "Book not available"
+        if book.available <= 0 and hold is None:
+            return False, "Book not available. Place a hold to be notified when a copy is returned"
 
-        active_borrows = [r for r in self.borrow_records 
-                         if r.user_id == user_id and r.book_id == book_id and not r.returned]
-        if active_borrows:
+        account = self.get_account(user_id)
+        if account.has_loan(book_id):
             return False, "User already has this book"
+        if not account.can_borrow():
+            return False, "Loan limit reached"
 
         borrow_date = datetime.now().strftime('%Y-%m-%d')
         due_date = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')
 
         record = BorrowRecord(user_id, book_id, borrow_date, due_date)
         self.borrow_records.append(record)
-        book.available -= 1
+        self.due_index.add(record)
+        self._track(record)
+        self.analytics.record_checkout(borrow_date, user_id, book_id)
+        self.recommender.add_loan(user_id, book_id)
+        if hold is not None:
+            self.holds.fulfill(hold)
+        else:
+            book.available -= 1
+            self.availability.update(book)
         user.borrowed_books.append(book_id)
 
         self.save_data()
+        self._publish_changes(book_id)
         return True, "Book borrowed successfully"
     
+    def _shelve_copy(self, book_id):
+        """A copy came back: set it aside for the next holder, or put it back on the shelf"""
+        hold = self.holds.allocate(book_id)
+        book = self.books.get(book_id)
+        if hold is None:
+            if getattr(self, 'use_mongo', False) and books_col is not None:
+                books_col.update_one({'book_id': book_id}, {'$inc': {'available': 1}})
+                if self.lazy:
+                    del self.books[book_id]
+                    return None
+            if book:
+                book.available = min(book.quantity, book.available + 1)
+                self.availability.update(book)
+            return None
+
+        user = self.users.get(hold['user_id'])
+        if user and book:
+            self.outbox.enqueue('hold_ready', user_email=user.email, user_name=user.name,
+                                book_title=book.title, expires_at=hold['expires_at'])
+        return hold
+
+    @metrics.timed_operation('place_hold')
+    @_locked
+    def place_hold(self, user_id, book_id):
+        """Join the book's hold queue; returns (success, message, hold)"""
+        self.expire_holds()
+        user = self.users.get(user_id)
+        book = self.books.get(book_id)
+        if not user or not book:
+            return False, "User or book not found", None
+        if book.available > 0:
+            return False, "Book is available, borrow it instead", None
+        if self.get_account(user_id).has_loan(book_id):
+            return False, "User already has this book", None
+        try:
+            hold = self.holds.place(user_id, book_id)
+        except HoldError as e:
+            return False, str(e), None
+        if not (getattr(self, 'use_mongo', False) and books_col is not None):
+            self.save_data()
+        position = self.holds.position(hold)
+        return True, f"Hold placed. You are number {position} in the queue", hold
+
+    @metrics.timed_operation('cancel_hold')
+    @_locked
+    def cancel_hold(self, hold_id):
+        hold = self.holds.get(hold_id)
+        if not hold:
+            return False
+        if self.holds.cancel(hold):
+            self._shelve_copy(hold['book_id'])
+            self._publish_changes(hold['book_id'])
+        if not (getattr(self, 'use_mongo', False) and books_col is not None):
+            self.save_data()
+        return True
+
+    @_locked
+    def expire_holds(self, now=None):
+        """Pass copies whose pickup window closed on to the next holder; returns the number expired"""
+        expired = self.holds.pop_expired(now)
+        for hold in expired:
+            self._shelve_copy(hold['book_id'])
+        if expired:
+            if not (getattr(self, 'use_mongo', False) and books_col is not None):
+                self.save_data()
+            self._publish_changes(*{hold['book_id'] for hold in expired})
+            logger.info("Holds expired", extra={'expired': len(expired)})
+        return len(expired)
+
+    def get_user_holds(self, user_id):
+        holds = self.holds.for_user(user_id)
+        for hold in holds:
+            book = self.books.get(hold['book_id'])
+            hold['book_title'] = book.title if book else None
+        return holds
+
+    @metrics.timed_operation('get_circulation_summary')
+    def get_circulation_summary(self, start, end):
+        """Checkouts, returns, average loan length and turnover for a date range"""
+        summary = self.analytics.summary(start, end)
+        if self.lazy:
+            totals = next(books_col.aggregate([{'$group': {
+                '_id': None, 'copies': {'$sum': '$quantity'}, 'available': {'$sum': '$available'}}}]), None) or {}
+            copies, available = totals.get('copies', 0), totals.get('available', 0)
+        else:
+            copies = sum(book.quantity for book in self.books.values())
+            available = sum(book.available for book in self.books.values())
+        summary['turnover'] = round(summary['checkouts'] / copies, 3) if copies else None
+        summary['on_loan'] = copies - available
+        return summary
+
+    def get_book_analytics(self, start, end, limit=10):
+        """Most borrowed titles in a date range with turnover and utilization"""
+        range_days = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).days + 1
+        rows = []
+        for book_id, counts in self.analytics.totals_by('books', start, end).items():
+            book = self.books.get(book_id)
+            quantity = book.quantity if book and book.quantity else 1
+            rows.append({
+                'book_id': book_id,
+                'title': book.title if book else None,
+                'checkouts': counts['checkouts'],
+                'returns': counts['returns'],
+                'average_loan_days': round(counts['loan_days'] / counts['returns'], 2) if counts['returns'] else None,
+                'turnover': round(counts['checkouts'] / quantity, 3),
+                # Share of copy-days in the range spent on loan (returned loans only)
+                'utilization': round(min(1.0, counts['loan_days'] / (quantity * range_days)), 3)
+            })
+        rows.sort(key=lambda r: (-r['checkouts'], r['book_id']))
+        return rows[:limit] if limit else rows
+
+    def get_user_analytics(self, start, end, limit=10):
+        """Most active borrowers in a date range"""
+        rows = []
+        for user_id, counts in self.analytics.totals_by('users', start, end).items():
+            user = self.users.get(user_id)
+            rows.append({
+                'user_id': user_id,
+                'name': user.name if user else None,
+                'checkouts': counts['checkouts'],
+                'returns': counts['returns'],
+                'average_loan_days': round(counts['loan_days'] / counts['returns'], 2) if counts['returns'] else None
+            })
+        rows.sort(key=lambda r: (-r['checkouts'], r['user_id']))
+        return rows[:limit] if limit else rows
+
     def calculate_fine(self, due_date):
         """Calculate fine for overdue book"""
-        today = datetime.now().date()
-        due_date_obj = datetime.strptime(due_date, '%Y-%m-%d').date()
-        
-        if today <= due_date_obj:
-            return 0
-        
-        days_overdue = (today - due_date_obj).days
-        fine_per_day = 5  
-        return days_overdue * fine_per_day
+        return fine_policy.fine_for(due_date)
+
+    @metrics.timed_operation('accrue_fines')
+    @_locked
+    def accrue_fines(self, today=None):
+        """Bring every active loan's fine up to date in one pass; returns the number of loans changed"""
+        if self.lazy:
+            return self._accrue_fines_server(today)
+        started = time.perf_counter()
+        changed = self.fines.accrue(today)
+        accrued = time.perf_counter()
+        use_mongo = getattr(self, 'use_mongo', False) and books_col is not None
+        updates = []
+        for record_id, amount in self.fines.changes(changed):
+            record = self.due_index.get(record_id)
+            if record is not None:
+                record.fine_amount = amount
+                self.get_account(record.user_id).track(record)
+            if use_mongo:
+                updates.append((record_id, amount))
+
+        if updates:
+            from pymongo import UpdateOne
+            for i in range(0, len(updates), 1000):
+                borrow_col.bulk_write([UpdateOne({'record_id': record_id}, {'$set': {'fine_amount': amount}})
+                                      for record_id, amount in updates[i:i + 1000]], ordered=False)
+        elif changed and not use_mongo:
+            self.save_data()
+        logger.info("Fines accrued", extra={
+            'loans': len(self.fines), 'changed': len(changed),
+            'accrual_ms': round((accrued - started) * 1000, 2),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
+        return len(changed)
     
-    def check_and_send_overdue_notifications(self, send_overdue=True, send_reminders=True):
-        """Check for overdue books and send notifications with options"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        overdue_notifications_sent = 0
-        reminder_notifications_sent = 0
-        
-        print(f"🔔 Starting notification process...")
-        print(f"   Overdue notifications: {'ENABLED' if send_overdue else 'DISABLED'}")
-        print(f"   Reminder notifications: {'ENABLED' if send_reminders else 'DISABLED'}")
+    def _accrue_fines_server(self, today=None):
+        """Lazy-mode accrual: stream overdue loans from the collection and bulk-write changed fines"""
+        from pymongo import UpdateOne
+        today = today or datetime.now().date()
+        with log_duration(logger, "Fines accrued") as fields:
+            overdue = borrow_col.find({'returned': False, 'due_date': {'$lt': today.isoformat()}},
+                                      {'_id': 1, 'due_date': 1, 'fine_amount': 1})
+            updates, changed = [], 0
+            for doc in overdue:
+                amount = fine_policy.fine_for(doc['due_date'], today)
+                if amount != doc.get('fine_amount', 0):
+                    updates.append(UpdateOne({'_id': doc['_id']}, {'$set': {'fine_amount': amount}}))
+                if len(updates) >= 1000:
+                    borrow_col.bulk_write(updates, ordered=False)
+                    changed += len(updates)
+                    updates = []
+            if updates:
+                borrow_col.bulk_write(updates, ordered=False)
+                changed += len(updates)
+            fields['changed'] = changed
+        return changed
+
+    @metrics.timed_operation('check_and_send_overdue_notifications')
+    def check_and_send_overdue_notifications(self, send_overdue=True, send_reminders=True, job=None, digest=None, records=None):
+        """Check for overdue books and send notifications with options.
+
+        In digest mode (the default, see NOTIFICATION_DIGEST) loans are grouped
+        by user and each user gets one email covering all of them. Loans the
+        notification ledger says were notified recently are skipped. ``records``
+        limits the sweep to those loans instead of every borrow record.
+        """
+        if digest is None:
+            digest = os.getenv('NOTIFICATION_DIGEST', 'true').lower() in ('1', 'true', 'yes', 'on')
         
-        for record in self.borrow_records:
-            if not record.returned:
-                due_date_obj = datetime.strptime(record.due_date, '%Y-%m-%d').date()
-                today_obj = datetime.now().date()
-                days_until_due = (due_date_obj - today_obj).days
-                
-                user = self.users.get(record.user_id)
-                book = self.books.get(record.book_id)
+        started = time.perf_counter()
+        today_obj = datetime.now().date()
+        messages = []
+        digests = {}
+        skipped = 0
+
+        def mark_sent(kind, record):
+            return lambda: self.ledger.mark_sent(record.record_id, kind, record.due_date, today_obj)
+
+        # Collect under the lock (fines and accounts change here); emails go out after it is released
+        with self._lock:
+            if records is None and self.lazy:
+                # Only loans due within the reminder window can produce a notification
+                window_end = (today_obj + timedelta(days=4)).isoformat()
+                records = self._find_records({'returned': False, 'due_date': {'$lt': window_end}})
+
+            # Snapshot: the sweep may run on a background thread while requests mutate the list
+            for record in list(self.borrow_records if records is None else records):
+                if not record.returned:
+                    due_date_obj = datetime.strptime(record.due_date, '%Y-%m-%d').date()
+                    days_until_due = (due_date_obj - today_obj).days
                 
-                if user and book:
                     if days_until_due < 0 and send_overdue:
-                        record.fine_amount = self.calculate_fine(record.due_date)
-                        if self.email_service.send_overdue_notification(
-                            user.email, user.name, book.title, 
-                            record.due_date, record.borrow_date
-                        ):
-                            overdue_notifications_sent += 1
-                    
+                        kind = 'overdue'
                     elif 0 <= days_until_due <= 3 and send_reminders:
-                        if self.email_service.send_reminder_notification(
-                            user.email, user.name, book.title,
-                            record.due_date, record.borrow_date
-                        ):
-                            reminder_notifications_sent += 1
+                        kind = 'reminder'
+                    else:
+                        continue
+                
+                    user = self.users.get(record.user_id)
+                    book = self.books.get(record.book_id)
+                    if not user or not book:
+                        continue
+                
+                    if kind == 'overdue':
+                        record.fine_amount = self.calculate_fine(record.due_date)
+                        self._track(record)
+                    if not self.ledger.should_send(record.record_id, kind, record.due_date, today_obj):
+                        skipped += 1
+                        continue
+                
+                    if digest:
+                        entry = digests.setdefault(user.user_id, (user, [], [], []))
+                        entry[3].append((kind, record))
+                        if kind == 'overdue':
+                            entry[1].append({
+                                'title': book.title, 'borrow_date': record.borrow_date,
+                                'due_date': record.due_date, 'fine_amount': record.fine_amount
+                            })
+                        else:
+                            entry[2].append({
+                                'title': book.title, 'borrow_date': record.borrow_date,
+                                'due_date': record.due_date, 'days_until_due': days_until_due
+                            })
+                    elif kind == 'overdue':
+                        messages.append(Message('overdue', self.email_service.send_overdue_notification,
+                                                (user.email, user.name, book.title, record.due_date, record.borrow_date),
+                                                on_sent=mark_sent('overdue', record)))
+                    else:
+                        messages.append(Message('reminder', self.email_service.send_reminder_notification,
+                                                (user.email, user.name, book.title, record.due_date, record.borrow_date),
+                                                on_sent=mark_sent('reminder', record)))
         
-        self.save_data()
+        for user, overdue, reminders, covered in digests.values():
+            def on_sent(covered=covered):
+                for kind, r in covered:
+                    self.ledger.mark_sent(r.record_id, kind, r.due_date, today_obj)
+            messages.append(Message('digest', self.email_service.send_digest_notification,
+                                    (user.email, user.name, overdue, reminders),
+                                    counts={'overdue': len(overdue), 'reminder': len(reminders)},
+                                    on_sent=on_sent))
         
-        print(f"📊 Notification results:")
-        print(f"   Overdue notifications sent: {overdue_notifications_sent}")
-        print(f"   Reminder notifications sent: {reminder_notifications_sent}")
+        job = self.notifier.dispatch(messages, job)
+        self.save_data()
         
-        return {
+        overdue_notifications_sent = job.sent.get('overdue', 0)
+        reminder_notifications_sent = job.sent.get('reminder', 0)
+        results = {
             'overdue_notifications': overdue_notifications_sent,
-            'reminder_notifications': reminder_notifications_sent
+            'reminder_notifications': reminder_notifications_sent,
+            'skipped': skipped,
+            'emails_sent': job.messages_sent,
+            'failed': job.failed
         }
+        # One summary line per sweep; per-message detail is logged at DEBUG by EmailService
+        logger.info("Notification sweep finished", extra=dict(
+            results, send_overdue=send_overdue, send_reminders=send_reminders, digest=digest,
+            duration_ms=round((time.perf_counter() - started) * 1000, 2)
+        ))
+        return results
+    
+    def incremental_notification_sweep(self, since, today=None, send_overdue=True, send_reminders=True, digest=None):
+        """Notify only loans whose due state changed since the ``since`` watermark date.
+
+        Candidates come from the due-date index: loans that became overdue
+        (due in [since, today)), loans that entered the reminder window
+        (due before today + 4) and overdue loans the ledger says are due for a
+        resend. Loans returned since the watermark have their ledger entries
+        dropped. The ledger still filters out anything already notified.
+        """
+        today = today or datetime.now().date()
+        with self._lock:
+            window_end = (today + timedelta(days=4)).isoformat()
+            if self.lazy:
+                due = {'$lt': window_end}
+                if since is not None:
+                    due['$gte'] = since
+                candidates = {r.record_id: r for r in self._find_records({'returned': False, 'due_date': due})}
+                if send_overdue:
+                    resend = list(self.ledger.due_for_resend('overdue', today))
+                    candidates.update((r.record_id, r) for r in self._find_records(
+                        {'returned': False, 'record_id': {'$in': resend}}))
+                returned = list(self._find_records(
+                    {'returned': True} if since is None else {'returned': True, 'return_date': {'$gte': since}}))
+            else:
+                candidates = {r.record_id: r for r in self.due_index.between(since, window_end)}
+                if send_overdue:
+                    for record_id in self.ledger.due_for_resend('overdue', today):
+                        record = self.due_index.get(record_id)
+                        if record is not None:
+                            candidates[record_id] = record
+                returned = self.return_index.between(since, None)
+            for record in returned:
+                self.ledger.forget(record.record_id)
+
+        results = self.check_and_send_overdue_notifications(
+            send_overdue=send_overdue, send_reminders=send_reminders,
+            digest=digest, records=list(candidates.values())
+        )
+        results['candidates'] = len(candidates)
+        results['returned'] = len(returned)
+        return results
     
+    @metrics.timed_operation('return_book')
+    @_locked
     def return_book(self, user_id, book_id):
         # Mongo-backed return (atomic-ish)
         if getattr(self, 'use_mongo', False) and books_col is not None:
@@ -469,26 +1100,42 @@ class Library:
 
             # Mark returned and calculate fine
             fine_amount = self.calculate_fine(record.get('due_date'))
-            borrow_col.update_one({'_id': record['_id']}, {'$set': {'returned': True, 'fine_amount': fine_amount, 'fine_paid': fine_amount == 0}})
+            return_date = datetime.now().strftime('%Y-%m-%d')
+            borrow_col.update_one({'_id': record['_id']}, {'$set': {'returned': True, 'fine_amount': fine_amount, 'fine_paid': fine_amount == 0, 'return_date': return_date}})
 
-            books_col.update_one({'book_id': book_id}, {'$inc': {'available': 1}})
+            self._shelve_copy(book_id)
+            self.analytics.record_return(return_date, user_id, book_id,
+                                         loan_days(record.get('borrow_date', return_date), return_date))
             users_col.update_one({'user_id': user_id}, {'$pull': {'borrowed_books': book_id}})
+            record_id = record.get('record_id') or BorrowRecord.legacy_id(record, record['_id'])
+            self.ledger.forget(record_id)
+
+            # Keep the in-memory record and indexes in step with the collection
+            cached = self.due_index.get(record_id)
+            if cached is not None:
+                self.due_index.remove(cached)
+                cached.returned = True
+                cached.fine_amount = fine_amount
+                cached.fine_paid = fine_amount == 0
+                cached.return_date = return_date
+                self.return_index.add(cached)
+                self._track(cached)
 
             # Update in-memory cache if loaded
-            if book_id in self.books:
-                self.books[book_id].available = min(self.books[book_id].quantity, self.books[book_id].available + 1)
-            if user_id in self.users and book_id in self.users[user_id].borrowed_books:
+            if self.lazy:
+                del self.users[user_id]
+            elif user_id in self.users and book_id in self.users[user_id].borrowed_books:
                 try:
                     self.users[user_id].borrowed_books.remove(book_id)
                 except ValueError:
                     pass
 
-            # Send email
-            if fine_amount > 0:
-                self.email_service.send_return_confirmation(user_doc.get('email', ''), user_doc.get('name', ''), book_doc.get('title', ''), fine_amount)
-            else:
-                self.email_service.send_return_confirmation(user_doc.get('email', ''), user_doc.get('name', ''), book_doc.get('title', ''))
+            # Queue the confirmation; the outbox sender delivers it off the request path
+            self.outbox.enqueue('return_confirmation', user_email=user_doc.get('email', ''),
+                                user_name=user_doc.get('name', ''), book_title=book_doc.get('title', ''),
+                                fine_paid=fine_amount)
 
+            self._publish_changes(book_id)
             return True, f"Book returned successfully. Fine: Rs {fine_amount:.2f}" if fine_amount > 0 else "Book returned successfully"
 
         # Fallback: in-memory/json
@@ -503,34 +1150,40 @@ class Library:
                 record.book_id == book_id and 
                 not record.returned):
                 
+                self.due_index.remove(record)
                 record.returned = True
-                book.available += 1
+                record.return_date = datetime.now().strftime('%Y-%m-%d')
+                self.return_index.add(record)
+                self._shelve_copy(book_id)
+                self.analytics.record_return(record.return_date, user_id, book_id,
+                                             loan_days(record.borrow_date, record.return_date))
                 
                 fine_amount = self.calculate_fine(record.due_date)
                 record.fine_amount = fine_amount
                 
                 if book_id in user.borrowed_books:
                     user.borrowed_books.remove(book_id)
+                self.ledger.forget(record.record_id)
                 
                 if fine_amount > 0:
                     record.fine_paid = True
-                    self.email_service.send_return_confirmation(
-                        user.email, user.name, book.title, fine_amount
-                    )
-                else:
-                    self.email_service.send_return_confirmation(
-                        user.email, user.name, book.title
-                    )
+                self._track(record)
+                
+                # Queue the confirmation; the outbox sender delivers it off the request path
+                self.outbox.enqueue('return_confirmation', user_email=user.email,
+                                    user_name=user.name, book_title=book.title,
+                                    fine_paid=fine_amount)
                 
                 self.save_data()
+                self._publish_changes(book_id)
                 return True, f"Book returned successfully. Fine: Rs {fine_amount:.2f}" if fine_amount > 0 else "Book returned successfully"
 
         return False, "No active borrow record found"
     
+    @metrics.timed_operation('get_user_borrowed_books')
     def get_user_borrowed_books(self, user_id):
-        user_records = [r for r in self.borrow_records if r.user_id == user_id and not r.returned]
         borrowed_books = []
-        for record in user_records:
+        for record in self.get_account(user_id).active_loans:
             book = self.books.get(record.book_id)
             if book:
                 borrowed_books.append({
@@ -540,10 +1193,13 @@ class Library:
                 })
         return borrowed_books
     
+    @metrics.timed_operation('get_overdue_books')
     def get_overdue_books(self):
         today = datetime.now().strftime('%Y-%m-%d')
         overdue = []
-        for record in self.borrow_records:
+        records = (self._find_records({'returned': False, 'due_date': {'$lt': today}})
+                   if self.lazy else self.borrow_records)
+        for record in records:
             if not record.returned and record.due_date < today:
                 book = self.books.get(record.book_id)
                 user = self.users.get(record.user_id)
@@ -556,22 +1212,209 @@ class Library:
                     })
         return overdue
 
+    def get_due_soon_books(self, days=3):
+        """Active loans due between today and ``days`` from now, soonest first"""
+        today = datetime.now().date()
+        start, end = today.isoformat(), (today + timedelta(days=days + 1)).isoformat()
+        if self.lazy:
+            records = self._find_records({'returned': False, 'due_date': {'$gte': start, '$lt': end}},
+                                         sort=[('due_date', 1)])
+        else:
+            records = self.due_index.between(start, end)
+        due_soon = []
+        for record in records:
+            book = self.books.get(record.book_id)
+            user = self.users.get(record.user_id)
+            if book and user:
+                due_soon.append({
+                    'book': book,
+                    'user': user,
+                    'borrow_date': record.borrow_date,
+                    'due_date': record.due_date,
+                    'days_until_due': (datetime.strptime(record.due_date, '%Y-%m-%d').date() - today).days
+                })
+        return due_soon
+
+    @metrics.timed_operation('archive_settled_records')
+    @_locked
+    def archive_settled_records(self, older_than_days=None, today=None):
+        """Move returned, fully settled loans older than the threshold to the archive.
+
+        Candidates come from the return-date index. A loan is settled once it is
+        returned and its fine is zero or paid. Returns the number archived.
+        Runs on the web app's scheduler thread under the library lock, so the
+        archived loans leave the same in-memory list that later saves write.
+        """
+        if older_than_days is None:
+            older_than_days = int(os.getenv('ARCHIVE_AFTER_DAYS', '180'))
+        today = today or datetime.now().date()
+        cutoff = (today - timedelta(days=older_than_days)).isoformat()
+        returned = (self._find_records({'returned': True, 'return_date': {'$lt': cutoff}})
+                    if self.lazy else self.return_index.between(None, cutoff))
+        settled = [r for r in returned if r.fine_paid or not r.fine_amount]
+        if not settled:
+            return 0
+
+        if getattr(self, 'use_mongo', False) and books_col is not None:
+            ids = [r.record_id for r in settled]
+            borrow_col.delete_many({'record_id': {'$in': ids}})
+            # Only loans that really left the collection go to the archive, so a
+            # document the delete missed is never archived twice
+            kept = {doc['record_id'] for doc in borrow_col.find({'record_id': {'$in': ids}}, {'record_id': 1})}
+            settled = [r for r in settled if r.record_id not in kept]
+        self.archive.append(r.to_dict() for r in settled)
+        archived = {r.record_id for r in settled}
+        for record in settled:
+            self.ledger.forget(record.record_id)
+        if not self.lazy:
+            self.borrow_records = [r for r in self.borrow_records if r.record_id not in archived]
+            if not (getattr(self, 'use_mongo', False) and books_col is not None):
+                self._save_data()
+            # Compacts the fine columns and drops the archived loans from every index
+            self._rebuild_indexes()
+        logger.info("Archived settled borrow records", extra={'archived': len(settled), 'cutoff': cutoff})
+        return len(settled)
+
+    @metrics.timed_operation('get_borrow_history')
+    def get_borrow_history(self, user_id=None, book_id=None, limit=100):
+        """Loans of a user or a book, working set first, then the archive; most recent first"""
+        if self.lazy:
+            query = {'user_id': user_id} if user_id is not None else {'book_id': book_id}
+            hot = [r.to_dict() for r in self._find_records(query, sort=[('borrow_date', -1)], limit=limit or 0)]
+        else:
+            hot = [r.to_dict() for r in self.borrow_records
+                   if (user_id is not None and r.user_id == user_id) or (book_id is not None and r.book_id == book_id)]
+        hot.sort(key=lambda r: r['borrow_date'], reverse=True)
+        if limit and len(hot) >= limit:
+            return hot[:limit]
+        cold = self.archive.history(user_id=user_id, book_id=book_id,
+                                    limit=limit - len(hot) if limit else None)
+        return hot + cold
+
+    def build_recommendations(self, wait=True):
+        """Build the co-borrowing matrix and warm the neighbor lists of the most borrowed titles.
+
+        Returns False without building when another thread is already building
+        and ``wait`` is off.
+        """
+        if not self._recommender_build.acquire(blocking=wait):
+            return False
+        try:
+            if self.recommender.built:
+                return True
+            with log_duration(logger, "Recommendations built") as fields:
+                loans = list(self.archive.iter_loans())
+                if self.lazy:
+                    loans.extend((str(doc['user_id']), str(doc['book_id']))
+                                 for doc in borrow_col.find({}, {'user_id': 1, 'book_id': 1, '_id': 0}))
+                else:
+                    loans.extend((r.user_id, r.book_id) for r in list(self.borrow_records))
+                self.recommender.rebuild(loans)
+                popular = Counter(book_id for _, book_id in loans).most_common(self.recommender.warm_titles)
+                self.recommender.warm(book_id for book_id, _ in popular)
+                fields.update(loans=len(loans), warmed=len(popular))
+            return True
+        finally:
+            self._recommender_build.release()
+
+    @metrics.timed_operation('get_recommendations')
+    def get_recommendations(self, book_id, limit=5):
+        """Books most often borrowed by readers of ``book_id``"""
+        # Nothing to suggest while the startup build is still running
+        if not self.build_recommendations(wait=False):
+            return []
+        books = []
+        for other, _ in self.recommender.neighbors(book_id):
+            book = self.books.get(other)
+            if book:
+                books.append(book)
+                if len(books) >= limit:
+                    break
+        return books
+
+    @metrics.timed_operation('get_user_recommendations')
+    def get_user_recommendations(self, user_id, limit=5):
+        """Books co-borrowed with the user's recent titles that they have not borrowed yet"""
+        if not self.build_recommendations(wait=False):
+            return []
+        history = self.recommender.history(user_id)
+        seen = set(history)
+        scores = Counter()
+        for book_id in history[-20:]:
+            for other, count in self.recommender.neighbors(book_id):
+                if other not in seen and other in self.books:
+                    scores[other] += count
+        return [self.books[book_id] for book_id, _ in scores.most_common(limit)]
+
+    @metrics.timed_operation('get_user_fines')
     def get_user_fines(self, user_id):
         """Get total fines for a user"""
-        total_fine = 0
-        for record in self.borrow_records:
-            if record.user_id == user_id and not record.fine_paid:
-                total_fine += record.fine_amount
-        return total_fine
+        if self.lazy:
+            return self.get_account(user_id).fine_total
+        return self.fines.user_total(user_id)
+
+    @metrics.timed_operation('get_user_fine_details')
+    def get_user_fine_details(self, user_id):
+        """Itemized unpaid fines for a user"""
+        fine_details = []
+        for record in self.get_account(user_id).unpaid_fines:
+            book = self.books.get(record.book_id)
+            if book:
+                fine_details.append({
+                    'book_id': record.book_id,
+                    'book_title': book.title,
+                    'fine_amount': record.fine_amount,
+                    'due_date': record.due_date,
+                    'returned': record.returned
+                })
+        return fine_details
     
+    @metrics.timed_operation('pay_fine')
+    @_locked
     def pay_fine(self, user_id, book_id):
         """Mark fine as paid for a specific book"""
-        for record in self.borrow_records:
-            if (record.user_id == user_id and 
-                record.book_id == book_id and 
-                record.fine_amount > 0 and 
-                not record.fine_paid):
+        for record in self.get_account(user_id).unpaid_fines:
+            if record.book_id == book_id:
                 record.fine_paid = True
+                self._track(record)
                 self.save_data()
                 return True
-        return False
\ No newline at end of file
+        return False
+
+    def memory_structures(self):
+        """In-memory structures accounted for by /api/memory, primary data first"""
+        return {
+            'books': self.books,
+            'users': self.users,
+            'borrow_records': self.borrow_records,
+            'accounts': self.accounts,
+            'due_index': self.due_index,
+            'return_index': self.return_index,
+            'fines': self.fines,
+            'availability': self.availability,
+            'holds': self.holds,
+            'ledger': self.ledger,
+            'outbox': self.outbox,
+            'analytics': self.analytics,
+            'archive_index': self.archive,
+            'recommender': self.recommender
+        }
+
+    def borrowed_books_stats(self):
+        """Entries in User.borrowed_books against open loans; a growing gap means the lists leak"""
+        if self.lazy:
+            return None
+        lengths = [len(user.borrowed_books) for user in list(self.users.values())]
+        return {
+            'entries': sum(lengths),
+            'max_per_user': max(lengths, default=0),
+            'open_loans': len(self.due_index)
+        }
+
+    def cache_stats(self):
+        """Hit/miss counters of the in-process caches"""
+        stats = {'lazy': self.lazy, 'recommendations': self.recommender.stats()}
+        if self.lazy:
+            stats['books'] = self.books.stats()
+            stats['users'] = self.users.stats()
+        return stats
@@ -0,0 +1,95 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextlib import contextmanager
+
+
+# Attributes every LogRecord has; anything else came in through ``extra=`` and
+# is emitted as a structured field
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS and not k.startswith('_')}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message plus extra fields"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(_fields(record))
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Human-readable line with extra fields appended as key=value pairs"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return line
+
+
+def setup_logging():
+    """Route library logs through a queue to a background writer thread.
+
+    Callers only pay for putting the record on an in-memory queue; formatting
+    and the stdout/stderr write happen on the listener thread. Configure with
+    LOG_LEVEL (default INFO) and LOG_FORMAT ('text' or 'json'). Safe to call
+    more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stderr)
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        stream.setFormatter(JSONFormatter())
+    else:
+        stream.setFormatter(KeyValueFormatter())
+
+    log_queue = queue.Queue(-1)
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+@contextmanager
+def log_duration(logger, message, level=logging.INFO, **fields):
+    """Log ``message`` with ``duration_ms`` once the block finishes; the yielded dict adds fields.
+
+    If the block raises, the line is still logged, with the exception type in ``error``.
+    """
+    started = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields['error'] = type(e).__name__
+        raise
+    finally:
+        fields['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        logger.log(level, message, extra=fields)
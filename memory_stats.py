@@ -0,0 +1,228 @@
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Containers bigger than this are sized from a sample of their items
+SAMPLE_SIZE = int(os.getenv('MEMORY_SAMPLE_ITEMS', '200'))
+
+_CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+_local_types = {}
+
+
+def _is_local(cls):
+    """Classes defined in this repository; third-party objects (clients, locks, ...) are not walked"""
+    local = _local_types.get(cls)
+    if local is None:
+        module = sys.modules.get(cls.__module__)
+        path = getattr(module, '__file__', None) or ''
+        local = _local_types[cls] = os.path.abspath(path).startswith(ROOT + os.sep)
+    return local
+
+
+def _children(obj):
+    # Request threads keep mutating these containers; list() copies them in one
+    # step under the GIL, so walking the copy never sees a size change
+    if isinstance(obj, dict):
+        return list(obj.keys()), list(obj.values())
+    if isinstance(obj, _CONTAINERS):
+        return (list(obj),)
+    if _is_local(type(obj)):
+        parts = []
+        if hasattr(obj, '__dict__'):
+            parts.append(list(vars(obj).values()))
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                parts.append((getattr(obj, slot),))
+        return parts
+    return ()
+
+
+def deep_size(obj, seen):
+    """Approximate bytes reachable from ``obj`` not already in ``seen``.
+
+    Large containers are sampled: the sampled items' average size is
+    extrapolated to the whole container, so sizing a million-record list
+    costs the same as sizing a few hundred.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, array)) or obj is None:
+        return size
+    for group in _children(obj):
+        count = len(group)
+        if count > SAMPLE_SIZE:
+            step = count // SAMPLE_SIZE
+            sample = [item for i, item in enumerate(group) if i % step == 0][:SAMPLE_SIZE]
+            size += int(sum(deep_size(item, seen) for item in sample) / len(sample) * count)
+        else:
+            size += sum(deep_size(item, seen) for item in group)
+    return size
+
+
+def count_of(obj):
+    stats = getattr(obj, 'stats', None)
+    if stats is not None and hasattr(obj, 'max_entries'):
+        # LazyCollection: len() would ask the database; report the cached entries
+        return stats()['entries']
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def process_memory():
+    """Resident and peak memory of this process in bytes (None where unavailable)"""
+    rss = None
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    peak = None
+    try:
+        import resource
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    except ImportError:
+        pass
+    return {'rss_bytes': rss, 'peak_rss_bytes': peak, 'gc_counts': gc.get_count()}
+
+
+class MemoryTracker:
+    """Per-structure memory accounting with a rolling history and tracemalloc diffs.
+
+    ``structures`` is a callable returning {name: object}; it is called on
+    every report so rebuilt indexes are picked up. Structures are sized in
+    the given order with one shared ``seen`` set, so an object reachable from
+    two of them (a BorrowRecord in borrow_records and in the due-date index)
+    is counted once, under the first.
+    """
+
+    def __init__(self, structures, history_size=None):
+        self.structures = structures
+        self.history = deque(maxlen=history_size or int(os.getenv('MEMORY_HISTORY', '288')))
+        self.interval = float(os.getenv('MEMORY_SAMPLE_SECONDS', '0'))
+        self._baseline = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def measure(self):
+        started = time.perf_counter()
+        seen = set()
+        structures = {}
+        for name, obj in self.structures().items():
+            structures[name] = {'count': count_of(obj), 'bytes': deep_size(obj, seen)}
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'process': process_memory(),
+            'structures': structures,
+            'estimated_bytes': sum(s['bytes'] for s in structures.values()),
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    def sample(self):
+        """Measure and append to the history"""
+        report = self.measure()
+        with self._lock:
+            self.history.append({
+                'timestamp': report['timestamp'],
+                'rss_bytes': report['process']['rss_bytes'],
+                'estimated_bytes': report['estimated_bytes'],
+                'structures': {name: s['bytes'] for name, s in report['structures'].items()},
+                'counts': {name: s['count'] for name, s in report['structures'].items()}
+            })
+        return report
+
+    def growth(self):
+        """Change between the oldest and newest history entries, with per-hour rates"""
+        with self._lock:
+            if len(self.history) < 2:
+                return None
+            first, last = self.history[0], self.history[-1]
+        hours = (datetime.fromisoformat(last['timestamp']) - datetime.fromisoformat(first['timestamp'])).total_seconds() / 3600
+        structures = {}
+        for name, size in last['structures'].items():
+            delta = size - first['structures'].get(name, 0)
+            structures[name] = {
+                'bytes': delta,
+                'count': (last['counts'].get(name) or 0) - (first['counts'].get(name) or 0),
+                'bytes_per_hour': round(delta / hours) if hours else None
+            }
+        rss_delta = (last['rss_bytes'] - first['rss_bytes']) if last['rss_bytes'] and first['rss_bytes'] else None
+        return {
+            'since': first['timestamp'],
+            'samples': len(self.history),
+            'rss_bytes': rss_delta,
+            'rss_bytes_per_hour': round(rss_delta / hours) if rss_delta is not None and hours else None,
+            'structures': structures
+        }
+
+    def start(self):
+        """Sample every MEMORY_SAMPLE_SECONDS in the background (no-op when 0)"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.sample()
+                except Exception:
+                    # One bad sample must not end sampling for the life of the process
+                    logger.exception("Memory sample failed")
+
+        self._thread = threading.Thread(target=run, name='memory-sampler', daemon=True)
+        self._thread.start()
+
+    # -- tracemalloc ---------------------------------------------------
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+
+    def start_tracing(self, frames=1):
+        """Start tracemalloc (if needed) and take the baseline later diffs compare to"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = self._snapshot()
+
+    def stop_tracing(self):
+        self._baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def trace_diff(self, limit=20, group_by='lineno', reset=False):
+        """Top allocation changes since the baseline; None when tracing is off"""
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            return None
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self._baseline, group_by)
+        if reset:
+            self._baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'top': [{
+                'location': str(stat.traceback),
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff,
+                'count': stat.count
+            } for stat in stats[:limit]]
+        }
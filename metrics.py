@@ -0,0 +1,200 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; request and operation latencies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds; lock waits are usually far below a millisecond
+WAIT_BUCKETS = (0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+                                for labels, value in series]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+
+class Histogram(Metric):
+    """Cumulative-bucket latency histogram; ``observe`` is a bisect and three increments"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = self.header()
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total!r}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Metrics plus collectors; collectors are called at scrape time and return Metric objects"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for metric in collector():
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+http_request_seconds = REGISTRY.register(Histogram(
+    'library_http_request_seconds', 'Request latency by route', ('route', 'method', 'status')))
+operation_seconds = REGISTRY.register(Histogram(
+    'library_operation_seconds', 'Library method latency', ('operation',)))
+persist_seconds = REGISTRY.register(Histogram(
+    'library_persist_seconds', 'Time spent writing library state', ('backend',)))
+persist_bytes = REGISTRY.register(Counter(
+    'library_persist_bytes_total', 'Bytes written by JSON saves', ('backend',)))
+persist_last_bytes = REGISTRY.register(Gauge(
+    'library_persist_last_bytes', 'Size of the last JSON save', ('backend',)))
+email_send_seconds = REGISTRY.register(Histogram(
+    'library_email_send_seconds', 'SMTP delivery time per message (connect included when needed)'))
+lock_wait_seconds = REGISTRY.register(Histogram(
+    'library_lock_wait_seconds', 'Time spent waiting to acquire a lock', ('lock',), buckets=WAIT_BUCKETS))
+
+
+def timed_operation(name):
+    """Decorator recording a Library method's latency under ``operation=name``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                operation_seconds.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
+
+class TimedLock:
+    """Wraps a Lock/RLock and records how long each acquire waited"""
+
+    def __init__(self, lock, name):
+        self._lock = lock
+        self.name = name
+
+    def acquire(self, *args, **kwargs):
+        started = time.perf_counter()
+        acquired = self._lock.acquire(*args, **kwargs)
+        lock_wait_seconds.observe(time.perf_counter() - started, self.name)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def cache_metrics(stats):
+    """Metrics for a {cache name: stats dict} mapping with hits/misses and entries (or cached)"""
+    entries = Gauge('library_cache_entries', 'Objects held in a cache', ('cache',))
+    # Built fresh per scrape, so inc() from zero exports the cache's running totals
+    hits = Counter('library_cache_hits_total', 'Cache lookups served from memory', ('cache',))
+    misses = Counter('library_cache_misses_total', 'Cache lookups that had to load or compute', ('cache',))
+    ratio = Gauge('library_cache_hit_ratio', 'hits / (hits + misses) since start', ('cache',))
+    for name, cache in stats.items():
+        entries.set(cache.get('entries', cache.get('cached', 0)), name)
+        hits.inc(cache['hits'], name)
+        misses.inc(cache['misses'], name)
+        lookups = cache['hits'] + cache['misses']
+        ratio.set(cache['hits'] / lookups if lookups else 0.0, name)
+    return [entries, hits, misses, ratio]
@@ -1,34 +1,288 @@
 # migrate_json_to_mongo.py
+"""Copy library_data.json into MongoDB.
+
+The input is read as a stream, one book/user/record at a time, so the whole
+file never has to fit in memory. Documents are written in bulk_write batches
+of upserts keyed on each collection's natural id (book_id, user_id,
+record_id, ...), so rerunning the migration updates documents in place
+instead of duplicating them. Progress is checkpointed after every batch and an
+interrupted run picks up where it stopped.
+
+    python migrate_json_to_mongo.py                                  # MONGO_URI / MONGO_DB from .env
+    python migrate_json_to_mongo.py --uri mongodb://localhost:27017 --db library_db
+    python migrate_json_to_mongo.py --workers 4 --batch-size 2000    # parallel batches
+    python migrate_json_to_mongo.py --restart                        # ignore the checkpoint
+"""
+import argparse
 import json
-from bson import ObjectId
-from db import books_col, users_col, borrow_col
-
-with open('library_data.json', 'r') as f:
-    data = json.load(f)
-
-# Insert books
-for book_id, b in data.get('books', {}).items():
-    doc = b.copy()
-    # Keep the original book_id as a string field for compatibility with app
-    doc['book_id'] = str(book_id)
-    # Remove any Mongo-specific _id if present
-    doc.pop('_id', None)
-    books_col.insert_one(doc)
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+from library import BorrowRecord
+
+load_dotenv()
+
+
+# Top-level section of the JSON file -> (collection name, fields identifying a document)
+SECTIONS = {
+    'books': ('books', ('book_id',)),
+    'users': ('users', ('user_id',)),
+    'borrow_records': ('borrow_records', ('record_id',)),
+    'outbox': ('outbox', ('message_id',)),
+    'notification_ledger': ('notification_ledger', ('record_id', 'kind')),
+    'holds': ('holds', ('hold_id',)),
+    'analytics': ('analytics_daily', ('date',)),
+}
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+class JSONStream:
+    """Pull-parser over a JSON file that decodes one value at a time"""
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON input, found {self.peek()!r}")
+        self.pos += 1
+
+    def skip(self, char):
+        """Consume ``char`` if it is next; returns whether it was"""
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number that ends the buffer may continue in the next chunk
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_sections(path):
+    """Yield (section, key, value) for every entry of the top-level object.
+
+    Object sections yield their key/value pairs, list sections their index and
+    items; anything else is yielded whole with key None.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = JSONStream(f)
+        stream.expect('{')
+        if stream.skip('}'):
+            return
+        while True:
+            section = stream.value()
+            stream.expect(':')
+            if stream.skip('{'):
+                if not stream.skip('}'):
+                    while True:
+                        key = stream.value()
+                        stream.expect(':')
+                        yield section, key, stream.value()
+                        if not stream.skip(','):
+                            break
+                    stream.expect('}')
+            elif stream.skip('['):
+                if not stream.skip(']'):
+                    index = 0
+                    while True:
+                        yield section, index, stream.value()
+                        index += 1
+                        if not stream.skip(','):
+                            break
+                    stream.expect(']')
+            else:
+                yield section, None, stream.value()
+            if not stream.skip(','):
+                break
+        stream.expect('}')
 
-# Insert users
-for user_id, u in data.get('users', {}).items():
-    doc = u.copy()
-    doc['user_id'] = str(user_id)
+
+def prepare(section, key, doc):
+    """Normalize one entry into the document shape the app reads from Mongo"""
+    doc = dict(doc)
     doc.pop('_id', None)
-    users_col.insert_one(doc)
-
-# Insert borrow_records
-for r in data.get('borrow_records', []):
-    rec = r.copy()
-    # Ensure user_id and book_id are strings to match above
-    rec['user_id'] = str(rec.get('user_id'))
-    rec['book_id'] = str(rec.get('book_id'))
-    rec.pop('_id', None)
-    borrow_col.insert_one(rec)
-
-print("Migration complete")
\ No newline at end of file
+    if section == 'books':
+        doc['book_id'] = str(key)
+    elif section == 'users':
+        doc['user_id'] = str(key)
+    elif section == 'borrow_records':
+        doc['user_id'] = str(doc.get('user_id'))
+        doc['book_id'] = str(doc.get('book_id'))
+        # Records saved before ids existed get the same stable id the app derives
+        # (``key`` is the record's position in the list)
+        doc['record_id'] = doc.get('record_id') or BorrowRecord.legacy_id(doc, key)
+    return doc
+
+
+class Checkpoint:
+    """Per-section count of entries written, persisted after every batch.
+
+    Batches can finish out of order when running in parallel, so the saved
+    count only advances over a contiguous run of finished batches.
+    """
+
+    def __init__(self, path, source, restart=False):
+        self.path = path
+        stat = os.stat(source)
+        self.source = {'path': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime}
+        self.done = {}
+        self._finished = {}
+        self._lock = threading.Lock()
+        if not restart and os.path.exists(path):
+            with open(path, 'r') as f:
+                saved = json.load(f)
+            if saved.get('source') == self.source:
+                self.done = saved.get('done', {})
+            else:
+                print(f"Checkpoint {path} is for a different input file, starting over")
+
+    def finished(self, section, start, count):
+        with self._lock:
+            pending = self._finished.setdefault(section, {})
+            pending[start] = count
+            done = self.done.get(section, 0)
+            while done in pending:
+                done += pending.pop(done)
+            self.done[section] = done
+            self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'source': self.source, 'done': self.done}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def migrate(args):
+    client = MongoClient(args.uri)
+    db = client[args.db]
+    checkpoint = Checkpoint(args.checkpoint, args.input, restart=args.restart)
+    if checkpoint.done:
+        print(f"Resuming from checkpoint: {checkpoint.done}")
+
+    written = {}
+    started = time.perf_counter()
+    last_report = [started]
+    report_lock = threading.Lock()
+
+    def write(section, start, docs):
+        collection_name, key_fields = SECTIONS[section]
+        requests = [UpdateOne({field: doc[field] for field in key_fields}, {'$set': doc}, upsert=True)
+                    for doc in docs]
+        db[collection_name].bulk_write(requests, ordered=args.ordered)
+        checkpoint.finished(section, start, len(docs))
+        with report_lock:
+            written[section] = written.get(section, 0) + len(docs)
+            now = time.perf_counter()
+            if now - last_report[0] >= args.report_every:
+                last_report[0] = now
+                total = sum(written.values())
+                print(f"  {total} rows written, {total / (now - started):.0f} rows/sec")
+
+    executor = ThreadPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    in_flight = set()
+
+    def submit(section, start, docs):
+        if executor is None:
+            write(section, start, docs)
+            return
+        # Bound memory: never more than two batches queued per worker
+        while len(in_flight) >= args.workers * 2:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                in_flight.discard(future)
+                future.result()
+        in_flight.add(executor.submit(write, section, start, docs))
+
+    skipped = {}
+    batch, batch_section, batch_start, position = [], None, 0, {}
+    try:
+        for section, key, value in iter_sections(args.input):
+            if section not in SECTIONS:
+                continue
+            index = position.get(section, 0)
+            position[section] = index + 1
+            if index < checkpoint.done.get(section, 0):
+                skipped[section] = skipped.get(section, 0) + 1
+                continue
+            if batch and (section != batch_section or len(batch) >= args.batch_size):
+                submit(batch_section, batch_start, batch)
+                batch = []
+            if not batch:
+                batch_section, batch_start = section, index
+            batch.append(prepare(section, key, value))
+        if batch:
+            submit(batch_section, batch_start, batch)
+        for future in list(in_flight):
+            future.result()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    elapsed = time.perf_counter() - started
+    total = sum(written.values())
+    for section, count in written.items():
+        print(f"{section}: {count} upserted" + (f" ({skipped[section]} already done)" if section in skipped else ""))
+    print(f"Migration complete: {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/sec)")
+    checkpoint.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream library_data.json into MongoDB with batched upserts")
+    parser.add_argument('--input', default='library_data.json')
+    parser.add_argument('--uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default=os.getenv('MONGO_DB', 'library_db'))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=1, help="parallel batch writers")
+    parser.add_argument('--ordered', action='store_true', help="stop each batch at the first write error")
+    parser.add_argument('--checkpoint', default='migrate_checkpoint.json')
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    parser.add_argument('--report-every', type=float, default=5.0, help="seconds between progress lines")
+    migrate(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
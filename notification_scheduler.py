@@ -0,0 +1,194 @@
+"""Standalone notification scheduler.
+
+Runs overdue/reminder sweeps on a cron-like schedule without anyone opening
+/admin/send-notifications. Each run remembers a watermark (the date it ran
+for) and the next run only looks at loans whose due state changed since then,
+using the library's due-date index rather than scanning every borrow record.
+Each run also accrues fines, expires uncollected holds and archives settled
+loans older than ARCHIVE_AFTER_DAYS.
+
+The web app runs the schedule in-process against its live library
+(NOTIFY_IN_PROCESS, on by default), so sweeps and requests share one copy of
+the data. The standalone CLI loads a library of its own and is only safe
+where every write is a targeted database update, i.e. lazy Mongo mode
+(MONGO_LAZY=true); on the JSON backend or an eager Mongo load its saves would
+overwrite the web app's, so it refuses to run there.
+
+    python notification_scheduler.py --cron "0 8 * * *"     # every day at 08:00
+    python notification_scheduler.py --once                 # single run, e.g. from system cron
+    python notification_scheduler.py --once --full          # ignore the watermark
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from library import Library
+from log_config import log_duration, setup_logging
+
+logger = logging.getLogger('notification_scheduler')
+
+
+STATE_FILE = os.getenv('NOTIFY_STATE_FILE', 'notification_scheduler.json')
+
+
+def _parse_field(field, low, high):
+    """Expand one cron field ('*', '*/5', '1-5', '1,15', '10-40/10') to a set of ints"""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(x) for x in part.split('-', 1))
+        else:
+            start = end = int(part)
+        if start < low or end > high:
+            raise ValueError(f"Cron field '{field}' out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Minimal five-field cron expression: minute hour day-of-month month day-of-week"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression needs 5 fields: minute hour day month weekday")
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        # cron counts Sunday as 0 (and 7); Python's weekday() has Monday as 0
+        self.weekdays = {(d - 1) % 7 for d in _parse_field(fields[4], 0, 7)}
+
+    def matches(self, moment):
+        return (moment.minute in self.minutes and moment.hour in self.hours and
+                moment.day in self.days and moment.month in self.months and
+                moment.weekday() in self.weekdays)
+
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366)
+        while candidate < limit:
+            if self.matches(candidate):
+                return candidate
+            candidate += timedelta(minutes=1)
+        raise ValueError("Cron expression never fires")
+
+
+def load_state():
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state):
+    with open(STATE_FILE, 'w') as f:
+        json.dump(state, f, indent=4)
+
+
+def standalone_library():
+    """A library for the CLI; exits unless every write goes straight to the database"""
+    library = Library()
+    if not library.lazy:
+        sys.exit("The standalone scheduler needs lazy Mongo mode (MONGO_LAZY=true): on the JSON "
+                 "backend or an eager Mongo load its saves would overwrite the web app's. "
+                 "Let the web app run the schedule instead (NOTIFY_IN_PROCESS=true).")
+    return library
+
+
+def run_once(library, full=False, digest=None):
+    """One sweep from the stored watermark; returns the sweep results"""
+    state = load_state()
+    watermark = None if full else state.get('watermark')
+    today = datetime.now().date()
+
+    with log_duration(logger, "Scheduled sweep finished", watermark=watermark) as fields:
+        # Nightly accrual first so overdue notices quote today's fines
+        library.accrue_fines(today)
+        library.expire_holds()
+        if watermark:
+            results = library.incremental_notification_sweep(watermark, today=today, digest=digest)
+        else:
+            results = library.check_and_send_overdue_notifications(digest=digest)
+        results['archived'] = library.archive_settled_records()
+        fields.update(results)
+    results['duration_ms'] = fields['duration_ms']
+
+    state.update({
+        'watermark': today.isoformat(),
+        'last_run': datetime.now().isoformat(),
+        'last_result': results
+    })
+    save_state(state)
+    return results
+
+
+class SweepScheduler:
+    """Runs the sweep on a cron schedule in a daemon thread of the web app"""
+
+    def __init__(self, library, expression, full=False, digest=None):
+        self.library = library
+        self.schedule = CronSchedule(expression)
+        self.expression = expression
+        self.full = full
+        self.digest = digest
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='notification-scheduler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        logger.info("Notification scheduler running in-process", extra={'schedule': self.expression})
+        while True:
+            next_run = self.schedule.next_after(datetime.now())
+            time.sleep(max(0, (next_run - datetime.now()).total_seconds()))
+            try:
+                run_once(self.library, full=self.full, digest=self.digest)
+            except Exception:
+                logger.exception("Scheduled sweep failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run library notification sweeps on a schedule")
+    parser.add_argument('--cron', default=os.getenv('NOTIFY_CRON', '0 8 * * *'),
+                        help="five-field cron expression (default: daily at 08:00)")
+    parser.add_argument('--once', action='store_true', help="run a single sweep and exit")
+    parser.add_argument('--full', action='store_true', help="ignore the watermark and sweep every loan")
+    parser.add_argument('--no-digest', action='store_true', help="one email per loan instead of per user")
+    args = parser.parse_args()
+    setup_logging()
+    digest = False if args.no_digest else None
+
+    if args.once:
+        run_once(standalone_library(), full=args.full, digest=digest)
+        return
+
+    schedule = CronSchedule(args.cron)
+    standalone_library()
+    logger.info("Notification scheduler running", extra={'schedule': args.cron})
+    while True:
+        next_run = schedule.next_after(datetime.now())
+        logger.info("Next sweep scheduled", extra={'at': next_run.isoformat()})
+        time.sleep(max(0, (next_run - datetime.now()).total_seconds()))
+        try:
+            # Fresh load each run so holds and ledger changes made by the web app are picked up
+            run_once(standalone_library(), full=args.full, digest=digest)
+        except Exception:
+            logger.exception("Scheduled sweep failed")
+
+
+if __name__ == '__main__':
+    main()
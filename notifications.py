@@ -0,0 +1,207 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+
+# One email to send: ``send(*args)`` delivers it (args[0] is the recipient),
+# ``counts`` splits it into notices (a digest covers several loans) and
+# ``on_sent`` runs after a successful send.
+Message = namedtuple('Message', ['kind', 'send', 'args', 'counts', 'on_sent'], defaults=(None, None))
+
+
+class RateLimiter:
+    """Token bucket: ``rate`` messages per second with bursts of up to ``burst``"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def parse_rate_limits(spec):
+    """Parse 'smtp.gmail.com=1.5,smtp.sendgrid.net=50' into {host: rate}"""
+    limits = {}
+    for part in (spec or '').split(','):
+        if '=' in part:
+            host, rate = part.split('=', 1)
+            limits[host.strip()] = float(rate)
+    return limits
+
+
+class NotificationJob:
+    """Progress and per-message results of one notification sweep"""
+
+    def __init__(self):
+        self.job_id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.messages_sent = 0
+        self.sent = {}
+        self.results = []
+        self.error = None
+        self.summary = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self, total):
+        with self._lock:
+            self.status = 'running'
+            self.total += total
+
+    def record(self, kind, recipient, success, error, seconds, counts=None):
+        """``counts`` splits one message into notices, e.g. a digest covering several loans"""
+        with self._lock:
+            self.completed += 1
+            if success:
+                self.messages_sent += 1
+                for notice_kind, count in (counts or {kind: 1}).items():
+                    self.sent[notice_kind] = self.sent.get(notice_kind, 0) + count
+            else:
+                self.failed += 1
+            self.results.append({
+                'kind': kind,
+                'to': recipient,
+                'success': success,
+                'error': error,
+                'seconds': round(seconds, 4)
+            })
+
+    def finish(self, summary=None, error=None):
+        with self._lock:
+            self.summary = summary
+            self.error = error
+            self.status = 'failed' if error else 'done'
+            self.finished_at = datetime.now().isoformat()
+
+    def to_dict(self, include_results=False):
+        with self._lock:
+            data = {
+                'job_id': self.job_id,
+                'status': self.status,
+                'total': self.total,
+                'completed': self.completed,
+                'failed': self.failed,
+                'messages_sent': self.messages_sent,
+                'sent': dict(self.sent),
+                'summary': self.summary,
+                'error': self.error,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at
+            }
+            if include_results:
+                data['results'] = list(self.results)
+        return data
+
+
+class NotificationDispatcher:
+    """Sends notification emails from a bounded pool of worker threads.
+
+    Every worker keeps its own pooled SMTP session, all workers share the rate
+    limiter of the provider they send through, and the hand-off queue is
+    bounded so producers block (backpressure) instead of buffering a whole
+    sweep in memory. Background jobs are tracked by id for progress polling.
+    """
+
+    def __init__(self, email_service):
+        self.email_service = email_service
+        self.workers = int(os.getenv('NOTIFICATION_WORKERS', '4'))
+        self.max_pending = int(os.getenv('NOTIFICATION_MAX_PENDING', '100'))
+        self.default_rate = float(os.getenv('EMAIL_RATE_LIMIT', '5'))
+        self.provider_rates = parse_rate_limits(os.getenv('EMAIL_RATE_LIMITS', ''))
+        self.max_jobs = 50
+        self.jobs = OrderedDict()
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter_for(self, provider):
+        with self._lock:
+            limiter = self._limiters.get(provider)
+            if limiter is None:
+                rate = self.provider_rates.get(provider, self.default_rate)
+                limiter = self._limiters[provider] = RateLimiter(rate)
+            return limiter
+
+    def dispatch(self, messages, job=None):
+        """Send Message tuples concurrently and record each outcome on the job"""
+        job = job or NotificationJob()
+        messages = list(messages)
+        job.start(len(messages))
+        if not messages:
+            return job
+
+        limiter = self.limiter_for(self.email_service.host)
+        work = queue.Queue(maxsize=max(1, self.max_pending))
+
+        def worker():
+            with self.email_service.session():
+                while True:
+                    item = work.get()
+                    if item is None:
+                        return
+                    message = Message(*item)
+                    limiter.acquire()
+                    started = time.perf_counter()
+                    error = None
+                    try:
+                        success = bool(message.send(*message.args))
+                        if success and message.on_sent:
+                            message.on_sent()
+                    except Exception as e:
+                        success, error = False, str(e)
+                    job.record(message.kind, message.args[0], success, error,
+                               time.perf_counter() - started, message.counts)
+
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(max(1, min(self.workers, len(messages))))]
+        for thread in threads:
+            thread.start()
+        for message in messages:
+            work.put(message)
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        return job
+
+    def submit(self, func):
+        """Run ``func(job)`` in the background and return the job immediately"""
+        job = NotificationJob()
+        with self._lock:
+            self.jobs[job.job_id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+
+        def run():
+            try:
+                job.finish(summary=func(job))
+            except Exception as e:
+                job.finish(error=str(e))
+
+        threading.Thread(target=run, daemon=True).start()
+        return job
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
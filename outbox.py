@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmailOutbox:
+    """Durable queue of outgoing emails, drained by a background sender.
+
+    Mutations enqueue a message and return immediately; the sender thread
+    delivers due messages with exponential backoff between attempts and moves
+    messages that keep failing to a dead-letter state for inspection. In JSON
+    mode the entries live in their own small file at ``path``, rewritten once
+    per enqueue and once per drain pass, so sending mail never rewrites the
+    library data file; in Mongo mode each entry is a document in
+    ``collection`` and is claimed with a lease so several web workers can
+    drain the same outbox.
+    """
+
+    # Message kinds and the EmailService method that delivers them
+    SENDERS = {
+        'return_confirmation': 'send_return_confirmation',
+        'hold_ready': 'send_hold_ready_notification',
+    }
+
+    def __init__(self, email_service, collection=None, path=None):
+        self.email_service = email_service
+        self.collection = collection
+        self.path = path
+        self.max_attempts = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+        self.backoff_seconds = float(os.getenv('OUTBOX_BACKOFF_SECONDS', '30'))
+        self.max_backoff_seconds = float(os.getenv('OUTBOX_MAX_BACKOFF_SECONDS', '3600'))
+        self.poll_seconds = float(os.getenv('OUTBOX_POLL_SECONDS', '5'))
+        self.lease_seconds = 300
+        self.entries = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    # -- persistence ---------------------------------------------------
+
+    def load(self, entries):
+        with self._lock:
+            self.entries = [dict(e) for e in entries]
+
+    def to_list(self):
+        with self._lock:
+            return [dict(e) for e in self.entries]
+
+    def read_file(self):
+        """Entries stored at ``path``, or None when there is no outbox file yet"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self):
+        """Rewrite the outbox file (JSON mode; Mongo entries are written as they change)"""
+        if self.collection is not None or not self.path:
+            return
+        with self._write_lock:
+            entries = self.to_list()
+            # Write then rename so a crash mid-write never leaves a truncated outbox
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp, self.path)
+
+    # -- producer side -------------------------------------------------
+
+    def enqueue(self, kind, **kwargs):
+        """Queue a message for delivery; never touches the mail server"""
+        if kind not in self.SENDERS:
+            raise ValueError(f"Unknown outbox message kind: {kind}")
+        now = datetime.now().isoformat()
+        entry = {
+            'message_id': uuid.uuid4().hex,
+            'kind': kind,
+            'args': kwargs,
+            'status': 'pending',
+            'attempts': 0,
+            'next_attempt': now,
+            'last_error': None,
+            'created_at': now
+        }
+        if self.collection is not None:
+            self.collection.insert_one(dict(entry))
+        else:
+            with self._lock:
+                self.entries.append(entry)
+            self.save()
+        self._wakeup.set()
+        return entry['message_id']
+
+    # -- sender side ---------------------------------------------------
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.drain()
+            except Exception:
+                logger.exception("Outbox drain failed")
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def _claim_due(self, now):
+        if self.collection is not None:
+            claimed = []
+            lease = (now + timedelta(seconds=self.lease_seconds)).isoformat()
+            query = {'$or': [
+                {'status': 'pending', 'next_attempt': {'$lte': now.isoformat()}},
+                {'status': 'sending', 'lease_until': {'$lte': now.isoformat()}}
+            ]}
+            while True:
+                doc = self.collection.find_one_and_update(query, {'$set': {'status': 'sending', 'lease_until': lease}})
+                if not doc:
+                    return claimed
+                doc.pop('_id', None)
+                claimed.append(doc)
+
+        with self._lock:
+            return [e for e in self.entries
+                    if e['status'] == 'pending' and e['next_attempt'] <= now.isoformat()]
+
+    def _deliver(self, entry):
+        sender = getattr(self.email_service, self.SENDERS[entry['kind']])
+        try:
+            if sender(**entry['args']):
+                return None
+            return 'send failed'
+        except Exception as e:
+            return str(e)
+
+    def _backoff(self, attempts):
+        return min(self.max_backoff_seconds, self.backoff_seconds * (2 ** (attempts - 1)))
+
+    def drain(self):
+        """Deliver every due message once; returns the number delivered"""
+        now = datetime.now()
+        due = self._claim_due(now)
+        if not due:
+            return 0
+
+        delivered = 0
+        with self.email_service.session():
+            for entry in due:
+                error = self._deliver(entry)
+                if error is None:
+                    delivered += 1
+                    self._settle(entry, sent=True)
+                    continue
+                entry['attempts'] += 1
+                entry['last_error'] = error
+                if entry['attempts'] >= self.max_attempts:
+                    entry['status'] = 'dead'
+                    logger.error("Outbox message dead-lettered", extra={
+                        'message_id': entry['message_id'], 'kind': entry['kind'],
+                        'attempts': entry['attempts'], 'error': error
+                    })
+                else:
+                    entry['status'] = 'pending'
+                    entry['next_attempt'] = (datetime.now() + timedelta(seconds=self._backoff(entry['attempts']))).isoformat()
+                self._settle(entry, sent=False)
+
+        self.save()
+        logger.info("Outbox drained", extra={'due': len(due), 'delivered': delivered})
+        return delivered
+
+    def _settle(self, entry, sent):
+        if self.collection is not None:
+            if sent:
+                self.collection.delete_one({'message_id': entry['message_id']})
+            else:
+                self.collection.update_one({'message_id': entry['message_id']}, {
+                    '$set': {k: entry[k] for k in ('status', 'attempts', 'next_attempt', 'last_error')},
+                    '$unset': {'lease_until': ''}
+                })
+            return
+        if sent:
+            with self._lock:
+                self.entries = [e for e in self.entries if e['message_id'] != entry['message_id']]
+
+    # -- inspection ----------------------------------------------------
+
+    def stats(self):
+        if self.collection is not None:
+            counts = {s: self.collection.count_documents({'status': s}) for s in ('pending', 'sending', 'dead')}
+        else:
+            counts = {'pending': 0, 'sending': 0, 'dead': 0}
+            with self._lock:
+                for e in self.entries:
+                    counts[e['status']] = counts.get(e['status'], 0) + 1
+        return counts
+
+    def dead_letters(self, limit=100):
+        if self.collection is not None:
+            return [{k: v for k, v in doc.items() if k != '_id'}
+                    for doc in self.collection.find({'status': 'dead'}).limit(limit)]
+        with self._lock:
+            return [dict(e) for e in self.entries if e['status'] == 'dead'][:limit]
+
+    def retry_dead(self):
+        """Give dead-lettered messages a fresh set of attempts"""
+        reset = {'status': 'pending', 'attempts': 0, 'next_attempt': datetime.now().isoformat()}
+        if self.collection is not None:
+            count = self.collection.update_many({'status': 'dead'}, {'$set': reset}).modified_count
+        else:
+            count = 0
+            with self._lock:
+                for e in self.entries:
+                    if e['status'] == 'dead':
+                        e.update(reset)
+                        count += 1
+            self.save()
+        self._wakeup.set()
+        return count
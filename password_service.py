@@ -0,0 +1,80 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when the hashing pool is saturated or a hash did not finish in time"""
+
+
+class PasswordService:
+    """Runs password hashing/verification in a bounded process pool.
+
+    The KDF is deliberately CPU-heavy, so running it inline in request threads
+    lets a handful of concurrent logins hold the GIL and starve every other
+    request. Work is handed to a small process pool instead; callers beyond
+    ``queue_limit`` in-flight jobs are rejected immediately rather than piling up.
+    """
+
+    def __init__(self):
+        self.method = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2')
+        self.workers = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+        self.queue_limit = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', '32'))
+        self.timeout = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, self.queue_limit))
+        self._method_prefix = None
+
+    def _get_pool(self):
+        # Created lazily so forking servers (gunicorn) build the pool per worker
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise PasswordServiceBusy("Too many password operations in progress")
+        try:
+            future = self._get_pool().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordServiceBusy("Password operation timed out")
+
+    def hash_password(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify_password(self, password_hash, password):
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was produced with different work-factor parameters"""
+        if not password_hash:
+            return False
+        if self._method_prefix is None:
+            # Resolve defaults (e.g. 'pbkdf2' -> 'pbkdf2:sha256:600000') once
+            self._method_prefix = generate_password_hash('', self.method, salt_length=1).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+password_service = PasswordService()
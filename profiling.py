@@ -0,0 +1,199 @@
+"""Opt-in profiling of single requests.
+
+With PROFILE_ENABLED=true, a request carrying a valid token in the
+``X-Profile`` header or the ``_profile`` query parameter runs under cProfile.
+The stats are written to PROFILE_DIR next to a JSON file with the route,
+status and timing, and the newest PROFILE_KEEP profiles are kept. A token is
+signed with PROFILE_SECRET and is valid for one path until it expires, so a
+leaked link cannot be used to profile other pages. Profiling stays off when
+PROFILE_SECRET is unset, since tokens must not be signed with a guessable
+default key. Mint one with:
+
+    python profiling.py /dashboard/student --ttl 3600
+
+When profiling is disabled the middleware is not installed at all, so other
+requests pay nothing.
+"""
+import argparse
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = '_profile'
+
+
+class RequestProfiler:
+    """Signed-token checks and on-disk storage for request profiles"""
+
+    def __init__(self):
+        self.enabled = os.getenv('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes', 'on')
+        secret = os.getenv('PROFILE_SECRET')
+        self.secret = secret.encode() if secret else None
+        if self.enabled and self.secret is None:
+            logger.error("PROFILE_ENABLED is set without PROFILE_SECRET; request profiling stays off")
+            self.enabled = False
+        self.directory = os.getenv('PROFILE_DIR', 'profiles')
+        self.keep = int(os.getenv('PROFILE_KEEP', '50'))
+        # cProfile cannot profile two requests at once in one process
+        self._lock = threading.Lock()
+
+    def _signature(self, path, expires):
+        return hmac.new(self.secret, f'{expires}:{path}'.encode(), hashlib.sha256).hexdigest()
+
+    def make_token(self, path, ttl=3600):
+        expires = int(time.time()) + ttl
+        return f'{expires}.{self._signature(path, expires)}'
+
+    def verify(self, token, path):
+        expires, _, signature = (token or '').partition('.')
+        if not expires.isdigit() or int(expires) < time.time():
+            return False
+        return hmac.compare_digest(signature, self._signature(path, int(expires)))
+
+    def token_from(self, environ):
+        token = environ.get(HEADER)
+        if token is None and QUERY_PARAM in environ.get('QUERY_STRING', ''):
+            token = parse_qs(environ['QUERY_STRING']).get(QUERY_PARAM, [None])[0]
+        return token
+
+    def save(self, profile, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, meta['profile_id'])
+        profile.dump_stats(base + '.prof')
+        with open(base + '.json', 'w') as f:
+            json.dump(meta, f)
+        self._prune()
+
+    def _prune(self):
+        metas = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        for name in metas[:-self.keep] if self.keep else []:
+            for ext in ('.json', '.prof'):
+                path = os.path.join(self.directory, name[:-5] + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def recent(self, limit=50):
+        """Metadata of stored profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted((n for n in os.listdir(self.directory) if n.endswith('.json')), reverse=True)
+        profiles = []
+        for name in names[:limit]:
+            with open(os.path.join(self.directory, name)) as f:
+                profiles.append(json.load(f))
+        return profiles
+
+    def path_for(self, profile_id):
+        # Ids are generated here; anything else (e.g. '../') is rejected
+        if not all(c.isalnum() or c in '-_' for c in profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + '.prof')
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=60):
+        """pstats text of a stored profile, or None"""
+        path = self.path_for(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """WSGI middleware that profiles requests carrying a valid token"""
+
+    def __init__(self, wsgi_app, profiler, url_map=None):
+        self.wsgi_app = wsgi_app
+        self.profiler = profiler
+        self.url_map = url_map
+
+    def _route(self, environ):
+        if self.url_map is None:
+            return None
+        try:
+            rule, _ = self.url_map.bind_to_environ(environ).match(return_rule=True)
+            return rule.rule
+        except Exception:
+            return None
+
+    def __call__(self, environ, start_response):
+        token = self.profiler.token_from(environ)
+        if token is None or not self.profiler.verify(token, environ.get('PATH_INFO', '')):
+            return self.wsgi_app(environ, start_response)
+        if not self.profiler._lock.acquire(blocking=False):
+            # Another request is being profiled; serve this one normally
+            return self.wsgi_app(environ, start_response)
+
+        status = []
+
+        def capture(status_line, headers, exc_info=None):
+            status.append(status_line)
+            return start_response(status_line, headers, exc_info)
+
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profile.enable()
+            try:
+                # Drain the body inside the profiler so streamed work is included
+                body = self.wsgi_app(environ, capture)
+                try:
+                    chunks = list(body)
+                finally:
+                    if hasattr(body, 'close'):
+                        body.close()
+            finally:
+                profile.disable()
+            duration = time.perf_counter() - started
+            now = datetime.now()
+            self.profiler.save(profile, {
+                'profile_id': now.strftime('%Y%m%d%H%M%S%f') + '-' + uuid.uuid4().hex[:8],
+                'timestamp': now.isoformat(timespec='seconds'),
+                'method': environ.get('REQUEST_METHOD'),
+                'path': environ.get('PATH_INFO'),
+                'route': self._route(environ),
+                'status': int(status[0].split()[0]) if status else None,
+                'duration_ms': round(duration * 1000, 2),
+                'calls': pstats.Stats(profile).total_calls
+            })
+        finally:
+            self.profiler._lock.release()
+        return chunks
+
+
+profiler = RequestProfiler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mint a token that profiles requests to one path")
+    parser.add_argument('path', help="request path, e.g. /dashboard/student")
+    parser.add_argument('--ttl', type=int, default=3600, help="seconds the token stays valid")
+    args = parser.parse_args()
+    if profiler.secret is None:
+        sys.exit("PROFILE_SECRET is not set; the web app only accepts tokens signed with it")
+    token = profiler.make_token(args.path, args.ttl)
+    print(f"X-Profile: {token}")
+    print(f"{args.path}?{QUERY_PARAM}={token}")
+
+
+if __name__ == '__main__':
+    main()
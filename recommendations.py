@@ -0,0 +1,159 @@
+import heapq
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+
+
+class CoBorrowRecommender:
+    """Co-borrowing recommendations ("readers who borrowed this also borrowed").
+
+    Two books co-occur once for every user who borrowed both. The matrix is a
+    dict of dicts holding only non-zero cells and is updated in place as loans
+    are added, touching one row per book already in that user's history
+    (capped at ``max_user_books`` most recent titles so heavy readers stay
+    cheap). Top-K neighbor lists are served from an LRU cache bounded by an
+    approximate memory budget; rows that change are evicted from it.
+    """
+
+    def __init__(self):
+        self.top_k = int(os.getenv('RECOMMEND_TOP_K', '10'))
+        self.max_user_books = int(os.getenv('RECOMMEND_MAX_USER_BOOKS', '200'))
+        self.cache_budget = int(float(os.getenv('RECOMMEND_CACHE_MB', '16')) * 1024 * 1024)
+        # Most borrowed titles whose neighbor lists are precomputed after a build
+        self.warm_titles = int(os.getenv('RECOMMEND_WARM_TITLES', '1000'))
+        self.built = False
+        self.matrix = {}
+        # Non-zero cells in the matrix, kept current so stats() stays O(1)
+        self.cells = 0
+        self.user_books = {}
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def rebuild(self, loans):
+        """Build from (user_id, book_id) pairs in borrow order"""
+        with self._lock:
+            histories = {}
+            for user_id, book_id in loans:
+                history = histories.setdefault(user_id, {})
+                # Re-borrowing moves the title to the most recent end
+                history.pop(book_id, None)
+                history[book_id] = None
+
+            # Counter.update counts a whole history per call in C, which is
+            # much faster than incrementing one pair at a time
+            matrix = {}
+            self.user_books = {}
+            for user_id, history in histories.items():
+                books = list(history)[-self.max_user_books:]
+                self.user_books[user_id] = dict.fromkeys(books)
+                if len(books) < 2:
+                    continue
+                for book_id in books:
+                    row = matrix.get(book_id)
+                    if row is None:
+                        row = matrix[book_id] = Counter()
+                    row.update(books)
+            cells = 0
+            for book_id, row in matrix.items():
+                del row[book_id]
+                cells += len(row)
+            self.matrix = matrix
+            self.cells = cells
+            self._cache.clear()
+            self._cache_bytes = 0
+            self.built = True
+
+    def add_loan(self, user_id, book_id):
+        if not self.built:
+            return
+        with self._lock:
+            history = self.user_books.setdefault(user_id, {})
+            if book_id in history:
+                return
+            row = self.matrix.setdefault(book_id, {})
+            for other in history:
+                if other not in row:
+                    self.cells += 1
+                row[other] = row.get(other, 0) + 1
+                other_row = self.matrix.setdefault(other, {})
+                if book_id not in other_row:
+                    self.cells += 1
+                other_row[book_id] = other_row.get(book_id, 0) + 1
+                self._evict(other)
+            self._evict(book_id)
+            history[book_id] = None
+            if len(history) > self.max_user_books:
+                # Oldest title leaves the window; its existing counts stay
+                del history[next(iter(history))]
+
+    def remove_book(self, book_id):
+        with self._lock:
+            row = self.matrix.pop(book_id, {})
+            self.cells -= len(row)
+            for other in row:
+                if self.matrix.get(other, {}).pop(book_id, None) is not None:
+                    self.cells -= 1
+                self._evict(other)
+            self._evict(book_id)
+            for history in self.user_books.values():
+                history.pop(book_id, None)
+
+    def history(self, user_id):
+        """The user's borrowed titles considered for co-occurrence, oldest first"""
+        with self._lock:
+            return list(self.user_books.get(user_id, ()))
+
+    # -- cache ---------------------------------------------------------
+
+    @staticmethod
+    def _size(neighbors):
+        return sys.getsizeof(neighbors) + sum(sys.getsizeof(n) for n in neighbors)
+
+    def _evict(self, book_id):
+        entry = self._cache.pop(book_id, None)
+        if entry is not None:
+            self._cache_bytes -= self._size(entry)
+
+    def _store(self, book_id, neighbors):
+        self._cache[book_id] = neighbors
+        self._cache_bytes += self._size(neighbors)
+        while self._cache_bytes > self.cache_budget and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= self._size(evicted)
+
+    def neighbors(self, book_id, k=None):
+        """[(book_id, co_borrow_count), ...] most co-borrowed first"""
+        k = k or self.top_k
+        with self._lock:
+            cached = self._cache.get(book_id)
+            if cached is not None:
+                self.hits += 1
+                self._cache.move_to_end(book_id)
+                return cached[:k]
+            self.misses += 1
+            row = self.matrix.get(book_id, {})
+            neighbors = heapq.nlargest(self.top_k, row.items(), key=lambda item: (item[1], item[0]))
+            self._store(book_id, neighbors)
+            return neighbors[:k]
+
+    def warm(self, book_ids):
+        """Precompute neighbor lists, e.g. for the most borrowed titles"""
+        for book_id in book_ids:
+            self.neighbors(book_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self.built,
+                'books': len(self.matrix),
+                'cells': self.cells,
+                'cached': len(self._cache),
+                'cache_bytes': self._cache_bytes,
+                'cache_budget': self.cache_budget,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -364,6 +364,52 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Hold placement and cancellation
+    document.querySelectorAll('.place-hold').forEach(button => {
+        button.addEventListener('click', function() {
+            const formData = new FormData();
+            formData.append('book_id', this.getAttribute('data-book-id'));
+            
+            fetch('/holds', {
+                method: 'POST',
+                body: formData
+            })
+            .then(response => response.json())
+            .then(data => {
+                showAlert(data.message, data.success ? 'success' : 'danger');
+                if (data.success) {
+                    this.disabled = true;
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                showAlert('Error placing hold!', 'danger');
+            });
+        });
+    });
+
+    document.querySelectorAll('.cancel-hold').forEach(button => {
+        button.addEventListener('click', function() {
+            if (!confirm('Cancel this hold?')) {
+                return;
+            }
+            fetch(`/holds/${this.getAttribute('data-hold-id')}/cancel`, {
+                method: 'POST'
+            })
+            .then(response => response.json())
+            .then(data => {
+                showAlert(data.message, data.success ? 'success' : 'danger');
+                if (data.success) {
+                    this.closest('li').remove();
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                showAlert('Error cancelling hold!', 'danger');
+            });
+        });
+    });
+
     // Search functionality with debounce
     const searchInput = document.querySelector('input[name="search"]');
     if (searchInput) {
@@ -378,16 +424,81 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Auto-refresh dashboard every 30 seconds
-    if (window.location.pathname === '/') {
-        setInterval(() => {
-            fetch('/')
-                .then(response => response.text())
-                .then(html => {
-                    console.log('Dashboard auto-refreshed');
-                })
-                .catch(error => console.error('Auto-refresh error:', error));
-        }, 30000);
+    // Live dashboard updates: apply stat/availability deltas pushed over SSE
+    const liveStatElements = document.querySelectorAll('[data-live-stat]');
+    const liveAvailabilityElements = document.querySelectorAll('[data-book-available]');
+    if ((liveStatElements.length || liveAvailabilityElements.length) && window.EventSource) {
+        const HEARTBEAT_TIMEOUT = 45000;  // server pings every 15s
+        let source = null;
+        let watchdog = null;
+        let retryDelay = 1000;
+
+        const applyStats = stats => {
+            liveStatElements.forEach(el => {
+                const key = el.getAttribute('data-live-stat');
+                if (key in stats) {
+                    el.textContent = stats[key];
+                }
+            });
+        };
+
+        const applyAvailability = delta => {
+            document.querySelectorAll(`[data-book-available="${delta.book_id}"]`).forEach(el => {
+                if (delta.deleted) {
+                    const row = el.closest('tr');
+                    if (row) row.remove();
+                    return;
+                }
+                el.textContent = delta.available;
+                el.classList.toggle('bg-success', delta.available > 0);
+                el.classList.toggle('bg-danger', delta.available <= 0);
+            });
+        };
+
+        const resetWatchdog = () => {
+            clearTimeout(watchdog);
+            watchdog = setTimeout(reconnect, HEARTBEAT_TIMEOUT);
+        };
+
+        function reconnect() {
+            clearTimeout(watchdog);
+            if (source) source.close();
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        }
+
+        function connect() {
+            source = new EventSource('/api/events');
+            source.addEventListener('open', () => {
+                retryDelay = 1000;
+                resetWatchdog();
+            });
+            source.addEventListener('ping', resetWatchdog);
+            source.addEventListener('stats', e => {
+                resetWatchdog();
+                applyStats(JSON.parse(e.data));
+            });
+            source.addEventListener('availability', e => {
+                resetWatchdog();
+                applyAvailability(JSON.parse(e.data));
+            });
+            source.addEventListener('resync', () => {
+                resetWatchdog();
+                fetch('/api/stats')
+                    .then(response => response.json())
+                    .then(applyStats)
+                    .catch(error => console.error('Live update resync error:', error));
+            });
+            source.addEventListener('error', () => {
+                // The browser retries on its own while CONNECTING; take over once it gives up
+                if (source.readyState === EventSource.CLOSED) {
+                    reconnect();
+                }
+            });
+        }
+
+        connect();
+        window.addEventListener('beforeunload', () => source && source.close());
     }
 
     // Utility functions